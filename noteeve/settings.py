@@ -54,6 +54,8 @@ INSTALLED_APPS = [
 # --------------------------------------------------
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover the rest of the stack
+    "notes.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -78,7 +80,9 @@ WSGI_APPLICATION = "noteeve.wsgi.application"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates plus render timing for the request metrics
+        "BACKEND": "notes.metrics.TimedDjangoTemplates",
+        "NAME": "django",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -103,6 +107,25 @@ DATABASES = {
     )
 }
 
+# --------------------------------------------------
+# CACHE (Redis when CACHE_URL is set, local memory otherwise)
+# --------------------------------------------------
+
+CACHE_URL = config("CACHE_URL", default="")
+
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+        if CACHE_URL
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    )
+}
+
 # --------------------------------------------------
 # AUTH
 # --------------------------------------------------
@@ -142,9 +165,177 @@ STATICFILES_STORAGE = (
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Generated artifacts (compiled PDFs) go to S3 when a bucket is configured,
+# otherwise to MEDIA_ROOT.
+AWS_STORAGE_BUCKET_NAME = config("AWS_STORAGE_BUCKET_NAME", default="")
+
+STORAGES = {
+    "default": {
+        "BACKEND": (
+            "storages.backends.s3.S3Storage" if AWS_STORAGE_BUCKET_NAME
+            else "django.core.files.storage.FileSystemStorage"
+        ),
+    },
+    # STATICFILES_STORAGE above is ignored since Django 5.1; keep the
+    # storage that is actually in effect.
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+if AWS_STORAGE_BUCKET_NAME:
+    STORAGES["default"]["OPTIONS"] = {
+        "bucket_name": AWS_STORAGE_BUCKET_NAME,
+        "access_key": config("AWS_ACCESS_KEY_ID", default=""),
+        "secret_key": config("AWS_SECRET_ACCESS_KEY", default=""),
+        "default_acl": "private",
+        "querystring_auth": True,
+    }
+
+# Note attachments are stored by content hash (notes.blobs). Uploads are
+# spooled to disk and hashed as they stream in.
+FILE_UPLOAD_HANDLERS = ["notes.blobs.HashingUploadHandler"]
+
+BLOB_STORAGE = {
+    # "" streams through Django; "x-accel-redirect" (nginx) / "x-sendfile"
+    # hand local files to the web server; "redirect" sends a signed storage URL
+    "OFFLOAD": config("BLOB_OFFLOAD", default=""),
+    "ACCEL_PREFIX": config("BLOB_ACCEL_PREFIX", default="/protected-media/"),
+    "REDIRECT_EXPIRES": 300,
+    # Unreferenced blobs are kept this long before collection
+    "GRACE_SECONDS": 60 * 60,
+}
+
 # --------------------------------------------------
 # CELERY (safe defaults)
+# --------------------------------------------------
+
+CELERY_BROKER_URL = config("CELERY_BROKER_URL", default="redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = config("CELERY_RESULT_BACKEND", default=CELERY_BROKER_URL)
+CELERY_TASK_ALWAYS_EAGER = config("CELERY_TASK_ALWAYS_EAGER", default=False, cast=bool)
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+CELERY_BEAT_SCHEDULE = {
+    # Fold note completion events into daily progress snapshots
+    "rollup-progress": {
+        "task": "notes.tasks.rollup_progress",
+        "schedule": config("PROGRESS_ROLLUP_INTERVAL", default=300, cast=int),
+    },
+    # Write buffered reading positions (notes.reading) to bookmarks
+    "flush-reading-positions": {
+        "task": "notes.tasks.flush_reading_positions",
+        "schedule": config("READING_FLUSH_INTERVAL", default=15, cast=int),
+    },
+    # Delete attachment blobs no note references any more
+    "collect-blobs": {
+        "task": "notes.tasks.collect_unreferenced_blobs",
+        "schedule": 60 * 60,
+    },
+}
+
+# --------------------------------------------------
+# AI SUMMARIES (Hugging Face inference API)
+# --------------------------------------------------
+
+HF_API_TOKEN = config("HF_API_TOKEN", default="")
+HF_API_URL = config(
+    "HF_API_URL",
+    default="https://router.huggingface.co/hf-inference/models/facebook/bart-large-cnn",
+)
+
+# Pooled keep-alive client with retries and a circuit breaker (notes.inference)
+INFERENCE_CLIENT = {
+    "POOL_SIZE": config("INFERENCE_POOL_SIZE", default=10, cast=int),
+    "TIMEOUT": config("INFERENCE_TIMEOUT", default=40, cast=int),
+    "MAX_RETRIES": config("INFERENCE_MAX_RETRIES", default=3, cast=int),
+    "BACKOFF_BASE": 0.5,
+    "BACKOFF_MAX": 20,
+    "BREAKER_THRESHOLD": 5,
+    "BREAKER_COOLDOWN": 30,
+}
 
+# AI summary cache (notes.ai_utils.SummaryCache)
+SUMMARY_CACHE = {
+    "LOCAL_MAX_ENTRIES": config("SUMMARY_CACHE_LOCAL_MAX_ENTRIES", default=256, cast=int),
+    "TTL": config("SUMMARY_CACHE_TTL", default=60 * 60 * 24, cast=int),
+    "CACHE_ALIAS": "default",
+}
+
+# Long documents are summarised chunk by chunk (notes.ai_utils.summarize_document)
+SUMMARY_CHUNKING = {
+    "MAX_WORDS": config("SUMMARY_CHUNK_MAX_WORDS", default=700, cast=int),
+    "OVERLAP_WORDS": config("SUMMARY_CHUNK_OVERLAP_WORDS", default=50, cast=int),
+    "CONCURRENCY": config("SUMMARY_CHUNK_CONCURRENCY", default=4, cast=int),
+    "DEADLINE": config("SUMMARY_DEADLINE", default=90, cast=int),
+    "ALLOW_PARTIAL": config("SUMMARY_ALLOW_PARTIAL", default=True, cast=bool),
+}
+
+# Offline keywords and extractive summaries (notes.keywords)
+KEYWORDS = {
+    "COUNT": config("KEYWORDS_COUNT", default=10, cast=int),
+    "SUMMARY_SENTENCES": config("KEYWORDS_SUMMARY_SENTENCES", default=3, cast=int),
+    # Longer notes are ranked on their first sentences only
+    "MAX_SENTENCES": 200,
+    "FALLBACK": config("SUMMARY_EXTRACTIVE_FALLBACK", default=True, cast=bool),
+}
+
+# PDF text extraction for the summarizer (notes.pdf_extract)
+PDF_EXTRACTION = {
+    "BACKEND": config("PDF_EXTRACTION_BACKEND", default="pypdf2"),  # or "pdfminer"
+    "MAX_PAGES": config("PDF_EXTRACTION_MAX_PAGES", default=500, cast=int),
+    "MAX_CHARS": config("PDF_EXTRACTION_MAX_CHARS", default=2_000_000, cast=int),
+    "WORKERS": config("PDF_EXTRACTION_WORKERS", default=4, cast=int),
+    "PAGES_PER_TASK": 16,
+    "CACHE_TTL": 60 * 60 * 24 * 7,
+}
+
+# Thumbnails and page text derived from PDF attachments (notes.previews)
+PDF_PREVIEWS = {
+    "THUMBNAIL_WIDTH": 240,
+    "THUMBNAIL_QUALITY": 80,
+}
+
+# --------------------------------------------------
+# NOTES API
+# --------------------------------------------------
+
+# Upper bound on operations per POST /api/notes/bulk/
+NOTE_BULK_MAX_OPERATIONS = config("NOTE_BULK_MAX_OPERATIONS", default=1000, cast=int)
+
+# Reading positions reported to /api/bookmarks/<note>/position/ are buffered
+# in the cache and flushed by the beat task above
+READING_POSITIONS = {
+    "FLUSH_BATCH_SIZE": 500,
+    "ENTRY_TTL": 60 * 60 * 24,
+    "MAX_CLOCK_SKEW_MS": 5 * 60 * 1000,
+}
+
+# --------------------------------------------------
+# REQUEST METRICS (Server-Timing, /internal/metrics)
+# --------------------------------------------------
+
+REQUEST_METRICS = {
+    "ENABLED": config("REQUEST_METRICS_ENABLED", default=True, cast=bool),
+    # Fraction of requests instrumented
+    "SAMPLE_RATE": config("REQUEST_METRICS_SAMPLE_RATE", default=1.0 if DEBUG else 0.05, cast=float),
+    # Server-Timing goes to staff users; this sends it to every client
+    "SERVER_TIMING": config("REQUEST_METRICS_SERVER_TIMING", default=DEBUG, cast=bool),
+    "SLOW_MS": config("REQUEST_METRICS_SLOW_MS", default=500, cast=int),
+    # This many runs of one statement in a request is flagged as N+1
+    "DUPLICATE_THRESHOLD": 5,
+    "FLUSH_SECONDS": 10,
+    # Bearer token for scrapers; staff users can always read the endpoint
+    "TOKEN": config("REQUEST_METRICS_TOKEN", default=""),
+}
+
+# --------------------------------------------------
+# PDF COMPILER
+# --------------------------------------------------
+
+PDF_COMPILE = {
+    # Larger selections are compiled by a Celery worker instead of inline
+    "SYNC_LIMIT": config("PDF_COMPILE_SYNC_LIMIT", default=50, cast=int),
+}
 
 # --------------------------------------------------
 # TINYMCE
@@ -1,7 +1,8 @@
 from django.contrib import admin
+from .search import search_notes
 from .models import (
     CustomUser, Subject, Topic, Note, Bookmark, Task,
-    Progress, Collaboration, Summary
+    Progress, Collaboration, Summary, Blob
 )
 
 
@@ -30,7 +31,15 @@ class TopicAdmin(admin.ModelAdmin):
 class NoteAdmin(admin.ModelAdmin):
     list_display = ('title', 'topic', 'owner', 'is_public', 'created_at')
     list_filter = ('is_public', 'created_at', 'owner')
-    search_fields = ('title', 'content')
+    search_fields = ('title',)
+
+    # Use the full-text index instead of icontains scans over content
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+
+        matches = search_notes(Note.objects.all(), search_term).values('pk')
+        return queryset.filter(pk__in=matches), False
 
 
 @admin.register(Bookmark)
@@ -60,5 +69,12 @@ class CollaborationAdmin(admin.ModelAdmin):
 
 @admin.register(Summary)
 class SummaryAdmin(admin.ModelAdmin):
-    list_display = ('note', 'created_at')
-    list_filter = ('created_at',)
+    list_display = ('note', 'method', 'created_at')
+    list_filter = ('method', 'created_at')
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'size', 'content_type', 'ref_count', 'created_at')
+    list_filter = ('content_type',)
+    readonly_fields = ('sha256', 'file', 'size', 'ref_count', 'released_at')
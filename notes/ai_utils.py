@@ -1,42 +1,300 @@
-import os
-import requests
+import hashlib
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 
-HF_API_TOKEN = os.getenv("HF_API_TOKEN")
+from django.conf import settings
+from django.core.cache import caches
 
-API_URL = "https://router.huggingface.co/hf-inference/models/facebook/bart-large-cnn"
+from .inference import InferenceError, get_client
 
-HEADERS = {
-    "Authorization": f"Bearer {HF_API_TOKEN}",
-    "Content-Type": "application/json",
-}
+MODEL_NAME = settings.HF_API_URL.rstrip("/").rsplit("/models/", 1)[-1]
 
-def generate_summary(text):
-    if not HF_API_TOKEN:
-        return "ERROR: Hugging Face API token not configured."
+DEFAULT_MAX_LENGTH = 150
+DEFAULT_MIN_LENGTH = 40
 
+
+# ============================================================
+# TEXT HASHING
+# ============================================================
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def content_hash(text):
+    """sha256 of the whitespace-normalised text (also stored on Summary)."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+# ============================================================
+# SUMMARY CACHE
+# ============================================================
+class SummaryCache:
+    """
+    Two-tier cache of generated summaries.
+
+    Keys combine the content hash with the model and generation parameters.
+    The first tier is a bounded in-process LRU (with TTL); the second is the
+    shared Django cache backend, so workers and web processes reuse each
+    other's results.
+    """
+
+    def __init__(self, max_entries=256, ttl=24 * 60 * 60, cache_alias="default"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias]
+
+    @staticmethod
+    def make_key(text_hash, max_length=DEFAULT_MAX_LENGTH, min_length=DEFAULT_MIN_LENGTH):
+        return f"summary:{MODEL_NAME}:{max_length}:{min_length}:{text_hash}"
+
+    def get(self, key):
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.stats["local_hits"] += 1
+                    return value
+
+                del self._entries[key]
+                self.stats["expirations"] += 1
+
+        value = self.shared.get(key)
+        if value is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        self._remember(key, value, stat="shared_hits")
+        return value
+
+    def set(self, key, value):
+        self.shared.set(key, value, self.ttl)
+        self._remember(key, value)
+
+    def _remember(self, key, value, stat=None):
+        with self._lock:
+            if stat:
+                self.stats[stat] += 1
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, text_hash):
+        """Drop cached summaries of ``text_hash`` (default parameters in the shared tier)."""
+        suffix = f":{text_hash}"
+        with self._lock:
+            for key in [k for k in self._entries if k.endswith(suffix)]:
+                del self._entries[key]
+            self.stats["invalidations"] += 1
+
+        self.shared.delete(self.make_key(text_hash))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.stats.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "local_size": len(self._entries)}
+
+
+_cache_config = getattr(settings, "SUMMARY_CACHE", {})
+
+summary_cache = SummaryCache(
+    max_entries=_cache_config.get("LOCAL_MAX_ENTRIES", 256),
+    ttl=_cache_config.get("TTL", 24 * 60 * 60),
+    cache_alias=_cache_config.get("CACHE_ALIAS", "default"),
+)
+
+
+# ============================================================
+# SUMMARISATION
+# ============================================================
+def generate_summary(text, max_length=DEFAULT_MAX_LENGTH, min_length=DEFAULT_MIN_LENGTH):
+    """Summary of ``text``; raises InferenceError when the API cannot produce one."""
+    key = summary_cache.make_key(content_hash(text), max_length, min_length)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+
+    summary = _request_summary(text, max_length, min_length)
+    summary_cache.set(key, summary)
+    return summary
+
+
+def _request_summary(text, max_length, min_length):
     payload = {
         "inputs": text,
         "parameters": {
-            "max_length": 150,
-            "min_length": 40,
+            "max_length": max_length,
+            "min_length": min_length,
             "do_sample": False
         }
     }
 
+    result = get_client().post(payload)
+
+    if isinstance(result, list) and result and "summary_text" in result[0]:
+        return result[0]["summary_text"]
+
+    raise InferenceError("Unexpected response from Hugging Face API.")
+
+
+# ============================================================
+# LONG DOCUMENTS (MAP-REDUCE)
+# ============================================================
+_chunk_config = getattr(settings, "SUMMARY_CHUNKING", {})
+
+# BART accepts ~1024 tokens; words are a conservative proxy
+CHUNK_MAX_WORDS = _chunk_config.get("MAX_WORDS", 700)
+CHUNK_OVERLAP_WORDS = _chunk_config.get("OVERLAP_WORDS", 50)
+CHUNK_CONCURRENCY = _chunk_config.get("CONCURRENCY", 4)
+CHUNK_DEADLINE = _chunk_config.get("DEADLINE", 90)
+CHUNK_ALLOW_PARTIAL = _chunk_config.get("ALLOW_PARTIAL", True)
+MAX_REDUCE_ROUNDS = 3
+# Share of the deadline kept for the final summary, so partial map results
+# still leave it time to run
+FINAL_DEADLINE_SHARE = 0.25
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def chunk_text(text, max_words=CHUNK_MAX_WORDS, overlap=CHUNK_OVERLAP_WORDS):
+    """
+    Split text into chunks of at most ``max_words`` words on sentence
+    boundaries. Each chunk repeats roughly ``overlap`` trailing words of the
+    previous one so context is not lost at the seams.
+    """
+    sentences = []
+    for sentence in SENTENCE_RE.split(normalize_text(text)):
+        words = sentence.split()
+        # Hard-split sentences that alone exceed the budget
+        for start in range(0, len(words), max_words):
+            sentences.append(words[start:start + max_words])
+
+    chunks = []
+    current = []
+    size = 0
+    for words in sentences:
+        if current and size + len(words) > max_words:
+            chunks.append(" ".join(w for s in current for w in s))
+
+            carried = []
+            carried_size = 0
+            for previous in reversed(current):
+                if carried_size + len(previous) > overlap:
+                    break
+                carried.insert(0, previous)
+                carried_size += len(previous)
+
+            if carried_size + len(words) > max_words:
+                carried, carried_size = [], 0
+            current, size = carried, carried_size
+
+        current.append(words)
+        size += len(words)
+
+    if current:
+        chunks.append(" ".join(w for s in current for w in s))
+
+    return chunks
+
+
+def summarize_document(
+    text,
+    concurrency=CHUNK_CONCURRENCY,
+    deadline=CHUNK_DEADLINE,
+    allow_partial=CHUNK_ALLOW_PARTIAL,
+    max_words=CHUNK_MAX_WORDS,
+):
+    """
+    Summarise text of any length.
+
+    Short text goes straight to generate_summary. Longer text is chunked, the
+    chunks are summarised concurrently (map) and their summaries summarised
+    again (reduce), so wall time tracks the slowest chunk rather than the sum.
+    ``deadline`` (seconds) bounds the whole call, the final summary included
+    (FINAL_DEADLINE_SHARE of it is kept for that one); with ``allow_partial``
+    the chunks that finished in time are used instead of failing. Summaries
+    still over ``max_words`` after MAX_REDUCE_ROUNDS are truncated to it for
+    the final call.
+    """
+    expires_at = time.monotonic() + deadline
+    map_expires_at = expires_at - deadline * FINAL_DEADLINE_SHARE
+
+    for _ in range(MAX_REDUCE_ROUNDS):
+        chunks = chunk_text(text, max_words=max_words)
+        if len(chunks) <= 1:
+            return _final_summary(text, expires_at)
+
+        summaries, errors = _map_chunks(chunks, concurrency, map_expires_at)
+        done = [s for s in summaries if s is not None]
+
+        if not done:
+            raise errors[0] if errors else InferenceError("Summary deadline exceeded.")
+        if len(done) < len(chunks) and not allow_partial:
+            raise InferenceError("Some chunks could not be summarized in time.")
+
+        text = " ".join(done)
+
+    return _final_summary(" ".join(text.split()[:max_words]), expires_at)
+
+
+def _final_summary(text, expires_at):
+    """generate_summary of ``text``, within what is left of the deadline."""
+    if time.monotonic() >= expires_at:
+        raise InferenceError("Summary deadline exceeded.")
+
+    (summary,), errors = _map_chunks([text], 1, expires_at)
+    if summary is None:
+        raise errors[0] if errors else InferenceError("Summary deadline exceeded.")
+    return summary
+
+
+def _map_chunks(chunks, concurrency, expires_at):
+    """
+    (summaries, errors): summaries in chunk order, None for chunks that failed
+    or missed the deadline.
+    """
+    results = [None] * len(chunks)
+    errors = []
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks))))
     try:
-        response = requests.post(
-            API_URL,
-            headers=HEADERS,
-            json=payload,
-            timeout=40,
-        )
-        response.raise_for_status()
-        result = response.json()
-
-        if isinstance(result, list) and "summary_text" in result[0]:
-            return result[0]["summary_text"]
-
-        return "ERROR: Unexpected response from Hugging Face API."
-
-    except requests.exceptions.RequestException as e:
-        return f"ERROR: {str(e)}"
+        futures = {
+            executor.submit(generate_summary, chunk): index
+            for index, chunk in enumerate(chunks)
+        }
+        wait(futures, timeout=max(0, expires_at - time.monotonic()))
+
+        for future, index in futures.items():
+            if not future.done():
+                continue
+            if future.exception():
+                errors.append(future.exception())
+            else:
+                results[index] = future.result()
+    finally:
+        # Don't block on stragglers past the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, errors
@@ -0,0 +1,218 @@
+"""
+Content-addressed storage for note attachments.
+
+Uploads are stored once per SHA-256 under ``blobs/ab/cd/<digest>`` in the
+default storage (the local filesystem, or S3 when a bucket is configured),
+and notes point at the ``Blob``. Each blob counts the notes referencing it;
+blobs left unreferenced for GRACE_SECONDS are deleted by ``collect_blobs``.
+
+HashingUploadHandler spools every upload to a temporary file and hashes it
+chunk by chunk as it arrives, so neither buffering nor hashing needs the
+whole file in memory.
+
+Downloads are streamed with Range support and the digest as a strong ETag,
+or offloaded: to the web server (X-Accel-Redirect / X-Sendfile) or to the
+storage (a signed redirect, which S3 serves with its own Range support).
+"""
+import hashlib
+import mimetypes
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+from .downloads import ranged_file_response
+from .models import Blob, Note
+
+CONFIG = getattr(settings, "BLOB_STORAGE", {})
+# "", "x-accel-redirect", "x-sendfile" or "redirect"
+OFFLOAD = CONFIG.get("OFFLOAD", "")
+ACCEL_PREFIX = CONFIG.get("ACCEL_PREFIX", "/protected-media/")
+REDIRECT_EXPIRES = CONFIG.get("REDIRECT_EXPIRES", 300)
+GRACE_SECONDS = CONFIG.get("GRACE_SECONDS", 60 * 60)
+
+CHUNK_SIZE = 64 * 1024
+
+
+# ============================================================
+# UPLOADS
+# ============================================================
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """Spools uploads to disk and sets ``sha256`` on the uploaded file."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.digest.hexdigest()
+        return uploaded
+
+
+def file_digest(uploaded):
+    """SHA-256 of an uploaded file, from the upload handler when it computed it."""
+    digest = getattr(uploaded, "sha256", None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in uploaded.chunks(CHUNK_SIZE):
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+    return digest
+
+
+def blob_name(digest):
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def store(uploaded):
+    """
+    The Blob holding the bytes of ``uploaded``, writing them only if no blob
+    has them yet. The caller takes the reference (see attach).
+    """
+    digest = file_digest(uploaded)
+    blob = Blob.objects.filter(pk=digest).first()
+    if blob is not None:
+        return blob
+    return _create(uploaded, digest)
+
+
+def _create(uploaded, digest):
+    storage = Blob._meta.get_field("file").storage
+    name = blob_name(digest)
+    if not storage.exists(name):
+        uploaded.seek(0)
+        saved = storage.save(name, uploaded)
+        if saved != name:
+            # Written concurrently under the same name; the bytes are equal
+            storage.delete(saved)
+
+    content_type = mimetypes.guess_type(uploaded.name or "")[0] or "application/octet-stream"
+    blob, _ = Blob.objects.get_or_create(
+        pk=digest, defaults={"file": name, "size": uploaded.size, "content_type": content_type},
+    )
+    return blob
+
+
+def attach(note, uploaded):
+    """Make ``uploaded`` the note's attachment, releasing the previous one."""
+    blob = store(uploaded)
+    previous = note.attachment_id
+
+    with transaction.atomic():
+        # Locked so collect_blobs cannot delete it before the reference counts
+        locked = Blob.objects.select_for_update().filter(pk=blob.pk).first()
+        if locked is None or (
+            locked.ref_count <= 0 and not locked.file.storage.exists(locked.file.name)
+        ):
+            # Collected since store() (or its file was, by a collection that
+            # failed to commit): write it again
+            blob = _create(uploaded, blob.pk)
+        Blob.objects.filter(pk=blob.pk).update(ref_count=F("ref_count") + 1, released_at=None)
+        note.attachment = blob
+        note.attachment_name = os.path.basename(uploaded.name or "")[:255] or "attachment"
+        note.save(update_fields=["attachment", "attachment_name", "updated_at"])
+        release([previous])
+    return blob
+
+
+def release(digests):
+    """Drop one reference per entry of ``digests`` (None entries are skipped)."""
+    counts = Counter(digest for digest in digests if digest)
+    if not counts:
+        return
+
+    # One UPDATE per distinct number of references dropped, as in notes.bulk
+    groups = {}
+    for digest, n in counts.items():
+        groups.setdefault(n, []).append(digest)
+    for n, group in groups.items():
+        Blob.objects.filter(pk__in=group).update(ref_count=F("ref_count") - n)
+
+    Blob.objects.filter(pk__in=list(counts), ref_count__lte=0, released_at__isnull=True).update(
+        released_at=timezone.now(),
+    )
+
+
+def unreferenced_blobs():
+    """
+    Blobs with no references left, lockable on PostgreSQL: NOT EXISTS rather
+    than a LEFT JOIN, whose nullable side FOR UPDATE may not touch.
+    """
+    return Blob.objects.filter(
+        ~Exists(Note.objects.filter(attachment=OuterRef("pk"))), ref_count__lte=0,
+    )
+
+
+def collect_blobs(grace=GRACE_SECONDS):
+    """Delete blobs unreferenced for ``grace`` seconds; returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    removed = 0
+    candidates = Blob.objects.filter(
+        ref_count__lte=0, released_at__lt=cutoff,
+    ).values_list("pk", flat=True)
+
+    for digest in list(candidates):
+        with transaction.atomic():
+            blob = unreferenced_blobs().select_for_update().filter(pk=digest).first()
+            if blob is None:
+                continue
+            blob.delete()
+            # Under the lock, not on commit: an attach waiting on it then
+            # finds both row and file gone and writes them again
+            blob.file.storage.delete(blob.file.name)
+        removed += 1
+    return removed
+
+
+# ============================================================
+# DOWNLOADS
+# ============================================================
+def serve(request, blob, filename):
+    """Download response for ``blob`` under ``filename``."""
+    etag = f'"{blob.sha256}"'
+    disposition = content_disposition_header(True, filename)
+
+    if OFFLOAD == "redirect":
+        storage = blob.file.storage
+        try:
+            url = storage.url(
+                blob.file.name, parameters={"ResponseContentDisposition": disposition},
+                expire=REDIRECT_EXPIRES,
+            )
+        except TypeError:
+            # Storages without signed URL parameters
+            url = storage.url(blob.file.name)
+        return HttpResponseRedirect(url)
+
+    if OFFLOAD in ("x-accel-redirect", "x-sendfile"):
+        if request.headers.get("If-None-Match") == etag:
+            response = HttpResponse(status=304)
+        else:
+            # The web server sends the body and handles Range itself
+            response = HttpResponse(content_type=blob.content_type)
+            if OFFLOAD == "x-accel-redirect":
+                response["X-Accel-Redirect"] = ACCEL_PREFIX + blob.file.name
+            else:
+                response["X-Sendfile"] = blob.file.path
+            response["Content-Disposition"] = disposition
+        response["ETag"] = etag
+    else:
+        response = ranged_file_response(
+            request, blob.file, filename, blob.content_type, etag=blob.sha256,
+        )
+
+    # Access is checked per request, so shared caches must not keep it
+    response["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,217 @@
+"""
+Batch note operations.
+
+A batch of create / move / complete / delete operations is validated item by
+item and then applied inside one transaction with one bulk_create, one UPDATE
+per distinct set of new values and one delete(). The work the per-note
+signals would do (counters, progress events, search index, dashboard cache)
+is done once for the whole batch: counters are recounted per affected
+topic/subject instead of being shifted per note.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .blobs import release
+from .dashboard import invalidate_dashboard
+from .models import Note, ProgressEvent, Subject, Topic
+from .progress import transition_event
+from .search import index_notes
+from . import similarity
+from .signals import note_signals_muted
+
+MAX_OPERATIONS = getattr(settings, "NOTE_BULK_MAX_OPERATIONS", 1000)
+BATCH_SIZE = 500
+
+NOTE_OPERATIONS = ("move", "complete", "delete")
+TOPIC_OPERATIONS = ("create", "move")
+
+
+class BulkError(ValueError):
+    """The batch as a whole is malformed; nothing was applied."""
+
+
+class OperationError(ValueError):
+    """A single operation is invalid; it is reported and skipped."""
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ids(operations, kinds, key):
+    return {
+        _int(op.get(key))
+        for op in operations
+        if isinstance(op, dict) and op.get("op") in kinds
+    } - {None}
+
+
+class _Batch:
+    def __init__(self, user, notes, topics):
+        self.user = user
+        self.notes = notes
+        self.topics = topics  # create/move targets: topic_id -> subject_id
+
+        self.initial = {pk: note.counter_state() for pk, note in notes.items()}
+        self.subject_of = {note.topic_id: note.topic.subject_id for note in notes.values()}
+        self.subject_of.update(topics)
+        self.created = []
+        self.changed = {}  # pk -> set of fields
+        self.deleted = set()
+
+    def note(self, op):
+        note = self.notes.get(_int(op.get("id")))
+        if note is None or note.pk in self.deleted:
+            raise OperationError("Note not found.")
+        return note
+
+    def topic(self, op):
+        topic_id = _int(op.get("topic"))
+        if topic_id not in self.topics:
+            raise OperationError("Topic not found.")
+        return topic_id
+
+    def mark(self, note, field):
+        self.changed.setdefault(note.pk, set()).add(field)
+
+    # ----------------------------
+    # operations
+    # ----------------------------
+    def op_create(self, op):
+        title = op.get("title")
+        if not isinstance(title, str) or not title.strip() or len(title) > 255:
+            raise OperationError("A title of 1-255 characters is required.")
+        content = op.get("content", "")
+        completed = op.get("completed", False)
+        if not isinstance(content, str) or not isinstance(completed, bool):
+            raise OperationError("Invalid content or completed flag.")
+
+        note = Note(
+            title=title.strip(), content=content, topic_id=self.topic(op),
+            owner=self.user, is_completed=completed,
+        )
+        self.created.append(note)
+        return note
+
+    def op_move(self, op):
+        note = self.note(op)
+        note.topic_id = self.topic(op)
+        self.mark(note, "topic")
+        return note
+
+    def op_complete(self, op):
+        note = self.note(op)
+        completed = op.get("completed", True)
+        if not isinstance(completed, bool):
+            raise OperationError("completed must be true or false.")
+        note.is_completed = completed
+        self.mark(note, "is_completed")
+        return note
+
+    def op_delete(self, op):
+        note = self.note(op)
+        self.deleted.add(note.pk)
+        return note
+
+    # ----------------------------
+    # apply
+    # ----------------------------
+    def flush(self):
+        if self.created:
+            Note.objects.bulk_create(self.created, batch_size=BATCH_SIZE)
+
+        updated = [self.notes[pk] for pk in self.changed if pk not in self.deleted]
+        if updated:
+            # Batches mostly set a few distinct values (complete all, move
+            # to one topic), so one UPDATE ... WHERE id IN (...) per distinct
+            # value set beats bulk_update's per-row CASE.
+            now = timezone.now()
+            fields = sorted(set().union(*(self.changed[n.pk] for n in updated)))
+            attnames = [Note._meta.get_field(f).attname for f in fields]
+            groups = defaultdict(list)
+            for note in updated:
+                note.updated_at = now
+                groups[tuple(getattr(note, a) for a in attnames)].append(note.pk)
+            for values, pks in groups.items():
+                for start in range(0, len(pks), BATCH_SIZE):
+                    Note.objects.filter(pk__in=pks[start:start + BATCH_SIZE]).update(
+                        updated_at=now, **dict(zip(attnames, values)),
+                    )
+
+        if self.deleted:
+            with note_signals_muted():
+                Note.objects.filter(pk__in=self.deleted).delete()
+            release([self.notes[pk].attachment_id for pk in self.deleted])
+
+        touched = self.created + updated + [self.notes[pk] for pk in self.deleted]
+        if not touched:
+            return
+
+        # Counters: recount each affected topic/subject once
+        topic_ids = {note.topic_id for note in touched}
+        topic_ids |= {self.initial[pk][0] for pk in self.changed.keys() | self.deleted}
+        Topic.objects.filter(pk__in=topic_ids).rebuild_counters()
+        Subject.objects.filter(pk__in={self.subject_of[pk] for pk in topic_ids}).rebuild_counters()
+
+        events = [transition_event(self.user.pk, None, n.counter_state()) for n in self.created]
+        events += [
+            transition_event(self.user.pk, self.initial[n.pk], n.counter_state()) for n in updated
+        ]
+        events += [transition_event(self.user.pk, self.initial[pk], None) for pk in self.deleted]
+        ProgressEvent.objects.bulk_create([e for e in events if e is not None])
+
+        index_notes(self.created)
+        similarity.index_notes(self.created)
+        invalidate_dashboard(self.user.pk)
+
+
+def apply_operations(user, operations):
+    """
+    Apply ``operations`` (a list of dicts with an "op" key) for ``user`` and
+    return one result dict per operation, in order.
+    """
+    if not isinstance(operations, list):
+        raise BulkError("operations must be a list.")
+    if len(operations) > MAX_OPERATIONS:
+        raise BulkError(f"At most {MAX_OPERATIONS} operations per request.")
+
+    handlers = {
+        "create": _Batch.op_create,
+        "move": _Batch.op_move,
+        "complete": _Batch.op_complete,
+        "delete": _Batch.op_delete,
+    }
+
+    with transaction.atomic():
+        notes = Note.objects.filter(
+            pk__in=_ids(operations, NOTE_OPERATIONS, "id"), owner=user,
+        ).select_related("topic")
+        topics = Topic.objects.filter(
+            pk__in=_ids(operations, TOPIC_OPERATIONS, "topic"), subject__owner=user,
+        ).values_list("pk", "subject_id")
+
+        batch = _Batch(user, {note.pk: note for note in notes}, dict(topics))
+
+        applied = []
+        results = []
+        for index, op in enumerate(operations):
+            handler = handlers.get(op.get("op")) if isinstance(op, dict) else None
+            try:
+                if handler is None:
+                    raise OperationError("Unknown operation.")
+                applied.append((index, handler(batch, op)))
+                results.append({"index": index, "ok": True})
+            except OperationError as e:
+                results.append({"index": index, "ok": False, "error": str(e)})
+
+        batch.flush()
+
+    for index, note in applied:
+        results[index]["id"] = note.pk
+    return results
@@ -0,0 +1,241 @@
+"""
+Streamed NDJSON import/export of a user's corpus.
+
+One JSON object per line, parents always before their children:
+
+    {"type": "corpus", "version": 1}
+    {"type": "subject", "id": 1, "name": "...", "description": "..."}
+    {"type": "topic", "id": 4, "subject": 1, "name": "...", ...}
+    {"type": "note", "id": 9, "topic": 4, "title": "...", ...}
+    {"type": "bookmark", "note": 9, "page_position": 3}
+
+Ids are the exporter's and only link lines together; the importer remaps
+them. Each note's bookmarks follow it directly, so the importer only has to
+remember the note ids of the batch it is building: memory is bounded by the
+batch size plus the subject/topic id maps, not by the number of notes.
+"""
+import json
+
+from django.db import transaction
+
+from .dashboard import invalidate_dashboard
+from .models import Bookmark, Note, Subject, Topic
+from .permissions import bump_version
+from .search import index_notes
+from . import similarity
+
+FORMAT_VERSION = 1
+CHUNK_SIZE = 2000
+
+# Exported fields and their defaults (which also fix the accepted types)
+SUBJECT_FIELDS = {"name": "", "description": ""}
+TOPIC_FIELDS = {"name": "", "description": "", "order": 0}
+NOTE_FIELDS = {
+    "title": "", "content": "", "is_public": False, "is_read": False, "is_completed": False,
+}
+BOOKMARK_FIELDS = {"page_position": 0}
+
+
+class CorpusError(ValueError):
+    """The stream is malformed; the import is rolled back."""
+
+    def __init__(self, line, message):
+        super().__init__(f"Line {line}: {message}")
+        self.line = line
+
+
+# ============================================================
+# EXPORT
+# ============================================================
+def _line(kind, **fields):
+    return json.dumps({"type": kind, **fields}, ensure_ascii=False) + "\n"
+
+
+def export_corpus(user, chunk_size=CHUNK_SIZE):
+    """
+    Yield the user's subjects, topics, notes and bookmarks as NDJSON lines.
+
+    Covers the subjects the user owns and the user's own notes in them.
+    """
+    subjects = Subject.objects.filter(owner=user).order_by("pk")
+    topics = Topic.objects.filter(subject__owner=user).order_by("pk")
+    notes = Note.objects.filter(owner=user, topic__subject__owner=user).order_by("pk")
+
+    yield _line("corpus", version=FORMAT_VERSION)
+
+    for row in subjects.values("pk", *SUBJECT_FIELDS).iterator(chunk_size=chunk_size):
+        yield _line("subject", id=row.pop("pk"), **row)
+
+    for row in topics.values("pk", "subject_id", *TOPIC_FIELDS).iterator(chunk_size=chunk_size):
+        yield _line("topic", id=row.pop("pk"), subject=row.pop("subject_id"), **row)
+
+    batch = []
+    for row in notes.values("pk", "topic_id", *NOTE_FIELDS).iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield from _note_lines(user, batch)
+            batch = []
+    yield from _note_lines(user, batch)
+
+
+def _note_lines(user, rows):
+    """Note lines, each followed by its bookmarks (one query per batch)."""
+    if not rows:
+        return
+    bookmarks = {}
+    for note_id, position in Bookmark.objects.filter(
+        user=user, note_id__in=[row["pk"] for row in rows],
+    ).values_list("note_id", "page_position"):
+        bookmarks[note_id] = position
+
+    for row in rows:
+        pk = row.pop("pk")
+        yield _line("note", id=pk, topic=row.pop("topic_id"), **row)
+        if pk in bookmarks:
+            yield _line("bookmark", note=pk, page_position=bookmarks[pk])
+
+
+# ============================================================
+# IMPORT
+# ============================================================
+def _fields(record, fields, line):
+    values = {}
+    for name, default in fields.items():
+        value = record.get(name, default)
+        expected = type(default)
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise CorpusError(line, f"{name!r} must be {expected.__name__}.")
+        values[name] = value
+    return values
+
+
+class _Importer:
+    def __init__(self, user, batch_size):
+        self.user = user
+        self.batch_size = batch_size
+
+        # exported id -> instance; notes only for the batch being built
+        self.subject_ids = {}
+        self.topic_ids = {}
+        self.note_ids = {}
+
+        self.subjects = []
+        self.topics = []
+        self.notes = []
+        self.bookmarks = []
+        self.bookmarked = set()
+        self.counts = {"subjects": 0, "topics": 0, "notes": 0, "bookmarks": 0}
+
+    def _ref(self, mapping, record, key, line):
+        ref = record.get(key)
+        if ref not in mapping:
+            raise CorpusError(line, f"Unknown {key} {ref!r}.")
+        return mapping[ref]
+
+    def _name(self, values, key, line):
+        values[key] = values[key].strip()
+        if not values[key] or len(values[key]) > 255:
+            raise CorpusError(line, f"{key!r} must be 1-255 characters.")
+
+    def _id(self, mapping, record, line):
+        ref = record.get("id")
+        if ref is None or ref in mapping:
+            raise CorpusError(line, "Missing or duplicate id.")
+        return ref
+
+    def add(self, record, line):
+        kind = record.get("type")
+        if kind == "subject":
+            ref = self._id(self.subject_ids, record, line)
+            values = _fields(record, SUBJECT_FIELDS, line)
+            self._name(values, "name", line)
+            subject = Subject(owner=self.user, **values)
+            self.subjects.append(subject)
+            self.subject_ids[ref] = subject
+
+        elif kind == "topic":
+            ref = self._id(self.topic_ids, record, line)
+            subject = self._ref(self.subject_ids, record, "subject", line)
+            values = _fields(record, TOPIC_FIELDS, line)
+            self._name(values, "name", line)
+            topic = Topic(subject=subject, **values)
+            self.topics.append(topic)
+            self.topic_ids[ref] = topic
+
+        elif kind == "note":
+            # Flush before the note, not after, so its bookmarks land in
+            # the same batch
+            if len(self.notes) >= self.batch_size:
+                self.flush()
+            ref = self._id(self.note_ids, record, line)
+            topic = self._ref(self.topic_ids, record, "topic", line)
+            values = _fields(record, NOTE_FIELDS, line)
+            self._name(values, "title", line)
+            note = Note(topic=topic, owner=self.user, **values)
+            self.notes.append(note)
+            self.note_ids[ref] = note
+
+        elif kind == "bookmark":
+            note = self._ref(self.note_ids, record, "note", line)
+            if record["note"] in self.bookmarked:
+                raise CorpusError(line, "Duplicate bookmark.")
+            self.bookmarked.add(record["note"])
+            values = _fields(record, BOOKMARK_FIELDS, line)
+            self.bookmarks.append(Bookmark(user=self.user, note=note, **values))
+
+        elif kind == "corpus":
+            if line != 1 or record.get("version") != FORMAT_VERSION:
+                raise CorpusError(line, "Unsupported corpus header.")
+
+        else:
+            raise CorpusError(line, f"Unknown type {kind!r}.")
+
+    def flush(self):
+        """
+        Create everything pending, parents first. bulk_create copies each
+        parent's new pk onto the children that reference the instance.
+        """
+        for attr, model in (
+            ("subjects", Subject), ("topics", Topic), ("notes", Note), ("bookmarks", Bookmark),
+        ):
+            pending = getattr(self, attr)
+            if pending:
+                model.objects.bulk_create(pending, batch_size=self.batch_size)
+                self.counts[attr] += len(pending)
+                setattr(self, attr, [])
+
+        index_notes(self.note_ids.values())
+        similarity.index_notes(self.note_ids.values())
+        self.note_ids = {}
+        self.bookmarked = set()
+
+
+def import_corpus(user, lines, batch_size=CHUNK_SIZE):
+    """
+    Create the corpus read from ``lines`` (an iterable of NDJSON lines, str
+    or bytes) for ``user`` in one transaction and return the counts.
+
+    Imported notes keep their completed/read flags but add no progress
+    history: they record where the corpus was, not work done today.
+    """
+    importer = _Importer(user, batch_size)
+
+    with transaction.atomic():
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise CorpusError(number, "Invalid JSON.")
+            if not isinstance(record, dict):
+                raise CorpusError(number, "Expected an object.")
+            importer.add(record, number)
+        importer.flush()
+
+        Topic.objects.filter(subject__owner=user).rebuild_counters()
+        Subject.objects.filter(owner=user).rebuild_counters()
+
+    bump_version(user.pk)
+    invalidate_dashboard(user.pk)
+    return importer.counts
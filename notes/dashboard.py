@@ -0,0 +1,150 @@
+"""
+Dashboard data, built in two queries and cached per user.
+
+The cached entry is plain data (no model instances) and is dropped by
+notes.signals whenever a subject, topic, note, bookmark or task of the user
+changes, so hits never touch the database.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Bookmark, CustomUser, Note, Subject, Task
+
+DASHBOARD_VERSION = 1
+DASHBOARD_TTL = 60 * 15
+RECENT_LIMIT = 3
+
+
+def dashboard_key(user_id):
+    return f"dashboard:v{DASHBOARD_VERSION}:{user_id}"
+
+
+def invalidate_dashboard(*user_ids):
+    cache.delete_many([dashboard_key(pk) for pk in set(user_ids) if pk])
+
+
+def _topic_owner_key(topic_id):
+    return f"topic_owner:{topic_id}"
+
+
+def remember_topic_owner(topic_id, owner_id):
+    cache.set(_topic_owner_key(topic_id), owner_id, None)
+
+
+def forget_topic_owner(topic_id):
+    cache.delete(_topic_owner_key(topic_id))
+
+
+def topic_owner_id(topic_id):
+    """
+    Owner of the subject a topic belongs to. Note saves need it to refresh
+    the subject owner's dashboard; caching it keeps those saves query-free.
+    """
+    owner_id = cache.get(_topic_owner_key(topic_id))
+    if owner_id is None:
+        owner_id = (
+            Subject.objects.filter(topics__pk=topic_id)
+            .values_list("owner_id", flat=True)
+            .first()
+        )
+        if owner_id is not None:
+            remember_topic_owner(topic_id, owner_id)
+    return owner_id
+
+
+# ============================================================
+# QUERIES
+# ============================================================
+def _count(queryset, key):
+    """Correlated COUNT(*) of ``queryset`` rows whose ``key`` is the outer user."""
+    counted = (
+        queryset.filter(**{key: OuterRef("pk")})
+        .order_by()
+        .values(key)
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def _slots(queryset, prefix, fields, limit=RECENT_LIMIT):
+    """One scalar subquery per field for each of the first ``limit`` rows."""
+    return {
+        f"{prefix}{i}_{field}": Subquery(queryset.values(field)[i:i + 1])
+        for i in range(limit)
+        for field in fields
+    }
+
+
+def _unslot(row, prefix, fields, limit=RECENT_LIMIT):
+    items = []
+    for i in range(limit):
+        item = {field: row[f"{prefix}{i}_{field}"] for field in fields}
+        if item[fields[0]] is None:
+            break
+        items.append(item)
+    return items
+
+
+def compute_dashboard(user):
+    # 1) counters plus the recent notes / upcoming tasks, as one row
+    notes = Note.objects.filter(owner=OuterRef("pk")).order_by("-created_at", "-pk")
+    upcoming = Task.objects.filter(user=OuterRef("pk"), completed=False).order_by(
+        F("due_date").asc(nulls_last=True), "-created_at", "-pk"
+    )
+
+    annotations = {
+        "notes_count": _count(Note.objects.all(), "owner"),
+        "bookmarks_count": _count(Bookmark.objects.all(), "user"),
+        "pending_tasks": _count(Task.objects.filter(completed=False), "user"),
+        **_slots(notes, "recent", ["title"]),
+        **_slots(upcoming, "task", ["title", "due_date"]),
+    }
+    row = (
+        CustomUser.objects.filter(pk=user.pk)
+        .annotate(**annotations)
+        .values(*annotations)
+        .get()
+    )
+
+    # 2) subjects with their topics (LEFT JOIN, so topic-less subjects stay)
+    subjects = {}
+    rows = (
+        Subject.objects.filter(owner=user)
+        .order_by("-created_at", "topics__order", "topics__created_at")
+        .values("pk", "name", "note_count", "completed_count", "topics__pk", "topics__name")
+    )
+    for r in rows:
+        subject = subjects.get(r["pk"])
+        if subject is None:
+            total, done = r["note_count"], r["completed_count"]
+            subject = subjects[r["pk"]] = {
+                "id": r["pk"],
+                "name": r["name"],
+                "progress": int(done / total * 100) if total else 0,
+                "topics": [],
+            }
+        if r["topics__pk"] is not None:
+            subject["topics"].append({"id": r["topics__pk"], "name": r["topics__name"]})
+
+    return {
+        "subjects": list(subjects.values()),
+        "subjects_count": len(subjects),
+        "notes_count": row["notes_count"],
+        "bookmarks_count": row["bookmarks_count"],
+        "pending_tasks": row["pending_tasks"],
+        "recent_activity": [
+            f"Added note: {n['title']}" for n in _unslot(row, "recent", ["title"])
+        ],
+        "upcoming_tasks": _unslot(row, "task", ["title", "due_date"]),
+    }
+
+
+def dashboard_data(user):
+    key = dashboard_key(user.pk)
+    data = cache.get(key)
+    if data is None:
+        data = compute_dashboard(user)
+        cache.set(key, data, DASHBOARD_TTL)
+    return data
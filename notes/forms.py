@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from tinymce.widgets import TinyMCE
+from .blobs import attach
 from .models import CustomUser, Subject, Topic, Note, Task, Collaboration
 
 
@@ -47,16 +48,32 @@ class TopicForm(forms.ModelForm):
 # Note Form (with TinyMCE)
 # ============================
 class NoteForm(forms.ModelForm):
+    # Stored as a content-addressed blob (notes.blobs), not a model field
+    file_upload = forms.FileField(
+        required=False, widget=forms.FileInput(attrs={'class': 'form-control'}),
+    )
+
     class Meta:
         model = Note
-        fields = ('title', 'content', 'file_upload', 'is_public')
+        fields = ('title', 'content', 'is_public')
         widgets = {
             'title': forms.TextInput(attrs={'class': 'form-control'}),
             'content': TinyMCE(attrs={'cols': 80, 'rows': 30}),
-            'file_upload': forms.FileInput(attrs={'class': 'form-control'}),
             'is_public': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
 
+    def save(self, commit=True):
+        note = super().save(commit)
+        if commit:
+            self.save_attachment()
+        return note
+
+    def save_attachment(self):
+        """Attach the uploaded file; call after saving with commit=False."""
+        uploaded = self.cleaned_data.get('file_upload')
+        if uploaded:
+            attach(self.instance, uploaded)
+
 
 # ============================
 # Task Form
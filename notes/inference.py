@@ -0,0 +1,257 @@
+"""
+HTTP client for the Hugging Face inference API.
+
+One pooled keep-alive ``requests.Session`` per process, exponential backoff
+with full jitter on 429/5xx (HF answers 503 while a model is loading), a
+circuit breaker that fails fast while the upstream is down, and latency
+histograms per outcome.
+"""
+import bisect
+import random
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+
+class InferenceError(Exception):
+    """The inference API could not produce a result."""
+
+
+class InferenceUnavailable(InferenceError):
+    """The circuit breaker is open; the request was not attempted."""
+
+
+# ============================================================
+# METRICS
+# ============================================================
+class LatencyHistogram:
+    # upper bounds in seconds; the last bucket catches everything slower
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "buckets": {
+                ("+Inf" if bound == float("inf") else str(bound)): n
+                for bound, n in zip(self.BUCKETS, self.counts)
+            },
+        }
+
+
+# ============================================================
+# CIRCUIT BREAKER
+# ============================================================
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold=5, cooldown=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self.opened_at < self.cooldown:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+
+            if self.state == self.HALF_OPEN:
+                # Let exactly one probe through
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+            self._trial_in_flight = False
+
+
+# ============================================================
+# CLIENT
+# ============================================================
+class InferenceClient:
+    RETRY_STATUSES = {429, 502, 503, 504}
+
+    def __init__(
+        self,
+        url,
+        token,
+        pool_size=10,
+        timeout=40,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_max=20,
+        breaker_threshold=5,
+        breaker_cooldown=30,
+    ):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json",
+        })
+
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.sleep = time.sleep
+
+        self._histograms = defaultdict(LatencyHistogram)
+        self._metrics_lock = threading.Lock()
+
+    def _observe(self, outcome, seconds):
+        with self._metrics_lock:
+            self._histograms[outcome].observe(seconds)
+
+    def metrics(self):
+        with self._metrics_lock:
+            latency = {name: h.snapshot() for name, h in self._histograms.items()}
+        return {"breaker": self.breaker.state, "latency": latency}
+
+    def backoff(self, attempt, hint=None):
+        """Full-jitter exponential backoff, never shorter than the server's hint."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if hint:
+            delay = max(delay, hint)
+        return min(delay, self.backoff_max)
+
+    @staticmethod
+    def _retry_hint(response):
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                return None
+
+        # HF "model is loading" responses carry an estimated_time
+        try:
+            return float(response.json().get("estimated_time"))
+        except (ValueError, TypeError, AttributeError):
+            return None
+
+    def post(self, payload):
+        if not self.token:
+            raise InferenceError("Hugging Face API token not configured.")
+
+        if not self.breaker.allow():
+            self._observe("circuit_open", 0)
+            raise InferenceUnavailable("Inference API is unavailable, try again later.")
+
+        error = None
+        for attempt in range(self.max_retries + 1):
+            hint = None
+            started = time.monotonic()
+
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            except requests.Timeout as e:
+                self._observe("timeout", time.monotonic() - started)
+                error = f"Request timed out: {e}"
+            except requests.RequestException as e:
+                self._observe("connection_error", time.monotonic() - started)
+                error = f"Connection failed: {e}"
+            else:
+                elapsed = time.monotonic() - started
+
+                if response.status_code in self.RETRY_STATUSES:
+                    self._observe("retryable_status", elapsed)
+                    hint = self._retry_hint(response)
+                    error = f"Inference API returned HTTP {response.status_code}"
+
+                elif response.status_code >= 400:
+                    self._observe("http_error", elapsed)
+                    if response.status_code >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        # Our request was bad; the upstream itself is healthy
+                        self.breaker.record_success()
+                    raise InferenceError(f"Inference API returned HTTP {response.status_code}")
+
+                else:
+                    try:
+                        result = response.json()
+                    except ValueError:
+                        self._observe("invalid_response", elapsed)
+                        self.breaker.record_failure()
+                        raise InferenceError("Inference API returned invalid JSON.")
+
+                    self._observe("success", elapsed)
+                    self.breaker.record_success()
+                    return result
+
+            if attempt < self.max_retries:
+                self.sleep(self.backoff(attempt, hint))
+
+        self.breaker.record_failure()
+        raise InferenceError(error)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide client built from settings.INFERENCE_CLIENT."""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                config = getattr(settings, "INFERENCE_CLIENT", {})
+                _client = InferenceClient(
+                    url=settings.HF_API_URL,
+                    token=settings.HF_API_TOKEN,
+                    pool_size=config.get("POOL_SIZE", 10),
+                    timeout=config.get("TIMEOUT", 40),
+                    max_retries=config.get("MAX_RETRIES", 3),
+                    backoff_base=config.get("BACKOFF_BASE", 0.5),
+                    backoff_max=config.get("BACKOFF_MAX", 20),
+                    breaker_threshold=config.get("BREAKER_THRESHOLD", 5),
+                    breaker_cooldown=config.get("BREAKER_COOLDOWN", 30),
+                )
+    return _client
@@ -0,0 +1,376 @@
+"""
+Offline keywords and extractive summaries.
+
+Keywords are a note's terms ranked by TF-IDF, where document frequencies are
+the user's own: ``KeywordFrequency`` holds, per user, how many of their notes
+contain each stemmed term (the row with the empty term counts the notes).
+It is kept up to date incrementally: a note's distinct terms are stored on
+its Summary, so when the note changes only the difference is applied.
+
+Extractive summaries are TextRank over sentences: sentences are TF-IDF
+vectors, edges their cosine similarity, and the top-ranked sentences are
+returned in document order. Similarities are accumulated through a term ->
+sentences postings list, so only sentence pairs sharing a term are touched.
+
+No network calls: this also serves as the summarizer's fallback when the
+inference API is unavailable.
+"""
+import heapq
+import json
+import math
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .ai_utils import SENTENCE_RE, content_hash, normalize_text
+from .models import KeywordFrequency, Note, Summary
+from .search import MAX_TERM_LENGTH, STOP_WORDS, TITLE_WEIGHT, TOKEN_RE, _stem, strip_html
+
+_config = getattr(settings, "KEYWORDS", {})
+
+KEYWORD_COUNT = _config.get("COUNT", 10)
+SUMMARY_SENTENCES = _config.get("SUMMARY_SENTENCES", 3)
+MAX_SENTENCES = _config.get("MAX_SENTENCES", 200)
+# Summarizer jobs fall back to an extractive summary when the API fails
+FALLBACK = _config.get("FALLBACK", True)
+BATCH_SIZE = 500
+
+MIN_WORD_LENGTH = 3
+DAMPING = 0.85
+MAX_ITERATIONS = 30
+TOLERANCE = 1e-4
+
+# KeywordFrequency row counting the user's notes
+DOCUMENTS = ""
+
+# Common words that make poor keywords (on top of search.STOP_WORDS)
+KEYWORD_STOP_WORDS = STOP_WORDS | frozenset("""
+    about after again all also any because been before being between both can
+    could did does doing done down during each even every few first get got
+    had having here how into just last like made make many may more most much
+    must new not now only other our out over own same see should since some
+    such than their them then there these they those through too under until
+    upon use used using very was way well were what when where which while who
+    why will would yet you your one two three per via
+""".split())
+
+
+# ============================================================
+# ANALYSIS
+# ============================================================
+class Document:
+    """Sentences of a text with their term counts."""
+
+    def __init__(self, sentences, bags, counts, words):
+        self.sentences = sentences
+        self.bags = bags          # per sentence: {term: count}
+        self.counts = counts      # whole text (title hits boosted)
+        self.words = words        # whole text: Counter of lowercased words
+
+    @property
+    def terms(self):
+        return sorted(self.counts)
+
+
+@lru_cache(maxsize=65536)
+def _term(word):
+    """Stemmed term of a lowercased word, or None when it cannot be a keyword."""
+    if len(word) < MIN_WORD_LENGTH or word in KEYWORD_STOP_WORDS or word.isdigit():
+        return None
+    return _stem(word)[:MAX_TERM_LENGTH]
+
+
+def _words(text):
+    return Counter(TOKEN_RE.findall(text.lower()))
+
+
+def _bag(words):
+    """{term: count} of a word Counter; each distinct word is looked up once."""
+    bag = {}
+    for word, n in words.items():
+        term = _term(word)
+        if term is not None:
+            bag[term] = bag.get(term, 0) + n
+    return bag
+
+
+def terms(text, title=""):
+    """Distinct terms of plain ``text`` and its title (what analyze().terms returns)."""
+    words = set(TOKEN_RE.findall(f"{title} {text}".lower()))
+    return sorted({_term(word) for word in words} - {None})
+
+
+def analyze(text, title=""):
+    """Split plain ``text`` into sentences and count their terms."""
+    text = normalize_text(text)
+    words = _words(text)
+    counts = Counter(_bag(words))
+
+    title_words = _words(title)
+    for term, n in _bag(title_words).items():
+        counts[term] += n * TITLE_WEIGHT
+    words.update(title_words)
+
+    # Keywords use the whole text; only the first MAX_SENTENCES are ranked
+    sentences = [s for s in SENTENCE_RE.split(text) if s][:MAX_SENTENCES]
+    bags = [_bag(_words(sentence)) for sentence in sentences]
+
+    return Document(sentences, bags, counts, words)
+
+
+def _idf(frequencies, documents):
+    def idf(term):
+        return math.log((1 + documents) / (1 + frequencies.get(term, 0))) + 1
+    return idf
+
+
+# ============================================================
+# SCORING
+# ============================================================
+def keywords(document, frequencies, documents, limit=KEYWORD_COUNT):
+    """The ``limit`` highest TF-IDF terms, as the word most used for each."""
+    idf = _idf(frequencies, documents)
+    best = heapq.nlargest(
+        limit, document.counts.items(),
+        key=lambda item: ((1 + math.log(item[1])) * idf(item[0]), item[0]),
+    )
+    chosen = [term for term, _ in best]
+
+    # Show each term as the word it was most often written as
+    surface = {}
+    for word, n in document.words.items():
+        term = _term(word)
+        if term in surface:
+            if n > surface[term][0]:
+                surface[term] = (n, word)
+        elif term in chosen:
+            surface[term] = (n, word)
+    return [surface[term][1] for term in chosen]
+
+
+def _similarities(document, idf):
+    """Cosine similarity of every sentence pair sharing a term: {i: {j: sim}}."""
+    # Unit-length vectors, so a dot product is the cosine
+    idfs = {term: idf(term) for term in document.counts}
+    postings = defaultdict(list)
+    for index, bag in enumerate(document.bags):
+        weights = [(term, (1 + math.log(tf)) * idfs[term]) for term, tf in bag.items()]
+        norm = math.sqrt(sum(w * w for _, w in weights)) or 1.0
+        for term, weight in weights:
+            postings[term].append((index, weight / norm))
+
+    pairs = defaultdict(float)
+    for entries in postings.values():
+        for a, (i, wi) in enumerate(entries):
+            for j, wj in entries[a + 1:]:
+                pairs[i, j] += wi * wj
+
+    graph = defaultdict(dict)
+    for (i, j), similarity in pairs.items():
+        graph[i][j] = graph[j][i] = similarity
+    return graph
+
+
+def rank_sentences(document, frequencies, documents):
+    """TextRank score per sentence (PageRank over the similarity graph)."""
+    size = len(document.sentences)
+    if not size:
+        return []
+
+    graph = _similarities(document, _idf(frequencies, documents))
+    out_weight = {i: sum(row.values()) for i, row in graph.items()}
+    scores = [1.0 / size] * size
+    for _ in range(MAX_ITERATIONS):
+        updated = [(1 - DAMPING) / size] * size
+        for i, row in graph.items():
+            share = DAMPING * scores[i] / out_weight[i]
+            for j, similarity in row.items():
+                updated[j] += share * similarity
+        converged = max(abs(a - b) for a, b in zip(scores, updated)) < TOLERANCE
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+def extractive_summary(document, frequencies, documents, sentences=SUMMARY_SENTENCES):
+    """The ``sentences`` best-ranked sentences, in document order."""
+    if len(document.sentences) <= sentences:
+        return " ".join(document.sentences)
+
+    scores = rank_sentences(document, frequencies, documents)
+    best = heapq.nlargest(sentences, range(len(scores)), key=lambda i: (scores[i], -i))
+    return " ".join(document.sentences[i] for i in sorted(best))
+
+
+# ============================================================
+# DOCUMENT FREQUENCIES
+# ============================================================
+def document_frequencies(user_id):
+    """({term: notes containing it}, number of notes counted) for a user."""
+    frequencies = dict(
+        KeywordFrequency.objects.filter(user_id=user_id, count__gt=0).values_list("term", "count")
+    )
+    return frequencies, frequencies.pop(DOCUMENTS, 0)
+
+
+def apply_deltas(user_id, deltas):
+    """Add ``deltas`` ({term: change}) to the user's frequencies."""
+    deltas = {term: delta for term, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        KeywordFrequency.objects.bulk_create(
+            [KeywordFrequency(user_id=user_id, term=term) for term in deltas],
+            ignore_conflicts=True, batch_size=BATCH_SIZE,
+        )
+        # Mostly +1/-1: one UPDATE per distinct change, as in notes.bulk
+        groups = defaultdict(list)
+        for term, delta in deltas.items():
+            groups[delta].append(term)
+        for delta, terms in groups.items():
+            for start in range(0, len(terms), BATCH_SIZE):
+                KeywordFrequency.objects.filter(
+                    user_id=user_id, term__in=terms[start:start + BATCH_SIZE],
+                ).update(count=F("count") + delta)
+
+
+def _term_deltas(old_terms, new_terms):
+    deltas = Counter()
+    if old_terms is not None:
+        deltas.subtract(old_terms)
+        deltas[DOCUMENTS] -= 1
+    deltas.update(new_terms)
+    deltas[DOCUMENTS] += 1
+    return deltas
+
+
+def rebuild_frequencies(user_id):
+    """Recount the user's frequencies from the terms stored on their summaries."""
+    counts = Counter()
+    for counted in Summary.objects.filter(
+        note__owner_id=user_id, terms__isnull=False,
+    ).values_list("terms", flat=True).iterator():
+        counts.update(counted)
+        counts[DOCUMENTS] += 1
+
+    with transaction.atomic():
+        KeywordFrequency.objects.filter(user_id=user_id).delete()
+        KeywordFrequency.objects.bulk_create(
+            [KeywordFrequency(user_id=user_id, term=t, count=n) for t, n in counts.items()],
+            batch_size=BATCH_SIZE,
+        )
+
+
+# ============================================================
+# NOTES
+# ============================================================
+def _note_text(note):
+    return normalize_text(strip_html(note.content))
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def refresh_keywords(user_id, note_ids=None, force=False, batch_size=BATCH_SIZE):
+    """
+    Fill Summary.keywords for the user's notes (or those of ``note_ids``)
+    whose text changed since they were last processed (all of them with
+    ``force``) and return how many.
+
+    Two passes: the first brings the document frequencies up to date, the
+    second scores with them, so the first notes processed see the same
+    frequencies as the last. Notes without a model summary of their current
+    text get an extractive one.
+    """
+    notes = Note.objects.filter(owner_id=user_id).only("pk", "title", "content").order_by("pk")
+    if note_ids is not None:
+        notes = notes.filter(pk__in=note_ids)
+
+    stale = []
+    for batch in _batches(notes.iterator(chunk_size=batch_size), batch_size):
+        stored = {
+            note_id: (digest, counted)
+            for note_id, digest, counted in Summary.objects.filter(
+                note__in=[note.pk for note in batch],
+            ).values_list("note_id", "content_hash", "terms")
+        }
+        deltas = Counter()
+        for note in batch:
+            text = _note_text(note)
+            digest, counted = stored.get(note.pk, (None, None))
+            if not force and counted is not None and digest == content_hash(text):
+                continue
+            deltas.update(_term_deltas(counted, terms(text, note.title)))
+            stale.append(note.pk)
+        apply_deltas(user_id, deltas)
+
+    frequencies, documents = document_frequencies(user_id)
+    for start in range(0, len(stale), batch_size):
+        _write_summaries(notes.filter(pk__in=stale[start:start + batch_size]), frequencies, documents)
+    return len(stale)
+
+
+def _write_summaries(notes, frequencies, documents):
+    notes = list(notes)
+    existing = {
+        note_id: (pk, method, digest)
+        for pk, note_id, method, digest in Summary.objects.filter(note__in=notes).values_list(
+            "pk", "note_id", "method", "content_hash",
+        )
+    }
+
+    created, keep, replace = [], [], []
+    for note in notes:
+        text = _note_text(note)
+        digest = content_hash(text)
+        document = analyze(text, note.title)
+        found = keywords(document, frequencies, documents)
+
+        pk, method, summarised = existing.get(note.pk, (None, None, None))
+        if pk is None:
+            created.append(Summary(
+                note=note, keywords=found, terms=document.terms, content_hash=digest,
+                summary_text=extractive_summary(document, frequencies, documents),
+                method=Summary.METHOD_EXTRACTIVE,
+            ))
+        elif method == Summary.METHOD_MODEL and summarised == digest:
+            # A model summary of this text: only the keywords change
+            keep.append((json.dumps(found), json.dumps(document.terms), pk))
+        else:
+            replace.append((
+                json.dumps(found), json.dumps(document.terms),
+                extractive_summary(document, frequencies, documents),
+                Summary.METHOD_EXTRACTIVE, digest, pk,
+            ))
+
+    Summary.objects.bulk_create(created, batch_size=BATCH_SIZE)
+
+    # Per-row values: executemany instead of bulk_update's CASE per row
+    with connection.cursor() as cursor:
+        if keep:
+            cursor.executemany("UPDATE summaries SET keywords = %s, terms = %s WHERE id = %s", keep)
+        if replace:
+            cursor.executemany(
+                "UPDATE summaries SET keywords = %s, terms = %s, summary_text = %s, "
+                "method = %s, content_hash = %s WHERE id = %s",
+                replace,
+            )
+
+
+def summarize_offline(user_id, text):
+    """Extractive summary of plain ``text``, weighted by the user's frequencies."""
+    frequencies, documents = document_frequencies(user_id)
+    return extractive_summary(analyze(text), frequencies, documents)
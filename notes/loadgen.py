@@ -0,0 +1,158 @@
+"""
+Synthetic data for load testing.
+
+``generate()`` builds users × subjects × topics × notes plus collaborations,
+bookmarks and tasks with bulk inserts, then does once what the per-row
+signals would have done (counters, search and similarity indexes). Content
+sizes follow a log-normal distribution around ``content_size`` so a few
+notes are much larger than the rest, like real ones. The same ``seed`` gives
+the same data.
+"""
+import math
+import random
+from dataclasses import dataclass
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .models import Bookmark, Collaboration, CustomUser, Note, Subject, Task, Topic
+from .search import index_notes
+from . import similarity
+
+BATCH_SIZE = 2000
+PASSWORD = "loadtest"
+
+WORDS = (
+    "algorithm array binary cache compiler database entropy function graph "
+    "hash index kernel latency matrix network object protocol query recursion "
+    "schema thread vector memory process signal gradient theorem proof lemma "
+    "integral derivative equation enzyme protein cell membrane energy force "
+    "momentum velocity circuit voltage current market supply demand policy"
+).split()
+
+
+@dataclass
+class Scale:
+    users: int = 10
+    subjects: int = 5          # per user
+    topics: int = 4            # per subject
+    notes: int = 20            # per topic
+    collaborators: int = 2     # other users each subject is shared with
+    content_size: int = 2000   # median note content, in characters
+    bookmarks: float = 0.1     # fraction of a user's notes bookmarked
+    tasks: int = 10            # per user
+
+
+def _paragraphs(rng, size):
+    """Roughly ``size`` characters of HTML paragraphs."""
+    parts, length = [], 0
+    while length < size:
+        words = rng.choices(WORDS, k=rng.randint(20, 80))
+        paragraph = f"<p>{' '.join(words).capitalize()}.</p>"
+        parts.append(paragraph)
+        length += len(paragraph)
+    return "".join(parts)
+
+
+def _content_size(rng, median):
+    return max(50, int(rng.lognormvariate(math.log(median), 0.8)))
+
+
+def generate(scale, prefix="load", seed=0, index=True, stdout=None):
+    """
+    Create the data described by ``scale`` and return the created users.
+
+    Users are named ``{prefix}_{n}`` and share the password ``loadtest``.
+    Notes are built and inserted BATCH_SIZE at a time, so memory does not
+    grow with the number of notes.
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    with transaction.atomic():
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f"{prefix}_{n}", email=f"{prefix}_{n}@example.com", password=password)
+            for n in range(scale.users)
+        ])
+        log(f"users: {len(users)}")
+
+        subjects = Subject.objects.bulk_create([
+            Subject(name=f"Subject {s + 1}", description=_paragraphs(rng, 200), owner=user)
+            for user in users
+            for s in range(scale.subjects)
+        ], batch_size=BATCH_SIZE)
+        log(f"subjects: {len(subjects)}")
+
+        shares = min(scale.collaborators, len(users) - 1)
+        Collaboration.objects.bulk_create([
+            Collaboration(
+                subject=subject, user=other,
+                permission_level=rng.choice(("view", "view", "edit")),
+            )
+            for subject in subjects
+            for other in rng.sample([u for u in users if u.pk != subject.owner_id], shares)
+        ], batch_size=BATCH_SIZE)
+
+        topics = Topic.objects.bulk_create([
+            Topic(name=f"Topic {t + 1}", subject=subject, order=t)
+            for subject in subjects
+            for t in range(scale.topics)
+        ], batch_size=BATCH_SIZE)
+        log(f"topics: {len(topics)}")
+
+        owners = {subject.pk: subject.owner_id for subject in subjects}
+        created = bookmarked = 0
+        pending = []
+        for topic in topics:
+            owner_id = owners[topic.subject_id]
+            for n in range(scale.notes):
+                pending.append(Note(
+                    title=f"{topic.name} note {n + 1}",
+                    content=_paragraphs(rng, _content_size(rng, scale.content_size)),
+                    topic=topic,
+                    owner_id=owner_id,
+                    is_public=rng.random() < 0.1,
+                    is_read=rng.random() < 0.5,
+                    is_completed=rng.random() < 0.3,
+                ))
+            if len(pending) >= BATCH_SIZE:
+                bookmarked += _flush_notes(pending, scale, rng, index)
+                created += len(pending)
+                pending = []
+        bookmarked += _flush_notes(pending, scale, rng, index)
+        created += len(pending)
+        log(f"notes: {created}, bookmarks: {bookmarked}")
+
+        Task.objects.bulk_create([
+            Task(
+                title=f"Task {t + 1}", user=user, completed=rng.random() < 0.5,
+                description=_paragraphs(rng, 100),
+            )
+            for user in users
+            for t in range(scale.tasks)
+        ], batch_size=BATCH_SIZE)
+
+        Topic.objects.filter(subject__owner__in=users).rebuild_counters()
+        Subject.objects.filter(owner__in=users).rebuild_counters()
+
+    return users
+
+
+def _flush_notes(notes, scale, rng, index):
+    """Insert a batch of notes and its bookmarks; returns the bookmark count."""
+    if not notes:
+        return 0
+    Note.objects.bulk_create(notes, batch_size=BATCH_SIZE)
+    if index:
+        index_notes(notes)
+        similarity.index_notes(notes)
+    bookmarks = Bookmark.objects.bulk_create([
+        Bookmark(user_id=note.owner_id, note=note, page_position=rng.randint(0, 20))
+        for note in notes
+        if rng.random() < scale.bookmarks
+    ])
+    return len(bookmarks)
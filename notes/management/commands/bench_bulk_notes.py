@@ -0,0 +1,111 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from notes.bulk import MAX_OPERATIONS, apply_operations
+from notes.models import CustomUser, Note, Subject, Topic
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-note create/complete/delete (what the single-object views "
+        "do) with the batch path of /api/notes/bulk/. Runs in a transaction "
+        "that is rolled back, so it leaves no data behind."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--notes", type=int, default=10_000)
+        parser.add_argument("--batch-size", type=int, default=MAX_OPERATIONS)
+
+    def handle(self, *args, **options):
+        self.count = options["notes"]
+        self.batch_size = options["batch_size"]
+        self.rows = []
+
+        try:
+            with transaction.atomic():
+                user = CustomUser.objects.create_user("bench-bulk-notes", password=None)
+                subject = Subject.objects.create(name="Benchmark", owner=user)
+                self.topic = Topic.objects.create(name="Benchmark", subject=subject)
+                self.user = user
+
+                self.single()
+                self.batched()
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self.stdout.write(f"{'path':<8} {'phase':<9} {'seconds':>9} {'queries':>9} {'notes/s':>10}")
+        for path, phase, seconds, queries in self.rows:
+            rate = self.count / seconds if seconds else float("inf")
+            self.stdout.write(f"{path:<8} {phase:<9} {seconds:>9.2f} {queries:>9} {rate:>10.0f}")
+
+    def measure(self, path, phase, fn):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - started
+        self.rows.append((path, phase, elapsed, queries))
+        return result
+
+    # ----------------------------
+    # one object at a time
+    # ----------------------------
+    def single(self):
+        def create():
+            return [
+                Note.objects.create(
+                    title=f"single {i}", content="<p>benchmark</p>",
+                    topic=self.topic, owner=self.user,
+                )
+                for i in range(self.count)
+            ]
+
+        def complete():
+            for note in notes:
+                note.is_completed = True
+                note.save(update_fields=["is_completed", "updated_at"])
+
+        def delete():
+            for note in notes:
+                note.delete()
+
+        notes = self.measure("single", "create", create)
+        self.measure("single", "complete", complete)
+        self.measure("single", "delete", delete)
+
+    # ----------------------------
+    # batches of operations
+    # ----------------------------
+    def run_batches(self, operations):
+        results = []
+        for start in range(0, len(operations), self.batch_size):
+            results += apply_operations(self.user, operations[start:start + self.batch_size])
+        return results
+
+    def batched(self):
+        created = self.measure("batch", "create", lambda: self.run_batches([
+            {"op": "create", "topic": self.topic.pk, "title": f"batch {i}",
+             "content": "<p>benchmark</p>"}
+            for i in range(self.count)
+        ]))
+        ids = [r["id"] for r in created]
+
+        self.measure("batch", "complete", lambda: self.run_batches([
+            {"op": "complete", "id": pk} for pk in ids
+        ]))
+        self.measure("batch", "delete", lambda: self.run_batches([
+            {"op": "delete", "id": pk} for pk in ids
+        ]))
@@ -0,0 +1,215 @@
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from dataclasses import asdict, fields
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from notes.loadgen import Scale, generate
+from notes.models import Note
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, "benchmarks", "views.json")
+
+# Growth below these is noise, whatever the ratio
+TIME_SLACK_MS = 5
+MEMORY_SLACK_KB = 256
+
+# The scenarios clear the cache between runs: never the configured one
+BENCH_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "bench-views",
+    },
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate load data, drive the main views through the test client and "
+        "compare query counts with a JSON baseline; wall time and peak memory "
+        "are reported alongside. Runs in a transaction that is rolled back, "
+        "with a private in-memory cache."
+    )
+
+    def add_arguments(self, parser):
+        defaults = Scale()
+        for field in fields(Scale):
+            parser.add_argument(
+                f"--{field.name.replace('_', '-')}",
+                type=field.type,
+                default=getattr(defaults, field.name),
+            )
+        parser.add_argument("--runs", type=int, default=5, help="Warm runs per view.")
+        parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+        parser.add_argument(
+            "--update", action="store_true", help="Write the results as the new baseline.",
+        )
+        parser.add_argument(
+            "--tolerance", type=float, default=1.5,
+            help=(
+                "Time/memory growth over the baseline that gets noted (never "
+                "fails: they vary across machines); queries may not grow at all."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        scale = Scale(**{f.name: options[f.name] for f in fields(Scale)})
+        self.runs = options["runs"]
+
+        try:
+            with transaction.atomic(), override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                CACHES=BENCH_CACHES,
+            ):
+                try:
+                    users = generate(scale, prefix="bench", stdout=self.stdout)
+                    results = self.run_scenarios(users[0])
+                finally:
+                    cache.clear()
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        report = {"scale": asdict(scale), "results": results}
+        baseline = self.load(options["baseline"])
+        regressions = self.compare(report, baseline, options["tolerance"])
+
+        if options["update"]:
+            os.makedirs(os.path.dirname(options["baseline"]) or ".", exist_ok=True)
+            with open(options["baseline"], "w") as out:
+                json.dump(report, out, indent=2, sort_keys=True)
+                out.write("\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}."))
+        elif regressions:
+            raise CommandError(f"{len(regressions)} regression(s): " + "; ".join(regressions))
+
+    # ----------------------------
+    # scenarios
+    # ----------------------------
+    def scenarios(self, user):
+        notes = Note.objects.filter(owner=user)
+        largest = notes.order_by("-content").values_list("pk", flat=True).first()
+        selection = list(
+            notes.order_by("pk").values_list("pk", flat=True)[:settings.PDF_COMPILE["SYNC_LIMIT"]]
+        )
+
+        return [
+            ("dashboard", "get", reverse("dashboard"), None),
+            ("subject_list", "get", reverse("subject_list"), None),
+            ("note_list", "get", reverse("note_list"), None),
+            ("note_view", "get", reverse("note_view", args=[largest]), None),
+            ("pdf_compile", "get", reverse("pdf_compile"), None),
+            ("pdf_compile_post", "post", reverse("pdf_compile"), {"note_ids": selection}),
+            ("summarizer", "get", reverse("summarizer"), None),
+        ]
+
+    def request(self, client, method, url, data):
+        response = getattr(client, method)(url, data)
+        if response.status_code >= 400:
+            raise CommandError(f"{method.upper()} {url} returned {response.status_code}.")
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        else:
+            response.content
+        return response
+
+    def measure(self, fn):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+        return queries, elapsed
+
+    def run_scenarios(self, user):
+        client = Client()
+        client.force_login(user)
+        results = {}
+
+        for name, method, url, data in self.scenarios(user):
+            # Cold: empty cache, traced for peak memory
+            cache.clear()
+            client.force_login(user)
+            tracemalloc.start()
+            cold_queries, _ = self.measure(lambda: self.request(client, method, url, data))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            # Warm: timed without tracing
+            timings = []
+            for _ in range(self.runs):
+                warm_queries, elapsed = self.measure(lambda: self.request(client, method, url, data))
+                timings.append(elapsed)
+
+            results[name] = {
+                "queries_cold": cold_queries,
+                "queries_warm": warm_queries,
+                "time_ms": round(statistics.median(timings) * 1000, 2),
+                "peak_kb": round(peak / 1024, 1),
+            }
+        return results
+
+    # ----------------------------
+    # baseline
+    # ----------------------------
+    def load(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def compare(self, report, baseline, tolerance):
+        if baseline and baseline.get("scale") != report["scale"]:
+            self.stdout.write(self.style.WARNING(
+                "Baseline was recorded at a different scale; not comparing."
+            ))
+            baseline = None
+        previous = baseline["results"] if baseline else {}
+
+        regressions = []
+        self.stdout.write(
+            f"{'view':<18} {'cold q':>7} {'warm q':>7} {'ms':>9} {'peak KB':>9}  status"
+        )
+        for name, row in report["results"].items():
+            old = previous.get(name)
+            flags, notes = [], []
+            if old:
+                for key in ("queries_cold", "queries_warm"):
+                    if row[key] > old[key]:
+                        flags.append(f"{key} {old[key]} -> {row[key]}")
+                for key, slack in (("time_ms", TIME_SLACK_MS), ("peak_kb", MEMORY_SLACK_KB)):
+                    if row[key] > max(old[key] * tolerance, old[key] + slack):
+                        notes.append(f"{key} {old[key]} -> {row[key]}")
+
+            status = "new" if old is None else ("REGRESSED" if flags else "ok")
+            line = (
+                f"{name:<18} {row['queries_cold']:>7} {row['queries_warm']:>7} "
+                f"{row['time_ms']:>9.1f} {row['peak_kb']:>9.1f}  {status}"
+            )
+            if notes:
+                line += f" (slower: {', '.join(notes)})"
+            if flags:
+                line = self.style.ERROR(line)
+            elif notes:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
+            regressions += [f"{name}: {flag}" for flag in flags]
+        return regressions
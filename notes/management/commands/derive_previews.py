@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from notes.models import Blob
+from notes.previews import PDF_TYPES, derive_preview
+
+
+class Command(BaseCommand):
+    help = (
+        "Derive thumbnails and page text for PDF attachments that have none "
+        "(e.g. uploaded before previews existed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Rederive existing previews too.")
+
+    def handle(self, *args, **options):
+        blobs = Blob.objects.filter(content_type__in=PDF_TYPES, ref_count__gt=0)
+        if not options["force"]:
+            blobs = blobs.filter(preview__isnull=True)
+
+        derived = failed = 0
+        for digest in blobs.order_by("pk").values_list("pk", flat=True).iterator():
+            preview = derive_preview(digest, force=options["force"])
+            if preview is None:
+                continue
+            if preview.error:
+                failed += 1
+                self.stderr.write(f"{digest}: {preview.error}")
+            else:
+                derived += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Derived {derived} previews, {failed} unreadable."))
@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.corpus import CHUNK_SIZE, export_corpus
+from notes.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Export a user's subjects, topics, notes and bookmarks as NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--output", "-o", default="-", help="File to write (default: stdout).")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options["username"])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}.")
+
+        lines = export_corpus(user, chunk_size=options["chunk_size"])
+        if options["output"] == "-":
+            sys.stdout.writelines(lines)
+            return
+
+        with open(options["output"], "w", encoding="utf-8") as out:
+            out.writelines(lines)
+        self.stdout.write(self.style.SUCCESS(f"Exported {user.username} to {options['output']}."))
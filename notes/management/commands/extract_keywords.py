@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.keywords import BATCH_SIZE, rebuild_frequencies, refresh_keywords
+from notes.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill Summary.keywords (and extractive summaries where no model summary "
+        "exists) for notes whose text changed since the last run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only this username.")
+        parser.add_argument("--force", action="store_true", help="Reprocess unchanged notes too.")
+        parser.add_argument(
+            "--rebuild", action="store_true",
+            help="Recount document frequencies from the stored terms first.",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.filter(notes__isnull=False).distinct().order_by("pk")
+        if options["user"]:
+            users = CustomUser.objects.filter(username=options["user"])
+            if not users.exists():
+                raise CommandError(f"No user {options['user']!r}.")
+
+        started = time.perf_counter()
+        total = 0
+        for user_id in users.values_list("pk", flat=True):
+            if options["rebuild"]:
+                rebuild_frequencies(user_id)
+            total += refresh_keywords(
+                user_id, force=options["force"], batch_size=options["batch_size"],
+            )
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {total} notes in {elapsed:.1f}s ({rate:.0f} notes/s)."
+        ))
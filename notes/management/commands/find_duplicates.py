@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.models import CustomUser, Note
+from notes.similarity import DUPLICATE_THRESHOLD, duplicate_groups, index_notes
+
+
+class Command(BaseCommand):
+    help = "Report groups of near-duplicate notes (estimated Jaccard similarity)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only notes owned by this username.")
+        parser.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD)
+        parser.add_argument(
+            "--reindex", action="store_true",
+            help="Sign notes that have no signature yet (e.g. created before the index existed).",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        notes = Note.objects.all()
+        if options["user"]:
+            user = CustomUser.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user {options['user']!r}.")
+            notes = notes.filter(owner=user)
+
+        if options["reindex"]:
+            self.reindex(notes.filter(signature__isnull=True), options["batch_size"])
+
+        groups = duplicate_groups(notes, threshold=options["threshold"])
+        details = Note.objects.select_related("owner", "topic__subject").only(
+            "title", "owner__username", "topic__name", "topic__subject__name",
+        ).in_bulk([pk for group in groups for pk in group])
+
+        for number, group in enumerate(groups, start=1):
+            self.stdout.write(f"Group {number} ({len(group)} notes):")
+            for pk in group:
+                note = details[pk]
+                self.stdout.write(
+                    f"  #{pk} {note.title!r} by {note.owner.username} "
+                    f"in {note.topic.subject.name} / {note.topic.name}"
+                )
+
+        duplicates = sum(len(group) - 1 for group in groups)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(groups)} groups, {duplicates} redundant notes."
+        ))
+
+    def reindex(self, notes, batch_size):
+        batch = []
+        total = 0
+        for note in notes.only("pk", "content").order_by("pk").iterator(chunk_size=batch_size):
+            batch.append(note)
+            if len(batch) >= batch_size:
+                index_notes(batch)
+                total += len(batch)
+                batch = []
+        index_notes(batch)
+        total += len(batch)
+        self.stdout.write(f"Signed {total} notes.")
@@ -0,0 +1,40 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.corpus import CHUNK_SIZE, CorpusError, import_corpus
+from notes.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Import an NDJSON corpus (see export_notes) for a user. Everything is "
+        "created new and owned by that user; a malformed line rolls back the import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path", help="NDJSON file, or - for stdin.")
+        parser.add_argument("--batch-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options["username"])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}.")
+
+        started = time.perf_counter()
+        try:
+            if options["path"] == "-":
+                counts = import_corpus(user, sys.stdin, options["batch_size"])
+            else:
+                with open(options["path"], encoding="utf-8") as lines:
+                    counts = import_corpus(user, lines, options["batch_size"])
+        except (CorpusError, OSError) as e:
+            raise CommandError(str(e))
+
+        summary = ", ".join(f"{n} {kind}" for kind, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary} in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from notes.models import Subject, Topic
+
+
+class Command(BaseCommand):
+    help = "Recount the stored note/completed/read counters on subjects and topics."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--subject",
+            type=int,
+            nargs="*",
+            dest="subject_ids",
+            help="Only rebuild these subject ids (default: all).",
+        )
+
+    def handle(self, *args, **options):
+        subjects = Subject.objects.all()
+        topics = Topic.objects.all()
+
+        if options["subject_ids"]:
+            subjects = subjects.filter(pk__in=options["subject_ids"])
+            topics = topics.filter(subject_id__in=options["subject_ids"])
+
+        topic_rows = topics.rebuild_counters()
+        subject_rows = subjects.rebuild_counters()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt counters for {subject_rows} subjects and {topic_rows} topics."
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from notes.models import Note
+from notes.search import backend, index_notes
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for every note."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        notes = Note.objects.only("pk", "title", "content").order_by("pk")
+
+        batch = []
+        total = 0
+        for note in notes.iterator(chunk_size=batch_size):
+            batch.append(note)
+            if len(batch) >= batch_size:
+                index_notes(batch)
+                total += len(batch)
+                batch = []
+
+        index_notes(batch)
+        total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {total} notes ({backend()} backend)."
+        ))
@@ -0,0 +1,312 @@
+"""
+Per-request instrumentation.
+
+RequestMetricsMiddleware samples a fraction of requests and records, per
+view: wall time, query count and time (via a connection execute wrapper),
+the most repeated SQL statement (many runs of one statement with different
+parameters is the N+1 signature) and template render time (via
+TimedDjangoTemplates). Sampled responses to staff users get a Server-Timing
+header (every client with SERVER_TIMING; it reveals timings and query counts).
+
+Each process buffers its numbers and adds them to fixed-bucket histograms in
+the cache every few seconds with cache.incr, so every worker feeds the same
+totals; /internal/metrics reads them back and derives percentiles. Bodies of
+streaming responses are produced after the middleware returns and are not
+covered.
+"""
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.template.backends.django import DjangoTemplates
+
+CONFIG = getattr(settings, "REQUEST_METRICS", {})
+ENABLED = CONFIG.get("ENABLED", True)
+SAMPLE_RATE = CONFIG.get("SAMPLE_RATE", 1.0)
+# Server-Timing for every client rather than staff users only
+SERVER_TIMING = CONFIG.get("SERVER_TIMING", False)
+SLOW_MS = CONFIG.get("SLOW_MS", 500)
+DUPLICATE_THRESHOLD = CONFIG.get("DUPLICATE_THRESHOLD", 5)
+FLUSH_SECONDS = CONFIG.get("FLUSH_SECONDS", 10)
+
+# Histogram upper bounds; the last bucket is open-ended
+MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+HISTOGRAMS = {
+    "time_ms": MS_BUCKETS,
+    "db_ms": MS_BUCKETS,
+    "template_ms": MS_BUCKETS,
+    "queries": COUNT_BUCKETS,
+}
+COUNTERS = ("count", "slow", "n_plus_one", "errors")
+PERCENTILES = (50, 90, 99)
+
+SLOW_LOG_SIZE = 50
+KEY_PREFIX = "metrics:v1"
+VIEWS_KEY = f"{KEY_PREFIX}:views"
+SLOW_KEY = f"{KEY_PREFIX}:slow"
+
+_current = ContextVar("request_metrics", default=None)
+
+
+def _bucket(value, bounds):
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            return i
+    return len(bounds)
+
+
+def _counter_key(view, name):
+    return f"{KEY_PREFIX}:{view}:{name}"
+
+
+def _bucket_key(view, histogram, index):
+    return f"{KEY_PREFIX}:{view}:{histogram}:{index}"
+
+
+def _view_keys(view):
+    return [_counter_key(view, name) for name in COUNTERS] + [
+        _bucket_key(view, name, i)
+        for name, bounds in HISTOGRAMS.items()
+        for i in range(len(bounds) + 1)
+    ]
+
+
+# ============================================================
+# PER REQUEST
+# ============================================================
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def most_repeated(self):
+        """(sql, times) of the statement run most often, or (None, 0)."""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+    def summary(self, status_code):
+        sql, repeats = self.most_repeated()
+        time_ms = (time.perf_counter() - self.started) * 1000
+        return {
+            "time_ms": time_ms,
+            "db_ms": self.db_seconds * 1000,
+            "template_ms": self.template_seconds * 1000,
+            "queries": self.queries,
+            "repeated_sql": sql if repeats >= DUPLICATE_THRESHOLD else None,
+            "repeats": repeats,
+            "slow": time_ms >= SLOW_MS,
+            "error": status_code >= 500,
+        }
+
+
+def server_timing(summary):
+    parts = [
+        f'app;dur={summary["time_ms"]:.1f}',
+        f'db;dur={summary["db_ms"]:.1f};desc="{summary["queries"]} queries"',
+        f'tpl;dur={summary["template_ms"]:.1f}',
+    ]
+    if summary["repeated_sql"]:
+        parts.append(f'dup;desc="same query x{summary["repeats"]}"')
+    return ", ".join(parts)
+
+
+# ============================================================
+# AGGREGATION
+# ============================================================
+class _Buffer:
+    """Per-process deltas, pushed to the shared cache every FLUSH_SECONDS."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.deltas = Counter()
+        self.views = set()
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+        self.flushed = time.monotonic()
+
+    def add(self, view, summary):
+        with self.lock:
+            self.views.add(view)
+            self.deltas[_counter_key(view, "count")] += 1
+            self.deltas[_counter_key(view, "slow")] += summary["slow"]
+            self.deltas[_counter_key(view, "n_plus_one")] += bool(summary["repeated_sql"])
+            self.deltas[_counter_key(view, "errors")] += summary["error"]
+            for name, bounds in HISTOGRAMS.items():
+                self.deltas[_bucket_key(view, name, _bucket(summary[name], bounds))] += 1
+
+            if summary["slow"] or summary["repeated_sql"]:
+                self.slow.append({
+                    "view": view,
+                    "time_ms": round(summary["time_ms"], 1),
+                    "queries": summary["queries"],
+                    "repeats": summary["repeats"],
+                    "repeated_sql": (summary["repeated_sql"] or "")[:300] or None,
+                    "at": time.time(),
+                })
+
+            due = time.monotonic() - self.flushed >= FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            deltas, self.deltas = self.deltas, Counter()
+            views, self.views = self.views, set()
+            slow = list(self.slow)
+            self.slow.clear()
+            self.flushed = time.monotonic()
+
+        for key, delta in deltas.items():
+            if not delta:
+                continue
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                if not cache.add(key, delta, None):
+                    cache.incr(key, delta)
+
+        # Rarely changing, so read-modify-write is good enough
+        known = cache.get(VIEWS_KEY) or []
+        if not views.issubset(known):
+            cache.set(VIEWS_KEY, sorted(views.union(known)), None)
+        if slow:
+            recent = (cache.get(SLOW_KEY) or []) + slow
+            cache.set(SLOW_KEY, recent[-SLOW_LOG_SIZE:], None)
+
+
+_buffer = _Buffer()
+
+
+def record(view, summary):
+    _buffer.add(view, summary)
+
+
+def _percentile(counts, bounds, percentile):
+    """Upper bound of the bucket holding the percentile (None when empty)."""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = total * percentile / 100
+    seen = 0
+    for i, n in enumerate(counts):
+        seen += n
+        if seen >= rank:
+            return bounds[i] if i < len(bounds) else "+inf"
+    return None
+
+
+def snapshot():
+    """Aggregated metrics of every process, per view."""
+    _buffer.flush()
+
+    views = cache.get(VIEWS_KEY) or []
+    values = cache.get_many([key for view in views for key in _view_keys(view)])
+
+    result = {}
+    for view in views:
+        row = {name: values.get(_counter_key(view, name), 0) for name in COUNTERS}
+        for name, bounds in HISTOGRAMS.items():
+            counts = [values.get(_bucket_key(view, name, i), 0) for i in range(len(bounds) + 1)]
+            row[name] = {
+                **{f"p{p}": _percentile(counts, bounds, p) for p in PERCENTILES},
+                "buckets": dict(zip([*map(str, bounds), "+inf"], counts)),
+            }
+        result[view] = row
+
+    return {
+        "sample_rate": SAMPLE_RATE,
+        "views": result,
+        "recent_slow": cache.get(SLOW_KEY) or [],
+    }
+
+
+def reset():
+    """Drop the shared totals (and this process's unflushed ones)."""
+    with _buffer.lock:
+        _buffer.deltas.clear()
+        _buffer.views.clear()
+        _buffer.slow.clear()
+    views = cache.get(VIEWS_KEY) or []
+    cache.delete_many(
+        [VIEWS_KEY, SLOW_KEY] + [key for view in views for key in _view_keys(view)]
+    )
+
+
+# ============================================================
+# MIDDLEWARE / TEMPLATE BACKEND
+# ============================================================
+def _is_staff(request):
+    user = getattr(request, "user", None)
+    return user is not None and user.is_staff
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not ENABLED or random.random() >= SAMPLE_RATE:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else None
+        if view and view != "internal_metrics":
+            summary = metrics.summary(response.status_code)
+            record(view, summary)
+            if SERVER_TIMING or _is_staff(request):
+                response["Server-Timing"] = server_timing(summary)
+        return response
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates that adds top-level render time to the request metrics."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:06
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Note = apps.get_model('notes', 'Note')
+
+    def counted(lookup, **extra):
+        notes = (
+            Note.objects.filter(**{lookup: OuterRef('pk')}, **extra)
+            .order_by()
+            .values(lookup)
+            .annotate(c=Count('pk'))
+            .values('c')
+        )
+        return Coalesce(Subquery(notes), 0)
+
+    for model, lookup in (('Topic', 'topic'), ('Subject', 'topic__subject')):
+        apps.get_model('notes', model).objects.update(
+            note_count=counted(lookup),
+            completed_count=counted(lookup, is_completed=True),
+            read_count=counted(lookup, is_read=True),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0003_note_is_completed'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='subject',
+            name='progress',
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='completed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='note_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='read_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='completed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='note_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='topic',
+            name='read_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_search_vector(apps, schema_editor):
+    # tsvector + GIN only exist on PostgreSQL; elsewhere notes.search falls
+    # back to the search_index table.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute("ALTER TABLE notes ADD COLUMN search_vector tsvector")
+    schema_editor.execute(
+        "UPDATE notes SET search_vector = "
+        "setweight(to_tsvector('english', title), 'A') || "
+        "setweight(to_tsvector('english', regexp_replace(content, '<[^>]+>', ' ', 'g')), 'B')"
+    )
+    schema_editor.execute(
+        "CREATE INDEX notes_search_vector_gin ON notes USING gin (search_vector)"
+    )
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute("DROP INDEX IF EXISTS notes_search_vector_gin")
+    schema_editor.execute("ALTER TABLE notes DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_note_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='notes.note')),
+            ],
+            options={
+                'db_table': 'search_index',
+                'unique_together': {('term', 'note')},
+            },
+        ),
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
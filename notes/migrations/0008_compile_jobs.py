@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:24
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0007_summary_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompileJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('note_ids', models.JSONField(default=list)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('artifact', models.FileField(blank=True, upload_to='compiled/%Y/%m/')),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compile_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'compile_jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'fingerprint'], name='compile_jobs_user_fp_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0008_compile_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_delta', models.SmallIntegerField(default=0)),
+                ('read_delta', models.SmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='notes.topic')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'progress_events',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProgressSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('completed_delta', models.IntegerField(default=0)),
+                ('read_delta', models.IntegerField(default=0)),
+                ('completed_total', models.IntegerField(default=0)),
+                ('read_total', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_snapshots', to='notes.subject')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'progress_snapshots',
+                'indexes': [models.Index(fields=['user', 'date'], name='progress_snap_user_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'subject', 'date'), name='progress_snapshot_unique_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0009_progress_history'),
+    ]
+
+    # Composite indexes first, then drop the single-column FK indexes they
+    # make redundant, so no lookup is ever left without an index
+    operations = [
+        migrations.AddIndex(
+            model_name='collaboration',
+            index=models.Index(fields=['user', 'subject'], name='collab_user_subject_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=models.Index(fields=['topic', '-created_at'], name='notes_topic_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(fields=['owner', '-created_at'], name='subjects_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('completed', False)), fields=['user', 'due_date', '-created_at', '-id'], name='tasks_user_pending_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='topic',
+            index=models.Index(fields=['subject', 'order', 'created_at'], name='topics_subject_order_idx'),
+        ),
+        migrations.AlterField(
+            model_name='collaboration',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='note',
+            name='topic',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notes', to='notes.topic'),
+        ),
+        migrations.AlterField(
+            model_name='subject',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='subjects', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='topic',
+            name='subject',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='topics', to='notes.subject'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0010_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='method',
+            field=models.CharField(choices=[('model', 'Model'), ('extractive', 'Extractive')], default='model', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='terms',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='KeywordFrequency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='keyword_frequencies', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'keyword_frequencies',
+                'unique_together': {('user', 'term')},
+            },
+        ),
+    ]
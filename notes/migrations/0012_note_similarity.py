@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0011_keywords'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NoteSignature',
+            fields=[
+                ('note', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='notes.note')),
+                ('minhash', models.JSONField()),
+            ],
+            options={
+                'db_table': 'note_signatures',
+            },
+        ),
+        migrations.CreateModel(
+            name='NoteBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField()),
+                ('key', models.BigIntegerField()),
+                ('note', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lsh_buckets', to='notes.note')),
+            ],
+            options={
+                'db_table': 'note_lsh_buckets',
+                'indexes': [models.Index(fields=['band', 'key', 'note'], name='lsh_band_key_note_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:19
+
+import hashlib
+import mimetypes
+import os
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def move_uploads_to_blobs(apps, schema_editor):
+    """Copy each existing upload into content-addressed storage (originals are kept)."""
+    Note = apps.get_model('notes', 'Note')
+    Blob = apps.get_model('notes', 'Blob')
+
+    for note in Note.objects.exclude(file_upload='').only('pk', 'file_upload').iterator():
+        name = note.file_upload.name
+        if not default_storage.exists(name):
+            continue
+
+        hasher = hashlib.sha256()
+        with default_storage.open(name, 'rb') as source:
+            for chunk in source.chunks():
+                hasher.update(chunk)
+            digest = hasher.hexdigest()
+            blob_name = f'blobs/{digest[:2]}/{digest[2:4]}/{digest}'
+            if not default_storage.exists(blob_name):
+                source.seek(0)
+                default_storage.save(blob_name, source)
+
+        blob, _ = Blob.objects.get_or_create(pk=digest, defaults={
+            'file': blob_name,
+            'size': default_storage.size(name),
+            'content_type': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        })
+        Note.objects.filter(pk=note.pk).update(
+            attachment=blob, attachment_name=os.path.basename(name)[:255],
+        )
+
+    Blob.objects.update(
+        ref_count=Coalesce(Subquery(
+            Note.objects.filter(attachment=OuterRef('pk'))
+            .order_by().values('attachment').annotate(c=Count('pk')).values('c')
+        ), 0),
+        released_at=None,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0012_note_similarity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='attachment_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('size', models.BigIntegerField()),
+                ('content_type', models.CharField(default='application/octet-stream', max_length=100)),
+                ('ref_count', models.IntegerField(default=0)),
+                ('released_at', models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'blobs',
+                'indexes': [models.Index(condition=models.Q(('ref_count__lte', 0)), fields=['released_at'], name='blobs_released_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='attachment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='notes', to='notes.blob'),
+        ),
+        migrations.RunPython(move_uploads_to_blobs, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='note',
+            name='file_upload',
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0013_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlobPreview',
+            fields=[
+                ('blob', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='preview', serialize=False, to='notes.blob')),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('thumbnail', models.BinaryField(blank=True, default=b'')),
+                ('page_offsets', models.JSONField(default=list)),
+                ('text', models.BinaryField(blank=True, default=b'')),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'blob_previews',
+            },
+        ),
+    ]
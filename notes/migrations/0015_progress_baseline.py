@@ -0,0 +1,80 @@
+import datetime
+
+from django.db import migrations
+from django.db.models import Count, F, Min, Q, Sum
+from django.utils import timezone
+
+
+def seed_progress_baseline(apps, schema_editor):
+    """
+    One snapshot per (user, subject) holding what the history does not
+    account for: notes completed/read before progress events existed (and
+    deletes that were not recorded). It is dated before anything recorded so
+    far, and later snapshots' running totals are shifted by it.
+    """
+    Note = apps.get_model('notes', 'Note')
+    ProgressEvent = apps.get_model('notes', 'ProgressEvent')
+    ProgressSnapshot = apps.get_model('notes', 'ProgressSnapshot')
+
+    current = {
+        (row['owner_id'], row['topic__subject_id']): [row['completed'], row['read']]
+        for row in Note.objects.order_by().values('owner_id', 'topic__subject_id').annotate(
+            completed=Count('pk', filter=Q(is_completed=True)),
+            read=Count('pk', filter=Q(is_read=True)),
+        )
+    }
+
+    # Recorded so far: the latest snapshot totals plus pending events
+    recorded = {}
+    for snapshot in ProgressSnapshot.objects.order_by('user_id', 'subject_id', 'date'):
+        recorded[(snapshot.user_id, snapshot.subject_id)] = [
+            snapshot.completed_total, snapshot.read_total,
+        ]
+    for row in ProgressEvent.objects.order_by().values('user_id', 'topic__subject_id').annotate(
+        completed=Sum('completed_delta'), read=Sum('read_delta'),
+    ):
+        totals = recorded.setdefault((row['user_id'], row['topic__subject_id']), [0, 0])
+        totals[0] += row['completed']
+        totals[1] += row['read']
+
+    first_day = {
+        (row['user_id'], row['subject_id']): row['first']
+        for row in ProgressSnapshot.objects.order_by().values('user_id', 'subject_id').annotate(
+            first=Min('date'),
+        )
+    }
+    today = timezone.localdate()
+
+    baseline = []
+    for key in current.keys() | recorded.keys():
+        completed, read = current.get(key, [0, 0])
+        done, seen = recorded.get(key, [0, 0])
+        completed, read = completed - done, read - seen
+        if not (completed or read):
+            continue
+
+        user_id, subject_id = key
+        day = min(first_day.get(key, today), today) - datetime.timedelta(days=1)
+        baseline.append(ProgressSnapshot(
+            user_id=user_id, subject_id=subject_id, date=day,
+            completed_delta=completed, read_delta=read,
+            completed_total=completed, read_total=read,
+        ))
+        later = ProgressSnapshot.objects.filter(user_id=user_id, subject_id=subject_id)
+        later.update(
+            completed_total=F('completed_total') + completed,
+            read_total=F('read_total') + read,
+        )
+
+    ProgressSnapshot.objects.bulk_create(baseline, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0014_blob_previews'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_progress_baseline, migrations.RunPython.noop),
+    ]
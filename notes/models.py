@@ -1,6 +1,14 @@
+import uuid
+import zlib
+
 from django.db import models
+from django.db.models import (
+    Case, Count, Exists, F, IntegerField, OuterRef, Prefetch, Q, Subquery, Value, When
+)
+from django.db.models.functions import Coalesce, Substr
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 
 # ============================
@@ -24,6 +32,95 @@ class CustomUser(AbstractUser):
         return f"{self.username} ({self.get_role_display()})"
 
 
+# ============================
+# Counter helpers
+# ============================
+COUNTER_FIELDS = ('note_count', 'completed_count', 'read_count')
+
+
+def note_counter_subqueries(**outer):
+    """
+    Correlated COUNT subqueries for note_count / completed_count / read_count.
+    ``outer`` maps a Note lookup to the outer row, e.g. topic=OuterRef('pk').
+    """
+    def counted(**extra):
+        notes = (
+            Note.objects.filter(**outer, **extra)
+            .order_by()
+            .values(*outer)
+            .annotate(c=Count('pk'))
+            .values('c')
+        )
+        return Coalesce(Subquery(notes), 0)
+
+    return {
+        'note_count': counted(),
+        'completed_count': counted(is_completed=True),
+        'read_count': counted(is_read=True),
+    }
+
+
+class CounterQuerySetMixin:
+
+    # Note lookup pointing at this model, overridden by subclasses
+    note_lookup = None
+
+    def rebuild_counters(self):
+        """Recount stored note counters for every row in a single UPDATE."""
+        return self.update(
+            **note_counter_subqueries(**{self.note_lookup: OuterRef('pk')})
+        )
+
+    def adjust_counters(self, **deltas):
+        """Atomically shift counters by the given deltas (F-expression update)."""
+        changes = {
+            field: F(field) + delta
+            for field, delta in deltas.items()
+            if delta
+        }
+        if changes:
+            self.update(**changes)
+
+
+# ============================
+# Subject QuerySet
+# ============================
+class SubjectQuerySet(CounterQuerySetMixin, models.QuerySet):
+
+    note_lookup = 'topic__subject'
+
+    def visible_to(self, user):
+        """Subjects the user owns or has been invited to collaborate on."""
+        shared_ids = Collaboration.objects.filter(user=user).values('subject_id')
+        return self.filter(Q(owner=user) | Q(pk__in=shared_ids))
+
+    def with_progress(self, user):
+        """
+        Annotate total_notes, completed_notes, topic_count and progress_percent
+        for every subject in a single grouped query.
+
+        Owned subjects only count the user's own notes, shared subjects count
+        every note in the subject (same rules the subject list always used).
+        """
+        counted = Q(owner=user, topics__notes__owner=user) | ~Q(owner=user)
+
+        return self.annotate(
+            total_notes=Count('topics__notes', filter=counted),
+            completed_notes=Count(
+                'topics__notes',
+                filter=counted & Q(topics__notes__is_completed=True),
+            ),
+            topic_count=Count('topics', distinct=True),
+        ).annotate(
+            progress_percent=Case(
+                When(total_notes__gt=0,
+                     then=F('completed_notes') * 100 / F('total_notes')),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+        )
+
+
 # ============================
 # Subject Model
 # ============================
@@ -31,7 +128,8 @@ class Subject(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
 
-    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='subjects')
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='subjects',
+                              db_index=False)  # subjects_owner_created_idx
 
     collaborators = models.ManyToManyField(
         CustomUser,
@@ -42,30 +140,44 @@ class Subject(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    # Dashboard + Subject List uses this
-    progress = models.IntegerField(default=0)
+    # Denormalised counters, kept in sync by notes.signals
+    note_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    read_count = models.IntegerField(default=0)
+
+    objects = SubjectQuerySet.as_manager()
 
     class Meta:
         db_table = 'subjects'
         ordering = ['-created_at']
+        indexes = [
+            # "my subjects, newest first" (dashboard, lists, PDF picker)
+            models.Index(fields=['owner', '-created_at'], name='subjects_owner_created_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
-    # Auto update progress based on completed/read notes
-    def update_progress(self, user):
-        from .models import Note  # prevent circular import
+    # Dashboard uses this
+    @property
+    def progress(self):
+        if not self.note_count:
+            return 0
+        return int((self.completed_count / self.note_count) * 100)
 
-        total_notes = Note.objects.filter(topic__subject=self, owner=user).count()
-        completed = Note.objects.filter(
-            topic__subject=self, owner=user, is_read=True).count()
 
-        if total_notes == 0:
-            self.progress = 0
-        else:
-            self.progress = int((completed / total_notes) * 100)
+# ============================
+# Topic QuerySet
+# ============================
+class TopicQuerySet(CounterQuerySetMixin, models.QuerySet):
+
+    note_lookup = 'topic'
 
-        self.save()
+    def with_notes(self):
+        """subject_detail: each topic with its notes' titles and dates (2 queries)."""
+        return self.prefetch_related(
+            Prefetch('notes', queryset=Note.objects.only('title', 'created_at', 'topic_id'))
+        )
 
 
 # ============================
@@ -75,18 +187,135 @@ class Topic(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
 
-    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='topics')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='topics',
+                                db_index=False)  # topics_subject_order_idx
 
     order = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    note_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    read_count = models.IntegerField(default=0)
+
+    objects = TopicQuerySet.as_manager()
+
     class Meta:
         db_table = 'topics'
         ordering = ['order', 'created_at']
+        indexes = [
+            models.Index(fields=['subject', 'order', 'created_at'], name='topics_subject_order_idx'),
+        ]
 
     def __str__(self):
         return f"{self.subject.name} > {self.name}"
 
+    @property
+    def progress(self):
+        if not self.note_count:
+            return 0
+        return int((self.completed_count / self.note_count) * 100)
+
+
+# ============================
+# Note QuerySet
+# ============================
+# Characters of content loaded for note_list's excerpt: the template shows
+# 180 (truncatechars), and the extra ones tell it to add the ellipsis
+LISTING_EXCERPT_CHARS = 200
+
+
+class NoteQuerySet(models.QuerySet):
+
+    def for_listing(self):
+        """
+        note_list rows in one query: title, topic and subject names, an
+        excerpt instead of the full content, and whether anyone bookmarked it.
+        """
+        return (
+            self.select_related('topic__subject')
+            .only('title', 'created_at', 'topic__name', 'topic__subject__name')
+            .annotate(
+                excerpt=Substr('content', 1, LISTING_EXCERPT_CHARS),
+                bookmarked=Exists(Bookmark.objects.filter(note=OuterRef('pk'))),
+            )
+        )
+
+    def visible_to(self, user):
+        """Notes the user wrote, or that live in a subject they own or share."""
+        shared_ids = Collaboration.objects.filter(user=user).values('subject_id')
+        return self.filter(
+            Q(owner=user)
+            | Q(topic__subject__owner=user)
+            | Q(topic__subject_id__in=shared_ids)
+        )
+
+
+# ============================
+# Blob Model
+# ============================
+class Blob(models.Model):
+    """An uploaded file, stored once per content (notes.blobs)."""
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(max_length=255)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100, default='application/octet-stream')
+
+    # Notes pointing at this blob; unreferenced blobs are collected after a grace period
+    ref_count = models.IntegerField(default=0)
+    released_at = models.DateTimeField(null=True, blank=True, default=timezone.now)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'blobs'
+        indexes = [
+            models.Index(
+                fields=['released_at'], name='blobs_released_idx',
+                condition=Q(ref_count__lte=0),
+            ),
+        ]
+
+    def __str__(self):
+        return self.sha256
+
+
+class BlobPreview(models.Model):
+    """
+    What notes.previews derived from a PDF blob: a first-page thumbnail and
+    the text of each page, zlib-compressed as one UTF-8 string with
+    ``page_offsets[i]:page_offsets[i + 1]`` the byte range of page i.
+    """
+
+    blob = models.OneToOneField(
+        Blob, on_delete=models.CASCADE, primary_key=True, related_name='preview',
+    )
+    page_count = models.PositiveIntegerField(default=0)
+    thumbnail = models.BinaryField(blank=True, default=b'')  # JPEG
+    page_offsets = models.JSONField(default=list)
+    text = models.BinaryField(blank=True, default=b'')
+    # Set when the file could not be read; the blob is not retried
+    error = models.CharField(max_length=255, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'blob_previews'
+
+    def __str__(self):
+        return f"Preview of {self.blob_id}"
+
+    def page_text(self, number):
+        """Text of page ``number`` (0-based), decompressing only up to its end."""
+        if not 0 <= number < len(self.page_offsets) - 1:
+            return ''
+        start, stop = self.page_offsets[number], self.page_offsets[number + 1]
+        data = zlib.decompressobj().decompress(bytes(self.text), stop)
+        return data[start:stop].decode()
+
+    def full_text(self):
+        return zlib.decompress(self.text).decode() if self.text else ''
+
 
 # ============================
 # Note Model
@@ -94,9 +323,15 @@ class Topic(models.Model):
 class Note(models.Model):
     title = models.CharField(max_length=255)
     content = models.TextField()
-    file_upload = models.FileField(upload_to='notes/', blank=True, null=True)
 
-    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='notes')
+    # Uploaded file, content-addressed; the name is the one it was uploaded under
+    attachment = models.ForeignKey(
+        Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='notes',
+    )
+    attachment_name = models.CharField(max_length=255, blank=True)
+
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='notes',
+                              db_index=False)  # notes_topic_created_idx
     owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notes')
 
     is_public = models.BooleanField(default=False)
@@ -112,13 +347,49 @@ class Note(models.Model):
     # FIXED
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = NoteQuerySet.as_manager()
+
     class Meta:
         db_table = 'notes'
         ordering = ['-created_at']
+        indexes = [
+            # keyset pagination of note_list
+            models.Index(fields=['owner', '-created_at', '-id'], name='notes_owner_created_idx'),
+            # a topic's notes, newest first (subject detail, PDF picker)
+            models.Index(fields=['topic', '-created_at'], name='notes_topic_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    # Fields that feed the Subject/Topic counters
+    COUNTER_STATE = ('topic_id', 'is_completed', 'is_read')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the persisted counter state so saves can emit +/-1 deltas
+        # without re-reading the row.
+        if all(f in instance.__dict__ for f in cls.COUNTER_STATE):
+            instance.remember_counter_state()
+        return instance
+
+    def remember_counter_state(self):
+        self._counter_state = self.counter_state()
+
+    def counter_state(self):
+        return tuple(getattr(self, f) for f in self.COUNTER_STATE)
+
+
+# ============================
+# Collaboration QuerySet
+# ============================
+class CollaborationQuerySet(models.QuerySet):
+
+    def with_users(self):
+        """collaboration_manage rows, collaborator name included."""
+        return self.select_related('user').only('permission_level', 'created_at', 'user__username')
+
 
 # ============================
 # Collaboration Model
@@ -130,19 +401,39 @@ class Collaboration(models.Model):
     ]
 
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE,
+                             db_index=False)  # collab_user_subject_idx
 
     permission_level = models.CharField(max_length=10, choices=PERMISSION_CHOICES, default='view')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = CollaborationQuerySet.as_manager()
+
     class Meta:
         db_table = 'collaborations'
         unique_together = ['subject', 'user']
+        indexes = [
+            # "subjects shared with me" reads only the index
+            models.Index(fields=['user', 'subject'], name='collab_user_subject_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.subject.name}"
 
 
+# ============================
+# Bookmark QuerySet
+# ============================
+class BookmarkQuerySet(models.QuerySet):
+
+    def with_notes(self):
+        """bookmark_list rows: the note's title, topic and subject, not its content."""
+        return self.select_related('note__topic__subject').only(
+            'page_position', 'created_at',
+            'note__title', 'note__topic__name', 'note__topic__subject__name',
+        )
+
+
 # ============================
 # Bookmark Model
 # ============================
@@ -153,14 +444,29 @@ class Bookmark(models.Model):
     page_position = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = BookmarkQuerySet.as_manager()
+
     class Meta:
         db_table = 'bookmarks'
         unique_together = ['user', 'note']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='bookmarks_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.note.title}"
 
 
+# ============================
+# Task QuerySet
+# ============================
+class TaskQuerySet(models.QuerySet):
+
+    def for_listing(self):
+        """task_list rows; the description is never shown there."""
+        return self.defer('description')
+
+
 # ============================
 # Task Model
 # ============================
@@ -174,9 +480,20 @@ class Task(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TaskQuerySet.as_manager()
+
     class Meta:
         db_table = 'tasks'
         ordering = ['due_date', '-created_at']
+        indexes = [
+            models.Index(fields=['user', 'due_date', '-created_at', '-id'], name='tasks_user_due_idx'),
+            # pending tasks only: dashboard's upcoming list and pending count
+            models.Index(
+                fields=['user', 'due_date', '-created_at', '-id'],
+                condition=Q(completed=False),
+                name='tasks_user_pending_due_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -204,13 +521,80 @@ class Progress(models.Model):
         return f"{self.user.username} - {self.completion_percentage}%"
 
 
+# ============================
+# Progress History
+# ============================
+class ProgressEvent(models.Model):
+    """
+    Append-only log of completion/read changes, consumed (and deleted) by
+    the periodic rollup into ProgressSnapshot.
+    """
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='+')
+    completed_delta = models.SmallIntegerField(default=0)
+    read_delta = models.SmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'progress_events'
+
+    def __str__(self):
+        return f"{self.user_id}/{self.topic_id}: {self.completed_delta:+d} completed"
+
+
+class ProgressSnapshot(models.Model):
+    """Per user, subject and day: that day's changes and the running totals."""
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='progress_snapshots')
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='progress_snapshots')
+    date = models.DateField()
+
+    completed_delta = models.IntegerField(default=0)
+    read_delta = models.IntegerField(default=0)
+    completed_total = models.IntegerField(default=0)
+    read_total = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'progress_snapshots'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'subject', 'date'], name='progress_snapshot_unique_day'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date'], name='progress_snap_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}/{self.subject_id} {self.date}: {self.completed_total}"
+
+
 # ============================
 # Summary Model
 # ============================
 class Summary(models.Model):
+    METHOD_MODEL = 'model'
+    METHOD_EXTRACTIVE = 'extractive'
+
+    METHOD_CHOICES = [
+        (METHOD_MODEL, 'Model'),
+        (METHOD_EXTRACTIVE, 'Extractive'),
+    ]
+
     note = models.OneToOneField(Note, on_delete=models.CASCADE, related_name='summary')
     summary_text = models.TextField()
     keywords = models.JSONField(default=list)
+    method = models.CharField(max_length=10, choices=METHOD_CHOICES, default=METHOD_MODEL)
+
+    # Distinct terms counted in KeywordFrequency; None until counted
+    terms = models.JSONField(null=True, blank=True)
+
+    # sha256 of the normalised text that was summarised
+    content_hash = models.CharField(max_length=64, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -218,3 +602,175 @@ class Summary(models.Model):
 
     def __str__(self):
         return f"Summary - {self.note.title}"
+
+
+# ============================
+# Summary Job Model
+# ============================
+class SummaryJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='summary_jobs')
+    note = models.ForeignKey(
+        Note, on_delete=models.CASCADE, null=True, blank=True, related_name='summary_jobs'
+    )
+
+    # Snapshot of the text at submit time, so the result always matches content_hash
+    input_text = models.TextField()
+    content_hash = models.CharField(max_length=64)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    result_text = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'summary_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['note', 'content_hash'], name='summary_jobs_note_hash_idx'),
+        ]
+
+    def __str__(self):
+        return f"SummaryJob {self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+
+# ============================
+# PDF Compile Jobs
+# ============================
+class CompileJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='compile_jobs')
+    note_ids = models.JSONField(default=list)
+
+    # Hash of the selected notes' ids, updated_at and headings; equal
+    # fingerprints render identical PDFs, so the artifact can be reused.
+    fingerprint = models.CharField(max_length=64)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    progress = models.PositiveSmallIntegerField(default=0)
+    artifact = models.FileField(upload_to='compiled/%Y/%m/', blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'compile_jobs'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'fingerprint'], name='compile_jobs_user_fp_idx'),
+        ]
+
+    def __str__(self):
+        return f"CompileJob {self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
+
+    def has_artifact(self):
+        return bool(self.artifact) and self.artifact.storage.exists(self.artifact.name)
+
+
+# ============================
+# Keyword Document Frequencies
+# ============================
+class KeywordFrequency(models.Model):
+    """Number of a user's notes containing ``term`` (notes.keywords)."""
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='keyword_frequencies',
+                             db_index=False)  # unique (user, term)
+    term = models.CharField(max_length=64)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'keyword_frequencies'
+        unique_together = ['user', 'term']
+
+    def __str__(self):
+        return f"{self.user_id}/{self.term}: {self.count}"
+
+
+# ============================
+# Note Similarity (notes.similarity)
+# ============================
+class NoteSignature(models.Model):
+    """MinHash signature of a note's text."""
+
+    note = models.OneToOneField(Note, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    minhash = models.JSONField()
+
+    class Meta:
+        db_table = 'note_signatures'
+
+    def __str__(self):
+        return f"signature of {self.note_id}"
+
+
+class NoteBucket(models.Model):
+    """One row per (LSH band, note): notes sharing a row are candidate matches."""
+
+    band = models.PositiveSmallIntegerField()
+    key = models.BigIntegerField()
+    note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name='lsh_buckets')
+
+    class Meta:
+        db_table = 'note_lsh_buckets'
+        indexes = [
+            # Covering: bucket lookups never touch the table
+            models.Index(fields=['band', 'key', 'note'], name='lsh_band_key_note_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.band}:{self.key} -> {self.note_id}"
+
+
+# ============================
+# Search Index (non-PostgreSQL fallback)
+# ============================
+class SearchIndexEntry(models.Model):
+    """One row per (term, note) of the inverted index used by notes.search."""
+
+    term = models.CharField(max_length=64)
+    note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name='search_entries')
+    weight = models.FloatField()
+
+    class Meta:
+        db_table = 'search_index'
+        unique_together = ['term', 'note']
+
+    def __str__(self):
+        return f"{self.term} -> {self.note_id}"
@@ -0,0 +1,126 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are selected with a WHERE clause on the ordering columns rather than
+OFFSET, so every page costs the same however deep the user scrolls, and rows
+inserted meanwhile never shift or duplicate entries. Cursors are signed so
+clients treat them as opaque.
+"""
+from django.core import signing
+from django.db.models import F, Q
+
+CURSOR_SALT = "notes.pagination"
+
+NOTE_ORDERING = ("-created_at", "-pk")
+BOOKMARK_ORDERING = ("-created_at", "-pk")
+TASK_ORDERING = ("due_date", "-created_at", "-pk")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by ``ordering`` (Django-style names, last one must
+    be unique, e.g. "-pk"). NULLs always sort last so the order is the same
+    on SQLite and PostgreSQL.
+    """
+
+    def __init__(self, queryset, ordering, per_page=25):
+        self.queryset = queryset
+        self.ordering = [
+            (name.lstrip("-"), name.startswith("-")) for name in ordering
+        ]
+        self.per_page = per_page
+
+    # ----------------------------
+    # cursors
+    # ----------------------------
+    def _field(self, name):
+        opts = self.queryset.model._meta
+        return opts.pk if name == "pk" else opts.get_field(name)
+
+    def encode_cursor(self, obj):
+        values = []
+        for name, _ in self.ordering:
+            value = getattr(obj, self._field(name).attname)
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        return signing.dumps(values, salt=CURSOR_SALT)
+
+    def decode_cursor(self, cursor):
+        try:
+            values = signing.loads(cursor, salt=CURSOR_SALT)
+        except signing.BadSignature:
+            raise InvalidCursor("Invalid cursor")
+
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor("Invalid cursor")
+
+        return [
+            None if value is None else self._field(name).to_python(value)
+            for (name, _), value in zip(self.ordering, values)
+        ]
+
+    # ----------------------------
+    # queries
+    # ----------------------------
+    def _after(self, name, descending, value):
+        """Rows strictly after ``value`` on a single key."""
+        if value is None:
+            # NULLs sort last: nothing comes after them on this key
+            return Q(pk__in=[])
+
+        after = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+        if self._field(name).null:
+            after |= Q(**{f"{name}__isnull": True})
+        return after
+
+    def _equal(self, name, value):
+        if value is None:
+            return Q(**{f"{name}__isnull": True})
+        return Q(**{name: value})
+
+    def _seek(self, values):
+        # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+        condition = Q(pk__in=[])
+        prefix = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            condition |= prefix & self._after(name, descending, value)
+            prefix &= self._equal(name, value)
+        return condition
+
+    def ordered(self):
+        return self.queryset.order_by(*[
+            F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_last=True)
+            for name, descending in self.ordering
+        ])
+
+    def page(self, cursor=None):
+        queryset = self.ordered()
+        if cursor:
+            queryset = queryset.filter(self._seek(self.decode_cursor(cursor)))
+
+        # Fetch one extra row to know whether another page exists
+        items = list(queryset[:self.per_page + 1])
+        has_next = len(items) > self.per_page
+        items = items[:self.per_page]
+
+        next_cursor = self.encode_cursor(items[-1]) if has_next else None
+        return KeysetPage(items, next_cursor)
@@ -0,0 +1,315 @@
+"""
+Compile notes into a PDF, streamed page by page.
+
+reportlab's canvas keeps the whole document in memory until ``save()``, so the
+file is written here directly: each page's content stream is emitted as soon
+as it is laid out, and only object offsets are kept for the xref table at the
+end. reportlab is used for font metrics and line wrapping.
+
+Laying out a note (HTML parsing + wrapping) is the expensive part; the
+resulting lines are cached per note, keyed by ``updated_at``.
+"""
+import hashlib
+import zlib
+from html.parser import HTMLParser
+
+from django.core.cache import cache
+
+from .models import Note
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US letter, points
+MARGIN = 50
+TEXT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+
+FRAGMENT_VERSION = 1
+FRAGMENT_TTL = 60 * 60 * 24 * 7
+BATCH_SIZE = 100
+
+FONTS = {"F1": "Helvetica", "F2": "Helvetica-Bold"}
+
+ORDERING = ("topic__subject__name", "topic__order", "created_at", "pk")
+
+# style -> (font resource, size, leading, space before)
+STYLES = {
+    "title": ("F2", 16, 20, 18),
+    "meta": ("F1", 9, 12, 2),
+    "heading": ("F2", 12, 15, 8),
+    "body": ("F1", 11, 14, 6),
+}
+
+
+# ============================================================
+# SELECTION
+# ============================================================
+def notes_for_compile(user, note_ids):
+    """The user's selected notes, in document order, with topic/subject joined."""
+    return (
+        Note.objects.filter(pk__in=note_ids, owner=user)
+        .select_related("topic__subject")
+        .order_by(*ORDERING)
+    )
+
+
+def selection_fingerprint(notes):
+    """
+    Hash of everything that affects the rendered PDF for ``notes``: ids,
+    updated_at and the subject/topic headings, in document order.
+    """
+    rows = notes.values_list("pk", "updated_at", "topic__subject__name", "topic__name")
+    digest = hashlib.sha256(f"v{FRAGMENT_VERSION}".encode())
+    for pk, updated_at, subject, topic in rows:
+        stamp = updated_at.isoformat() if updated_at else ""
+        digest.update(f"\0{pk}\0{stamp}\0{subject}\0{topic}".encode())
+    return digest.hexdigest()
+
+
+# ============================================================
+# HTML -> BLOCKS
+# ============================================================
+class _BlockExtractor(HTMLParser):
+    """Split TinyMCE HTML into (style, text) paragraphs."""
+
+    BLOCKS = {
+        "p", "div", "br", "li", "tr", "blockquote", "pre",
+        "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "table",
+    }
+    HEADINGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+    SKIP = {"script", "style"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self._parts = []
+        self._style = "body"
+        self._prefix = ""
+        self._skipping = 0
+
+    def _flush(self):
+        text = " ".join("".join(self._parts).split())
+        if text:
+            self.blocks.append((self._style, self._prefix + text))
+        self._parts = []
+        self._style = "body"
+        self._prefix = ""
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCKS:
+            self._flush()
+            if tag in self.HEADINGS:
+                self._style = "heading"
+            elif tag == "li":
+                self._prefix = "• "
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skipping:
+            self._skipping -= 1
+        elif tag in self.BLOCKS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self._parts.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def html_blocks(html):
+    parser = _BlockExtractor()
+    parser.feed(html or "")
+    parser.close()
+    return parser.blocks
+
+
+# ============================================================
+# FRAGMENTS
+# ============================================================
+def _wrap(style, text):
+    from reportlab.lib.utils import simpleSplit
+
+    font, size, _, _ = STYLES[style]
+    return simpleSplit(text, FONTS[font], size, TEXT_WIDTH) or [""]
+
+
+def _render_fragment(note):
+    """Wrapped body lines of a note as [(style, line, first_of_block), ...]."""
+    lines = []
+    for style, text in html_blocks(note.content):
+        for i, line in enumerate(_wrap(style, text)):
+            lines.append((style, line, i == 0))
+    return lines
+
+
+def fragment_key(note):
+    return (
+        f"pdf_fragment:v{FRAGMENT_VERSION}:{note.pk}:"
+        f"{note.updated_at.timestamp() if note.updated_at else 0}"
+    )
+
+
+def note_fragments(notes):
+    """Yield (note, lines) for each note, rendering only cache misses."""
+    keys = {fragment_key(note): note for note in notes}
+    cached = cache.get_many(list(keys))
+
+    missing = {}
+    for key, note in keys.items():
+        if key not in cached:
+            missing[key] = _render_fragment(note)
+    if missing:
+        cache.set_many(missing, FRAGMENT_TTL)
+
+    for key, note in keys.items():
+        # An empty note's fragment is [] (falsy) and still a hit
+        yield note, cached[key] if key in cached else missing[key]
+
+
+def _header(note):
+    lines = [("title", line, i == 0) for i, line in enumerate(_wrap("title", note.title))]
+    topic = note.topic
+    if topic is not None:
+        lines.append(("meta", f"{topic.subject.name} › {topic.name}", True))
+    return lines
+
+
+# ============================================================
+# PDF WRITER
+# ============================================================
+def _pdf_string(text):
+    raw = text.encode("cp1252", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class StreamingPdfWriter:
+    """
+    Minimal PDF 1.4 writer. ``add_page`` returns the bytes to send for that
+    page; ``close`` returns the trailer. Object 1 is the catalog and object 2
+    the page tree, which is written last once all kids are known.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.kids = []
+        self.next_id = 3 + len(FONTS)
+
+    def _object(self, number, body):
+        self.offsets[number] = self.offset
+        data = b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        self.offset += len(data)
+        return data
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def open(self):
+        out = [self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")]
+        out.append(self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>"))
+        for i, base in enumerate(FONTS.values()):
+            out.append(self._object(3 + i, (
+                b"<< /Type /Font /Subtype /Type1 /BaseFont /%s "
+                b"/Encoding /WinAnsiEncoding >>" % base.encode()
+            )))
+        return b"".join(out)
+
+    def add_page(self, content):
+        stream = zlib.compress(content)
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.kids.append(page_id)
+
+        fonts = b" ".join(
+            b"/%s %d 0 R" % (name.encode(), 3 + i) for i, name in enumerate(FONTS)
+        )
+        return self._object(content_id, (
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream)
+            + stream + b"\nendstream"
+        )) + self._object(page_id, (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << %s >> >> /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, fonts, content_id)
+        ))
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % kid for kid in self.kids)
+        out = self._object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.kids)))
+
+        xref_at = self.offset
+        xref = [b"xref\n0 %d\n" % self.next_id, b"0000000000 65535 f \n"]
+        xref += [b"%010d 00000 n \n" % self.offsets[n] for n in range(1, self.next_id)]
+        trailer = b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            self.next_id, xref_at,
+        )
+        return out + b"".join(xref) + trailer
+
+
+class _Page:
+    def __init__(self):
+        self.y = PAGE_HEIGHT - MARGIN
+        self.ops = []
+
+    def fits(self, height):
+        return self.y - height >= MARGIN
+
+    def draw(self, style, text, first):
+        font, size, leading, space_before = STYLES[style]
+        if first and self.ops:
+            self.y -= space_before
+        self.y -= leading
+        self.ops.append(b"BT /%s %d Tf %d %.2f Td %s Tj ET" % (
+            font.encode(), size, MARGIN, self.y, _pdf_string(text),
+        ))
+
+    def content(self):
+        return b"\n".join(self.ops)
+
+
+def _height(style, first):
+    _, _, leading, space_before = STYLES[style]
+    return leading + (space_before if first else 0)
+
+
+def compile_pdf(notes):
+    """
+    Yield the PDF for ``notes`` (an iterable of Note with topic/subject
+    loaded) in chunks of roughly one page.
+    """
+    writer = StreamingPdfWriter()
+    yield writer.open()
+
+    page = _Page()
+
+    def batches():
+        batch = []
+        for note in notes:
+            batch.append(note)
+            if len(batch) >= BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    for batch in batches():
+        for note, body in note_fragments(batch):
+            header = _header(note)
+
+            # Keep a title together with its first few lines
+            keep = header + body[:3]
+            if page.ops and not page.fits(sum(_height(s, f) for s, _, f in keep)):
+                yield writer.add_page(page.content())
+                page = _Page()
+
+            for style, line, first in header + body:
+                if not page.fits(_height(style, first and bool(page.ops))):
+                    yield writer.add_page(page.content())
+                    page = _Page()
+                page.draw(style, line, first)
+
+    if page.ops or not writer.kids:
+        yield writer.add_page(page.content())
+
+    yield writer.close()
@@ -0,0 +1,216 @@
+"""
+PDF text extraction.
+
+Uploads are streamed to a temporary file while being hashed (never read into
+memory whole; uploads the upload handler already spooled are used in place),
+page ranges are extracted in parallel in a process pool, and results are
+cached by file hash so re-uploading the same PDF is free.
+PyPDF2 is the default backend; pdfminer.six can be selected instead.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+_config = getattr(settings, "PDF_EXTRACTION", {})
+
+BACKEND = _config.get("BACKEND", "pypdf2")
+MAX_PAGES = _config.get("MAX_PAGES", 500)
+MAX_CHARS = _config.get("MAX_CHARS", 2_000_000)
+WORKERS = _config.get("WORKERS", 4)
+PAGES_PER_TASK = _config.get("PAGES_PER_TASK", 16)
+CACHE_TTL = _config.get("CACHE_TTL", 60 * 60 * 24 * 7)
+
+BACKENDS = ("pypdf2", "pdfminer")
+
+
+class PdfExtractionError(Exception):
+    """The upload is not a readable PDF."""
+
+
+# ============================================================
+# WORKERS (run in the process pool; must stay module-level)
+# ============================================================
+def _page_count(path):
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _extract_range(path, start, stop, backend, max_chars):
+    """Text of pages [start, stop), stopping once ``max_chars`` is reached."""
+    parts = []
+    size = 0
+
+    if backend == "pdfminer":
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+
+        for layout in extract_pages(path, page_numbers=range(start, stop)):
+            text = "".join(
+                element.get_text()
+                for element in layout
+                if isinstance(element, LTTextContainer)
+            )
+            parts.append(text)
+            size += len(text)
+            if size >= max_chars:
+                break
+    else:
+        from PyPDF2 import PdfReader
+
+        reader = PdfReader(path)
+        for number in range(start, stop):
+            text = reader.pages[number].extract_text() or ""
+            parts.append(text)
+            size += len(text)
+            if size >= max_chars:
+                break
+
+    return parts
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=WORKERS)
+    return _pool
+
+
+def _discard_pool(pool):
+    """Drop a broken pool so the next _get_pool starts a fresh one."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_in_pool(calls):
+    """
+    Results of ``calls`` ((function, *args) tuples) run in the pool. A pool
+    broken by a dead worker (OOM kill, segfault in a parser) is replaced and
+    the calls retried once.
+    """
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            futures = [pool.submit(*call) for call in calls]
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            if attempt:
+                raise
+
+
+# ============================================================
+# PUBLIC API
+# ============================================================
+@contextmanager
+def spool_upload(uploaded_file, directory=None):
+    """
+    (path, sha256) of an upload on disk. Uploads the upload handlers already
+    spooled (see notes.blobs.HashingUploadHandler) are used in place; others
+    are copied to a named temp file chunk by chunk, removed on exit.
+    """
+    from .blobs import file_digest  # not at import time: pool workers import this module
+
+    try:
+        path = uploaded_file.temporary_file_path()
+    except AttributeError:
+        path = None
+    if path is not None:
+        yield path, file_digest(uploaded_file)
+        return
+
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(suffix=".pdf", dir=directory, delete=False) as spool:
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            spool.write(chunk)
+    try:
+        yield spool.name, digest.hexdigest()
+    finally:
+        os.unlink(spool.name)
+
+
+def extract_pages(
+    path,
+    backend=BACKEND,
+    max_pages=MAX_PAGES,
+    max_chars=MAX_CHARS,
+    pages_per_task=PAGES_PER_TASK,
+    parallel=None,
+):
+    """
+    Text of each page of the PDF at ``path``, capped at ``max_pages`` pages
+    and ``max_chars`` characters in all. Page ranges of ``pages_per_task``
+    pages are extracted in the process pool when there is more than one.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend {backend!r}")
+
+    try:
+        pages = min(_page_count(path), max_pages)
+    except Exception as e:
+        raise PdfExtractionError(f"Could not read PDF: {e}") from e
+
+    ranges = [
+        (start, min(start + pages_per_task, pages))
+        for start in range(0, pages, pages_per_task)
+    ]
+    if parallel is None:
+        parallel = len(ranges) > 1
+
+    try:
+        if parallel:
+            chunks = _run_in_pool([
+                (_extract_range, path, start, stop, backend, max_chars)
+                for start, stop in ranges
+            ])
+        else:
+            chunks = [
+                _extract_range(path, start, stop, backend, max_chars)
+                for start, stop in ranges
+            ]
+    except Exception as e:
+        raise PdfExtractionError(f"Could not extract text: {e}") from e
+
+    pages, size = [], 0
+    for page in (page for chunk in chunks for page in chunk):
+        if size >= max_chars:
+            break
+        pages.append(page[:max_chars - size])
+        size += len(pages[-1])
+    return pages
+
+
+def extract_file(path, max_chars=MAX_CHARS, **kwargs):
+    """Text of the PDF at ``path``; see extract_pages for the options."""
+    text = "\n".join(extract_pages(path, max_chars=max_chars, **kwargs))
+    return text[:max_chars]
+
+
+def extract_pdf_text(uploaded_file, backend=BACKEND, max_pages=MAX_PAGES, max_chars=MAX_CHARS):
+    """Extract text from an uploaded PDF, reusing the cached result for identical files."""
+    with spool_upload(uploaded_file) as (path, digest):
+        key = f"pdf_text:{backend}:{max_pages}:{max_chars}:{digest}"
+        text = cache.get(key)
+        if text is None:
+            text = extract_file(path, backend=backend, max_pages=max_pages, max_chars=max_chars)
+            cache.set(key, text, CACHE_TTL)
+        return text
@@ -0,0 +1,117 @@
+"""
+Subject-level access resolution.
+
+A user's whole access map ({subject_id: "owner" | "edit" | "view"}) is loaded
+in one query, memoised on the request and cached across requests. The cache
+key embeds a per-user version that notes.signals bumps whenever the user's
+collaborations or owned subjects change; a bump orphans the old entry, so a
+reader that raced the change can never resurrect a stale map.
+"""
+from django.core.cache import cache
+from django.db.models import CharField, Value
+
+from .models import Collaboration, Subject
+
+VIEW = "view"
+EDIT = "edit"
+OWNER = "owner"
+
+RANK = {VIEW: 1, EDIT: 2, OWNER: 3}
+
+MAP_TTL = 60 * 60
+
+
+def _version_key(user_id):
+    return f"perm_version:{user_id}"
+
+
+def _map_key(user_id, version):
+    return f"perm_map:{user_id}:{version}"
+
+
+def _version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(*user_ids):
+    """Invalidate the cached access maps of ``user_ids``."""
+    for user_id in set(user_ids):
+        if not user_id:
+            continue
+        key = _version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # No version yet: anything cached was keyed on the default (1)
+            cache.add(key, 2, None)
+
+
+def load_access_map(user_id):
+    """{subject_id: level} for everything the user owns or collaborates on."""
+    owned = Subject.objects.filter(owner_id=user_id).order_by().values_list(
+        "pk", Value(OWNER, output_field=CharField())
+    )
+    shared = Collaboration.objects.filter(user_id=user_id).order_by().values_list(
+        "subject_id", "permission_level"
+    )
+    access = {}
+    for subject_id, level in shared.union(owned, all=True):
+        if RANK.get(level, 0) > RANK.get(access.get(subject_id), 0):
+            access[subject_id] = level
+    return access
+
+
+class PermissionResolver:
+    def __init__(self, user):
+        self.user = user
+        self._map = None
+
+    @property
+    def access_map(self):
+        if self._map is None:
+            version = _version(self.user.pk)
+            key = _map_key(self.user.pk, version)
+            self._map = cache.get(key)
+            if self._map is None:
+                self._map = load_access_map(self.user.pk)
+                cache.set(key, self._map, MAP_TTL)
+        return self._map
+
+    def level(self, subject_id):
+        return self.access_map.get(subject_id)
+
+    def has(self, subject_id, level):
+        return RANK.get(self.level(subject_id), 0) >= RANK[level]
+
+    def can_view_subject(self, subject_id):
+        return self.has(subject_id, VIEW)
+
+    def can_edit_subject(self, subject_id):
+        return self.has(subject_id, EDIT)
+
+    def can_view_note(self, note):
+        """``note.topic`` should be loaded (select_related) to stay query-free."""
+        if note.owner_id == self.user.pk or note.is_public:
+            return True
+        return self.can_view_subject(note.topic.subject_id)
+
+    def can_edit_note(self, note):
+        if note.owner_id == self.user.pk:
+            return True
+        return self.can_edit_subject(note.topic.subject_id)
+
+    def visible_notes(self, notes):
+        return [note for note in notes if self.can_view_note(note)]
+
+
+def get_resolver(request):
+    """The request's resolver, created on first use."""
+    resolver = getattr(request, "_permission_resolver", None)
+    if resolver is None or resolver.user != request.user:
+        resolver = request._permission_resolver = PermissionResolver(request.user)
+    return resolver
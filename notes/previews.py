@@ -0,0 +1,233 @@
+"""
+Derived data for PDF attachments: a first-page thumbnail and per-page text.
+
+Derivation runs once per blob (so once per distinct file, whatever the number
+of notes attaching it) from a celery task queued on Note save, and stores a
+``BlobPreview``. Page text comes from notes.pdf_extract, in its process pool
+for long files, with the thumbnail rendered in the pool alongside it.
+
+No PDF rasteriser is among the dependencies, so the thumbnail is the largest
+image embedded in the first page when there is a sizeable one, and otherwise
+a card with the first page's opening lines drawn by Pillow.
+
+Notes attaching the blob are reindexed for search once the text exists.
+"""
+import textwrap
+import zlib
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from io import BytesIO
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+
+from .models import Blob, BlobPreview, Note
+from .pdf_extract import (
+    MAX_CHARS, MAX_PAGES, PAGES_PER_TASK, PdfExtractionError, _get_pool, _run_in_pool,
+    extract_pages, spool_upload,
+)
+from .search import index_notes
+
+_config = getattr(settings, "PDF_PREVIEWS", {})
+
+THUMBNAIL_WIDTH = _config.get("THUMBNAIL_WIDTH", 240)
+THUMBNAIL_QUALITY = _config.get("THUMBNAIL_QUALITY", 80)
+# Embedded images smaller than this share of the thumbnail are not used
+MIN_IMAGE_SHARE = 0.25
+
+PDF_TYPES = ("application/pdf",)
+
+
+# ============================================================
+# THUMBNAILS (run in the process pool; must stay module-level)
+# ============================================================
+def _embedded_images(resources, depth=0):
+    """Image XObjects of a page, including those nested in form XObjects."""
+    xobjects = resources.get("/XObject") if resources else None
+    if not xobjects or depth > 3:
+        return
+    xobjects = xobjects.get_object()
+    for name in xobjects:
+        obj = xobjects[name].get_object()
+        subtype = obj.get("/Subtype")
+        if subtype == "/Image":
+            yield obj
+        elif subtype == "/Form" and "/Resources" in obj:
+            yield from _embedded_images(obj["/Resources"].get_object(), depth + 1)
+
+
+def _decode_image(obj):
+    """PIL image of an image XObject, or None for encodings not handled here."""
+    from PIL import Image
+
+    if obj.get("/Filter") == "/DCTDecode":
+        return Image.open(BytesIO(obj._data))  # already a JPEG
+
+    mode = {"/DeviceRGB": "RGB", "/DeviceGray": "L"}.get(obj.get("/ColorSpace"))
+    if mode is None or obj.get("/BitsPerComponent") != 8:
+        return None
+    return Image.frombytes(mode, (obj["/Width"], obj["/Height"]), obj.get_data())
+
+
+def _text_card(text, size):
+    from PIL import Image, ImageDraw, ImageFont
+
+    card = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(card)
+    font = ImageFont.load_default()
+    y = margin = size[0] // 12
+    for line in textwrap.wrap(" ".join(text.split()), width=size[0] // 7):
+        if y > size[1] - 2 * margin:
+            break
+        draw.text((margin, y), line, fill="#333333", font=font)
+        y += 13
+    return card
+
+
+def render_thumbnail(path, width=THUMBNAIL_WIDTH, quality=THUMBNAIL_QUALITY):
+    """JPEG thumbnail of the first page of the PDF at ``path``."""
+    from PyPDF2 import PdfReader
+
+    page = PdfReader(path).pages[0]
+    box = page.mediabox
+    ratio = float(box.height) / float(box.width) if float(box.width) else 1.4
+    size = (width, max(1, round(width * ratio)))
+
+    image = None
+    try:
+        candidates = [
+            obj for obj in _embedded_images(page.get("/Resources", {}).get_object())
+            if obj.get("/Width", 0) * obj.get("/Height", 0) >= MIN_IMAGE_SHARE * size[0] * size[1]
+        ]
+        if candidates:
+            image = _decode_image(max(candidates, key=lambda obj: obj["/Width"] * obj["/Height"]))
+    except Exception:
+        image = None  # an unreadable image still leaves the text card
+
+    if image is None:
+        image = _text_card(page.extract_text() or "", size)
+
+    image = image.convert("RGB")
+    image.thumbnail(size)
+    output = BytesIO()
+    image.save(output, "JPEG", quality=quality, optimize=True)
+    return output.getvalue()
+
+
+# ============================================================
+# DERIVATION
+# ============================================================
+def pack_pages(pages):
+    """(zlib-compressed text, byte offsets) of a list of page texts."""
+    offsets, encoded = [0], []
+    for page in pages:
+        data = page.encode()
+        encoded.append(data)
+        offsets.append(offsets[-1] + len(data))
+    return zlib.compress(b"".join(encoded), 6), offsets
+
+
+def derive_file(path, parallel=None, max_pages=MAX_PAGES, max_chars=MAX_CHARS):
+    """(page count, page texts, JPEG thumbnail) of the PDF at ``path``."""
+    from PyPDF2 import PdfReader
+
+    try:
+        page_count = min(len(PdfReader(path).pages), max_pages)
+    except Exception as e:
+        raise PdfExtractionError(f"Could not read PDF: {e}") from e
+    if parallel is None:
+        parallel = page_count > PAGES_PER_TASK
+
+    try:
+        future = None
+        if parallel:
+            try:
+                future = _get_pool().submit(render_thumbnail, path)
+            except BrokenProcessPool:
+                pass  # extract_pages replaces the pool; rendered on the new one below
+        pages = extract_pages(path, max_pages=max_pages, max_chars=max_chars, parallel=parallel)
+        try:
+            thumbnail = future.result() if future else None
+        except BrokenProcessPool:
+            thumbnail = None
+        if thumbnail is None and parallel:
+            (thumbnail,) = _run_in_pool([(render_thumbnail, path)])
+        elif thumbnail is None:
+            thumbnail = render_thumbnail(path)
+    except PdfExtractionError:
+        raise
+    except Exception as e:
+        raise PdfExtractionError(f"Could not render thumbnail: {e}") from e
+    return page_count, pages, thumbnail
+
+
+@contextmanager
+def _local_path(blob):
+    """A filesystem path holding the blob's bytes (spooled for remote storages)."""
+    try:
+        path = blob.file.path
+    except NotImplementedError:
+        path = None
+    if path is not None:
+        yield path
+        return
+
+    with blob.file.open("rb") as source, spool_upload(source) as (path, _):
+        yield path
+
+
+def needs_preview(digest):
+    """Whether blob ``digest`` is a PDF not derived yet."""
+    return bool(digest) and Blob.objects.filter(
+        pk=digest, content_type__in=PDF_TYPES, preview__isnull=True,
+    ).exists()
+
+
+def derive_preview(digest, force=False, parallel=None):
+    """
+    The BlobPreview of blob ``digest``, deriving it unless it exists (or
+    ``force``). None for blobs that are not PDFs.
+    """
+    blob = Blob.objects.filter(pk=digest).first()
+    if blob is None or blob.content_type not in PDF_TYPES:
+        return None
+    if not force:
+        existing = BlobPreview.objects.filter(blob=blob).first()
+        if existing is not None:
+            return existing
+
+    preview = BlobPreview(blob=blob)
+    try:
+        with _local_path(blob) as path:
+            preview.page_count, pages, preview.thumbnail = derive_file(path, parallel=parallel)
+        # Text past MAX_CHARS is not kept: later pages have no offsets
+        preview.text, preview.page_offsets = pack_pages(pages)
+    except (PdfExtractionError, OSError) as e:
+        preview.error = str(e)[:255]
+
+    try:
+        with transaction.atomic():
+            BlobPreview.objects.filter(blob=blob).delete()
+            preview.save(force_insert=True)
+    except IntegrityError:
+        # Derived concurrently by another worker; the result is the same
+        return BlobPreview.objects.get(blob=blob)
+
+    index_notes(Note.objects.filter(attachment=blob).only("pk", "title", "content"))
+    return preview
+
+
+# ============================================================
+# SERVING
+# ============================================================
+def serve_thumbnail(request, preview):
+    """The preview's thumbnail, with the blob digest as a strong ETag."""
+    etag = f'"{preview.blob_id}-thumb"'
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponse(status=304)
+    else:
+        response = HttpResponse(bytes(preview.thumbnail), content_type="image/jpeg")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
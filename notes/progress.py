@@ -0,0 +1,242 @@
+"""
+Progress history.
+
+Note saves append a tiny ProgressEvent whenever completion/read state changes
+(see notes.signals). A periodic task rolls the events up into one
+ProgressSnapshot per user, subject and day, holding that day's deltas and the
+running totals, and deletes them. The API reads only snapshots, so a query
+costs the same however many notes were ever toggled.
+"""
+import datetime
+import itertools
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Note, ProgressEvent, ProgressSnapshot
+
+GRANULARITIES = {
+    "day": None,
+    "week": TruncWeek,
+    "month": TruncMonth,
+}
+MAX_POINTS = 1000
+
+
+# ============================================================
+# EVENTS
+# ============================================================
+def transition_event(user_id, old, new):
+    """
+    Unsaved ProgressEvent for the change between two Note.counter_state()
+    tuples ((topic_id, is_completed, is_read); ``old`` is None for a new
+    note, ``new`` None for a deleted one), or None if nothing changed. Moves
+    between topics are not completions and are ignored.
+    """
+    was_completed, was_read = (old[1], old[2]) if old else (False, False)
+    # A deleted note takes its completion/read state out of the totals
+    topic_id, is_completed, is_read = new if new else (old[0], False, False)
+
+    completed = int(is_completed) - int(was_completed)
+    read = int(is_read) - int(was_read)
+    if not (completed or read):
+        return None
+    return ProgressEvent(
+        user_id=user_id, topic_id=topic_id, completed_delta=completed, read_delta=read,
+    )
+
+
+def record_transition(user_id, old, new):
+    event = transition_event(user_id, old, new)
+    if event is not None:
+        event.save()
+
+
+# ============================================================
+# ROLLUP
+# ============================================================
+def rollup_events():
+    """Fold all pending events into daily snapshots; returns events consumed."""
+    with transaction.atomic():
+        last_id = ProgressEvent.objects.aggregate(last=Max("pk"))["last"]
+        if last_id is None:
+            return 0
+
+        events = ProgressEvent.objects.filter(pk__lte=last_id)
+        consumed = events.count()
+
+        days = defaultdict(list)
+        for row in (
+            events.annotate(day=TruncDate("created_at"))
+            .values("user_id", "topic__subject_id", "day")
+            .annotate(completed=Sum("completed_delta"), read=Sum("read_delta"))
+            .order_by("day")
+        ):
+            key = (row["user_id"], row["topic__subject_id"])
+            days[key].append((row["day"], row["completed"], row["read"]))
+
+        snapshots = []
+        for (user_id, subject_id), changes in days.items():
+            snapshots.extend(_fold(user_id, subject_id, changes))
+
+        _save(snapshots)
+        events.delete()
+
+    return consumed
+
+
+def record_topic_removal(topic):
+    """
+    Take a topic's notes out of its subject's totals, before the topic (and
+    with it, its notes and pending events) is deleted. Events cannot be used:
+    they belong to the topic. What pending events would have added is not in
+    the snapshots yet, so only the rest is removed.
+    """
+    current = {
+        row["owner_id"]: (row["completed"], row["read"])
+        for row in Note.objects.filter(topic=topic).order_by().values("owner_id").annotate(
+            completed=Count("pk", filter=Q(is_completed=True)),
+            read=Count("pk", filter=Q(is_read=True)),
+        )
+    }
+    pending = ProgressEvent.objects.filter(topic=topic).order_by().values("user_id").annotate(
+        completed=Sum("completed_delta"), read=Sum("read_delta"),
+    )
+    for row in pending:
+        completed, read = current.get(row["user_id"], (0, 0))
+        current[row["user_id"]] = (completed - row["completed"], read - row["read"])
+
+    today = timezone.localdate()
+    snapshots = []
+    with transaction.atomic():
+        for user_id, (completed, read) in current.items():
+            if completed or read:
+                snapshots.extend(_fold(user_id, topic.subject_id, [(today, -completed, -read)]))
+        _save(snapshots)
+
+
+def _save(snapshots):
+    ProgressSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=["user", "subject", "date"],
+        update_fields=[
+            "completed_delta", "read_delta", "completed_total", "read_total", "updated_at",
+        ],
+    )
+
+
+def _fold(user_id, subject_id, changes):
+    """Snapshots for one user/subject, continuing from the last known totals."""
+    first_day = changes[0][0]
+    mine = ProgressSnapshot.objects.filter(user_id=user_id, subject_id=subject_id)
+
+    previous = mine.filter(date__lt=first_day).order_by("-date").first()
+    completed_total = previous.completed_total if previous else 0
+    read_total = previous.read_total if previous else 0
+
+    existing = {s.date: s for s in mine.filter(date__in=[day for day, _, _ in changes])}
+
+    snapshots = []
+    for day, completed, read in changes:
+        snapshot = existing.get(day) or ProgressSnapshot(
+            user_id=user_id, subject_id=subject_id, date=day,
+        )
+        snapshot.completed_delta += completed
+        snapshot.read_delta += read
+        # An already rolled-up day contributes its whole delta, not just ours
+        completed_total += snapshot.completed_delta
+        read_total += snapshot.read_delta
+        snapshot.completed_total = completed_total
+        snapshot.read_total = read_total
+        snapshots.append(snapshot)
+    return snapshots
+
+
+# ============================================================
+# QUERYING
+# ============================================================
+def last_modified(user):
+    return ProgressSnapshot.objects.filter(user=user).aggregate(last=Max("updated_at"))["last"]
+
+
+def _period_start(day, granularity):
+    if granularity == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _periods(start, end, granularity):
+    day = start
+    while day <= end:
+        yield day
+        if granularity == "week":
+            day += datetime.timedelta(days=7)
+        elif granularity == "month":
+            day = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        else:
+            day += datetime.timedelta(days=1)
+
+
+def progress_series(user, start, end, granularity="day", subject_id=None):
+    """
+    Completed/read counts per period between ``start`` and ``end`` (dates,
+    inclusive), plus running totals, with empty periods filled in.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity!r}")
+
+    start = _period_start(start, granularity)
+    periods = list(itertools.islice(_periods(start, end, granularity), MAX_POINTS + 1))
+    if len(periods) > MAX_POINTS:
+        raise ValueError("Range too large for this granularity")
+
+    snapshots = ProgressSnapshot.objects.filter(user=user)
+    if subject_id is not None:
+        snapshots = snapshots.filter(subject_id=subject_id)
+
+    # Totals at the start: the last snapshot before it, per subject
+    latest = (
+        ProgressSnapshot.objects.filter(
+            user=user, subject=OuterRef("subject"), date__lt=start,
+        )
+        .order_by("-date")
+        .values("pk")[:1]
+    )
+    baseline = snapshots.filter(date__lt=start, pk=Subquery(latest)).aggregate(
+        completed=Sum("completed_total"), read=Sum("read_total"),
+    )
+
+    in_range = snapshots.filter(date__gte=start, date__lte=end)
+    trunc = GRANULARITIES[granularity]
+    period = trunc("date") if trunc else F("date")
+    buckets = {
+        row["period"]: row
+        for row in in_range.annotate(period=period)
+        .values("period")
+        .annotate(completed=Sum("completed_delta"), read=Sum("read_delta"))
+        .order_by("period")
+    }
+
+    completed_total = baseline["completed"] or 0
+    read_total = baseline["read"] or 0
+    series = {"labels": [], "completed": [], "read": [], "completed_total": [], "read_total": []}
+
+    for day in periods:
+        row = buckets.get(day, {})
+        completed, read = row.get("completed") or 0, row.get("read") or 0
+        completed_total += completed
+        read_total += read
+
+        series["labels"].append(day.isoformat())
+        series["completed"].append(completed)
+        series["read"].append(read)
+        series["completed_total"].append(completed_total)
+        series["read_total"].append(read_total)
+
+    return series
@@ -0,0 +1,193 @@
+"""
+Reading positions (Bookmark.page_position), written behind a cache buffer.
+
+The PDF viewer reports its position as the user scrolls. Each report only
+sets a cache entry for the (user, note) pair, the latest report time wins
+(reports from two tabs are ordered under a short per-entry lock); the first
+report since the last flush also appends the pair to a pending list. A
+periodic task (see CELERY_BEAT_SCHEDULE) reads the pending pairs and writes
+their latest positions with batched ``bulk_update`` calls, so a long scroll
+costs one UPDATE row per flush interval instead of one per page.
+
+The pending list is a run of numbered slots: ``incr`` hands out the next
+slot number and the flush consumes the range since the last number it
+reached. Reads go through ``current_position`` so they see buffered values.
+
+The buffer lives in the default cache, which must be shared between
+processes (Redis when CACHE_URL is set) for positions reported to one
+worker to be flushed by another. Positions still buffered when the cache
+loses them are lost, which is acceptable for reading positions.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Bookmark
+
+_config = getattr(settings, "READING_POSITIONS", {})
+
+FLUSH_BATCH_SIZE = _config.get("FLUSH_BATCH_SIZE", 500)
+# Buffered entries outlive any sane flush interval by far
+ENTRY_TTL = _config.get("ENTRY_TTL", 60 * 60 * 24)
+# Report times further ahead of the server clock than this are clamped to it
+MAX_CLOCK_SKEW_MS = _config.get("MAX_CLOCK_SKEW_MS", 5 * 60 * 1000)
+MAX_POSITION = 1_000_000
+
+_SEQUENCE_KEY = "reading:seq"
+_FLUSHED_KEY = "reading:flushed"
+_STUCK_KEY = "reading:stuck"
+_LOCK_KEY = "reading:flush-lock"
+_LOCK_TTL = 60
+_ENTRY_LOCK_TTL = 2
+_ENTRY_LOCK_ATTEMPTS = 5
+
+
+def _entry_key(user_id, note_id):
+    return f"reading:pos:{user_id}:{note_id}"
+
+
+def _entry_lock_key(user_id, note_id):
+    return f"reading:pos-lock:{user_id}:{note_id}"
+
+
+def _dirty_key(user_id, note_id):
+    return f"reading:dirty:{user_id}:{note_id}"
+
+
+def _slot_key(number):
+    return f"reading:slot:{number}"
+
+
+def _bookmark_key(user_id, note_id):
+    return f"reading:bookmark:{user_id}:{note_id}"
+
+
+# ============================================================
+# BOOKMARK LOOKUP
+# ============================================================
+def bookmark_id(user_id, note_id):
+    """Pk of the user's bookmark on the note (cached), or None."""
+    key = _bookmark_key(user_id, note_id)
+    pk = cache.get(key)
+    if pk is None:
+        pk = Bookmark.objects.filter(user_id=user_id, note_id=note_id).values_list(
+            "pk", flat=True,
+        ).first()
+        if pk is not None:
+            cache.set(key, pk, None)
+    return pk
+
+
+def forget_bookmark(user_id, note_id):
+    cache.delete_many([_bookmark_key(user_id, note_id), _entry_key(user_id, note_id)])
+
+
+# ============================================================
+# BUFFER
+# ============================================================
+def _lock_entry(key):
+    """
+    Take a per-entry lock for the compare-then-set of a report. False when
+    it stays taken (its holder died before releasing it): the caller then
+    goes on unlocked, at worst keeping an older of two racing reports.
+    """
+    for attempt in range(_ENTRY_LOCK_ATTEMPTS):
+        if cache.add(key, 1, _ENTRY_LOCK_TTL):
+            return True
+        time.sleep(0.005 * (attempt + 1))
+    return False
+
+
+def record_position(user_id, note_id, bookmark_pk, position, at=None):
+    """
+    Buffer a reported position; returns the position now current. ``at`` is
+    the report time in milliseconds (the client's, so reports overtaking each
+    other on the network keep their order; the server's by default), clamped
+    to MAX_CLOCK_SKEW_MS ahead of the server clock so a client clock set far
+    ahead cannot pin the position.
+    """
+    now = int(time.time() * 1000)
+    at = now if at is None else min(at, now + MAX_CLOCK_SKEW_MS)
+    key = _entry_key(user_id, note_id)
+
+    lock = _entry_lock_key(user_id, note_id)
+    locked = _lock_entry(lock)
+    try:
+        current = cache.get(key)
+        if current is not None and current[2] > at:
+            return current[1]  # a later report is already buffered
+        cache.set(key, (bookmark_pk, position, at), ENTRY_TTL)
+    finally:
+        if locked:
+            cache.delete(lock)
+
+    # Set after the entry: a flush that clears the marker reads this value
+    if cache.add(_dirty_key(user_id, note_id), 1, ENTRY_TTL):
+        cache.add(_SEQUENCE_KEY, 0, None)
+        cache.set(_slot_key(cache.incr(_SEQUENCE_KEY)), (user_id, note_id), ENTRY_TTL)
+    return position
+
+
+def current_position(user_id, note_id):
+    """Current reading position: the buffered one, else the stored one (None if no bookmark)."""
+    entry = cache.get(_entry_key(user_id, note_id))
+    if entry is not None:
+        return entry[1]
+    return Bookmark.objects.filter(user_id=user_id, note_id=note_id).values_list(
+        "page_position", flat=True,
+    ).first()
+
+
+# ============================================================
+# FLUSH
+# ============================================================
+def _pending_pairs(flushed):
+    """((user_id, note_id) pairs, last slot consumed) of the slots after ``flushed``."""
+    last = cache.get(_SEQUENCE_KEY, 0)
+    numbers = range(flushed + 1, last + 1)
+    slots = cache.get_many([_slot_key(n) for n in numbers])
+
+    pairs, reached = [], flushed
+    for number in numbers:
+        pair = slots.get(_slot_key(number))
+        if pair is None:
+            # Numbered but not written yet: wait one flush for the writer,
+            # then give up on it (its marker expires with ENTRY_TTL)
+            if cache.get(_STUCK_KEY) != number:
+                cache.set(_STUCK_KEY, number, None)
+                break
+        else:
+            pairs.append(tuple(pair))
+        reached = number
+    return pairs, reached
+
+
+def flush_positions(batch_size=FLUSH_BATCH_SIZE):
+    """Write buffered positions to their bookmarks; returns how many."""
+    if not cache.add(_LOCK_KEY, 1, _LOCK_TTL):
+        return 0  # another flush is running
+    try:
+        flushed = cache.get(_FLUSHED_KEY, 0)
+        pairs, reached = _pending_pairs(flushed)
+        pairs = list(dict.fromkeys(pairs))
+
+        # Clear the markers before reading values: later reports re-queue
+        cache.delete_many([_dirty_key(*pair) for pair in pairs])
+        entries = cache.get_many([_entry_key(*pair) for pair in pairs])
+        bookmarks = [
+            Bookmark(pk=bookmark_pk, page_position=position)
+            for bookmark_pk, position, _ in entries.values()
+        ]
+        if bookmarks:
+            with transaction.atomic():
+                # Bookmarks deleted meanwhile just match no row
+                Bookmark.objects.bulk_update(bookmarks, ["page_position"], batch_size=batch_size)
+
+        if reached > flushed:
+            cache.set(_FLUSHED_KEY, reached, None)
+            cache.delete_many([_slot_key(n) for n in range(flushed + 1, reached + 1)])
+        return len(bookmarks)
+    finally:
+        cache.delete(_LOCK_KEY)
@@ -0,0 +1,243 @@
+"""
+Full-text search over Note title/content and the text of PDF attachments.
+
+On PostgreSQL each note carries a weighted ``search_vector`` tsvector column
+(GIN indexed, added by migration 0005). Other databases use an inverted index
+maintained in Python (``SearchIndexEntry``: one row per note/term).
+
+Both are kept up to date from notes.signals on Note save.
+"""
+import math
+import re
+import zlib
+from collections import Counter
+from functools import lru_cache
+from html.parser import HTMLParser
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import BlobPreview, Note, SearchIndexEntry
+
+TITLE_WEIGHT = 3.0
+# Text of PDF attachments (notes.previews) counts for less than the note's own
+ATTACHMENT_WEIGHT = 0.5
+MAX_TERM_LENGTH = 64
+PG_CONFIG = "english"
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+STOP_WORDS = frozenset("""
+    a an and are as at be but by for from has have in is it its of on or
+    that the this to was were will with
+""".split())
+
+
+# ============================================================
+# TEXT PROCESSING
+# ============================================================
+class _TextExtractor(HTMLParser):
+    SKIP = {"script", "style"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skipping:
+            self._skipping -= 1
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+
+def strip_html(html):
+    """Plain text of the HTML TinyMCE stores in Note.content."""
+    if not html:
+        return ""
+
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return " ".join(" ".join(parser.parts).split())
+
+
+@lru_cache(maxsize=1)
+def _stemmer():
+    from nltk.stem.porter import PorterStemmer
+    return PorterStemmer()
+
+
+@lru_cache(maxsize=65536)
+def _stem(word):
+    return _stemmer().stem(word)
+
+
+def tokenize(text):
+    return [
+        _stem(word)[:MAX_TERM_LENGTH]
+        for word in TOKEN_RE.findall(text.lower())
+        if word not in STOP_WORDS
+    ]
+
+
+# ============================================================
+# BACKEND SELECTION
+# ============================================================
+def backend():
+    """'postgres' or 'python' (override with settings.NOTE_SEARCH_BACKEND)."""
+    configured = getattr(settings, "NOTE_SEARCH_BACKEND", None)
+    if configured:
+        return configured
+    return "postgres" if connection.vendor == "postgresql" else "python"
+
+
+# ============================================================
+# INDEXING
+# ============================================================
+def term_weights(note, attachment_text=""):
+    """Log-scaled term frequencies, with title hits boosted."""
+    counts = Counter()
+    for term in tokenize(note.title or ""):
+        counts[term] += TITLE_WEIGHT
+    for term in tokenize(strip_html(note.content)):
+        counts[term] += 1
+    for term in tokenize(attachment_text):
+        counts[term] += ATTACHMENT_WEIGHT
+
+    return {term: 1 + math.log(tf) for term, tf in counts.items()}
+
+
+def attachment_texts(note_ids):
+    """{note id: text derived from its PDF attachment} for notes that have one."""
+    rows = BlobPreview.objects.filter(blob__notes__in=note_ids).exclude(page_count=0)
+    return {
+        note_id: zlib.decompress(text).decode()
+        for note_id, text in rows.values_list("blob__notes", "text")
+    }
+
+
+def index_notes(notes):
+    """(Re)index a batch of notes; only title/content/pk are read."""
+    notes = list(notes)
+    if not notes:
+        return
+
+    attachments = attachment_texts([note.pk for note in notes])
+    if backend() == "postgres":
+        _index_postgres(notes, attachments)
+    else:
+        _index_python(notes, attachments)
+
+
+def _index_postgres(notes, attachments):
+    sql = (
+        "UPDATE notes SET search_vector = "
+        "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+        "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+        "setweight(to_tsvector(%s::regconfig, %s), 'C') "
+        "WHERE id = %s"
+    )
+    rows = [
+        (
+            PG_CONFIG, note.title or "",
+            PG_CONFIG, strip_html(note.content),
+            PG_CONFIG, attachments.get(note.pk, ""),
+            note.pk,
+        )
+        for note in notes
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _index_python(notes, attachments):
+    SearchIndexEntry.objects.filter(note__in=[n.pk for n in notes]).delete()
+    SearchIndexEntry.objects.bulk_create(
+        [
+            SearchIndexEntry(term=term, note_id=note.pk, weight=weight)
+            for note in notes
+            for term, weight in term_weights(note, attachments.get(note.pk, "")).items()
+        ],
+        batch_size=1000,
+    )
+
+
+# ============================================================
+# QUERYING
+# ============================================================
+def search_notes(queryset, query):
+    """
+    Filter ``queryset`` to notes matching every term of ``query`` and
+    annotate ``rank``, ordered best-first.
+    """
+    if not query or not query.strip():
+        return queryset.none()
+
+    if backend() == "postgres":
+        return _search_postgres(queryset, query)
+    return _search_python(queryset, query)
+
+
+def _search_postgres(queryset, query):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+
+    ts_query = SearchQuery(query, config=PG_CONFIG, search_type="websearch")
+    vector = RawSQL('"notes"."search_vector"', [], output_field=SearchVectorField())
+
+    return (
+        queryset.annotate(document=vector)
+        .filter(document=ts_query)
+        .annotate(rank=SearchRank(F("document"), ts_query))
+        .order_by("-rank", "-created_at")
+    )
+
+
+def _search_python(queryset, query):
+    terms = sorted(set(tokenize(query)))
+    if not terms:
+        return queryset.none()
+
+    entries = SearchIndexEntry.objects.filter(term__in=terms)
+
+    # idf per term, from the index itself
+    total = Note.objects.count() or 1
+    doc_freq = dict(entries.values_list("term").annotate(df=Count("note")).order_by())
+    if len(doc_freq) < len(terms):
+        return queryset.none()
+
+    matching = (
+        entries.values("note")
+        .annotate(hits=Count("term"))
+        .filter(hits=len(terms))
+        .values("note")
+    )
+
+    score = Sum(Case(
+        *[
+            When(term=term, then=F("weight") * math.log(1 + total / doc_freq[term]))
+            for term in terms
+        ],
+        default=Value(0.0),
+        output_field=FloatField(),
+    ))
+    rank = (
+        entries.filter(note=OuterRef("pk"))
+        .values("note")
+        .annotate(score=score)
+        .values("score")
+    )
+
+    return (
+        queryset.filter(pk__in=matching)
+        .annotate(rank=Subquery(rank, output_field=FloatField()))
+        .order_by("-rank", "-created_at")
+    )
@@ -0,0 +1,325 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from .ai_utils import content_hash, summary_cache
+from .blobs import release
+from .dashboard import (
+    forget_topic_owner, invalidate_dashboard, remember_topic_owner, topic_owner_id,
+)
+from .keywords import DOCUMENTS, apply_deltas
+from .models import (
+    CustomUser, Subject, Topic, Note, Summary, Bookmark, Task, Collaboration,
+)
+from .permissions import bump_version
+from .previews import needs_preview
+from .progress import record_topic_removal, record_transition
+from .reading import forget_bookmark
+from .search import index_notes, strip_html
+from .tasks import derive_attachment_preview
+from . import similarity
+
+
+_bulk = threading.local()
+
+
+@contextmanager
+def note_signals_muted():
+    """
+    Skip the per-note receivers below for deletes/saves in this block; the
+    caller applies their effects once for the whole batch (see notes.bulk).
+    """
+    previous = getattr(_bulk, "active", False)
+    _bulk.active = True
+    try:
+        yield
+    finally:
+        _bulk.active = previous
+
+
+def _muted():
+    return getattr(_bulk, "active", False)
+
+
+def _deleted_with_parent(instance, origin):
+    """
+    Whether a note delete was already handled by the pre_delete of the topic
+    or subject it cascades from (see PARENT DELETES); the per-note receivers
+    then skip it. Only the deleted parent handles its notes: other cascades
+    (a user's, say) leave each note to its own receivers.
+    """
+    return instance.pk in getattr(origin, "_notes_deleted_once", ())
+
+
+def _origin_model(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def _is_origin(instance, origin):
+    """Whether ``instance`` is what delete() was called on (or among it, for a queryset)."""
+    if isinstance(origin, QuerySet):
+        return origin.model is type(instance)
+    return origin is instance
+
+
+# ============================================================
+# SUBJECT / TOPIC COUNTERS
+# ============================================================
+def _apply(state, sign):
+    """Shift the counters of the topic in ``state`` (and its subject) by +/-1."""
+    topic_id, is_completed, is_read = state
+    deltas = {
+        "note_count": sign,
+        "completed_count": sign if is_completed else 0,
+        "read_count": sign if is_read else 0,
+    }
+    Topic.objects.filter(pk=topic_id).adjust_counters(**deltas)
+    Subject.objects.filter(topics__pk=topic_id).adjust_counters(**deltas)
+
+
+@receiver(pre_save, sender=Note)
+def note_snapshot_counter_state(sender, instance, raw, **kwargs):
+    # Instances not loaded through from_db (e.g. built by hand with a pk)
+    # need their persisted state read once before it is overwritten.
+    if raw or _muted() or instance._state.adding or hasattr(instance, "_counter_state"):
+        return
+
+    row = Note.objects.filter(pk=instance.pk).values_list(*Note.COUNTER_STATE).first()
+    if row is not None:
+        instance._counter_state = row
+
+
+@receiver(post_save, sender=Note)
+def note_update_counters(sender, instance, created, raw, **kwargs):
+    if raw or _muted():
+        return
+
+    new = instance.counter_state()
+    old = None if created else getattr(instance, "_counter_state", None)
+
+    if old is None:
+        _apply(new, +1)
+    elif old[0] != new[0]:
+        # Moved to another topic: take it out of the old one entirely
+        _apply(old, -1)
+        _apply(new, +1)
+    elif old != new:
+        _, was_completed, was_read = old
+        _, is_completed, is_read = new
+        deltas = {
+            "completed_count": int(is_completed) - int(was_completed),
+            "read_count": int(is_read) - int(was_read),
+        }
+        Topic.objects.filter(pk=new[0]).adjust_counters(**deltas)
+        Subject.objects.filter(topics__pk=new[0]).adjust_counters(**deltas)
+
+    if old != new:
+        record_transition(instance.owner_id, old, new)
+
+    instance.remember_counter_state()
+
+
+@receiver(post_delete, sender=Note)
+def note_delete_counters(sender, instance, origin=None, **kwargs):
+    if _muted() or _deleted_with_parent(instance, origin):
+        return
+
+    state = getattr(instance, "_counter_state", instance.counter_state())
+    _apply(state, -1)
+    # The owner's history goes with the owner (its event could not be saved)
+    if _origin_model(origin) is not CustomUser:
+        record_transition(instance.owner_id, state, None)
+
+
+# ============================================================
+# ATTACHMENTS
+# ============================================================
+@receiver(post_delete, sender=Note)
+def note_release_attachment(sender, instance, origin=None, **kwargs):
+    if _muted() or _deleted_with_parent(instance, origin):
+        return
+
+    release([instance.attachment_id])
+
+
+@receiver(post_save, sender=Note)
+def note_queue_attachment_preview(sender, instance, raw, update_fields, **kwargs):
+    if raw or _muted() or not instance.attachment_id:
+        return
+    if update_fields is not None and "attachment" not in update_fields:
+        return
+
+    digest = instance.attachment_id
+    if needs_preview(digest):
+        transaction.on_commit(lambda: derive_attachment_preview.delay(digest))
+
+
+# ============================================================
+# PARENT DELETES
+# ============================================================
+def _delete_notes_once(notes, origin):
+    """
+    What the per-note delete receivers would do, for all ``notes`` at once;
+    the notes are recorded on ``origin`` for those receivers to skip.
+    """
+    rows = list(notes.order_by().values_list("pk", "attachment_id", "owner_id"))
+    release(digest for _, digest, _ in rows)
+    invalidate_dashboard(*{owner_id for _, _, owner_id in rows})
+
+    handled = getattr(origin, "_notes_deleted_once", set())
+    handled.update(pk for pk, _, _ in rows)
+    origin._notes_deleted_once = handled
+
+
+@receiver(pre_delete, sender=Topic)
+def topic_delete_notes(sender, instance, origin=None, **kwargs):
+    if not _is_origin(instance, origin):
+        return  # cascades from its subject (subject_delete_notes) or owner
+
+    _delete_notes_once(Note.objects.filter(topic=instance), origin)
+    record_topic_removal(instance)
+    counters = Topic.objects.filter(pk=instance.pk).values(
+        "note_count", "completed_count", "read_count",
+    ).first()
+    if counters:
+        Subject.objects.filter(pk=instance.subject_id).adjust_counters(
+            **{field: -value for field, value in counters.items()}
+        )
+
+
+@receiver(pre_delete, sender=Subject)
+def subject_delete_notes(sender, instance, origin=None, **kwargs):
+    if not _is_origin(instance, origin):
+        return  # cascades from its owner: each note's receivers run
+
+    _delete_notes_once(Note.objects.filter(topic__subject=instance), origin)
+
+
+# ============================================================
+# SEARCH INDEX
+# ============================================================
+@receiver(post_save, sender=Note)
+def note_update_search_index(sender, instance, raw, update_fields, **kwargs):
+    if raw or _muted():
+        return
+
+    # Completion/read toggles save with update_fields and leave the text alone
+    if update_fields is not None and not {"title", "content", "attachment"} & set(update_fields):
+        return
+
+    index_notes([instance])
+
+
+# ============================================================
+# SIMILARITY INDEX
+# ============================================================
+@receiver(post_save, sender=Note)
+def note_update_similarity_index(sender, instance, raw, update_fields, **kwargs):
+    if raw or _muted():
+        return
+    if update_fields is not None and "content" not in update_fields:
+        return
+
+    similarity.index_notes([instance])
+
+
+# ============================================================
+# SUMMARY CACHE
+# ============================================================
+@receiver(post_save, sender=Note)
+def note_invalidate_summary_cache(sender, instance, created, raw, update_fields, **kwargs):
+    if raw or created or _muted():
+        return
+    if update_fields is not None and "content" not in update_fields:
+        return
+
+    # Summary.content_hash is the hash the cached summary was keyed on
+    current = content_hash(strip_html(instance.content))
+    stale = (
+        Summary.objects.filter(note=instance)
+        .exclude(content_hash=current)
+        .values_list("content_hash", flat=True)
+        .first()
+    )
+    if stale:
+        summary_cache.invalidate(stale)
+
+
+@receiver(post_delete, sender=Summary)
+def summary_forget_keyword_terms(sender, instance, **kwargs):
+    # Runs before the note itself is deleted when the delete cascades from it
+    if instance.terms is None:
+        return
+    owner_id = Note.objects.filter(pk=instance.note_id).values_list("owner_id", flat=True).first()
+    if owner_id is not None:
+        apply_deltas(owner_id, {DOCUMENTS: -1, **{term: -1 for term in instance.terms}})
+
+
+# ============================================================
+# DASHBOARD CACHE
+# ============================================================
+@receiver(post_save, sender=Note)
+@receiver(post_delete, sender=Note)
+def note_invalidate_dashboard(sender, instance, origin=None, **kwargs):
+    if _muted() or _deleted_with_parent(instance, origin):
+        return
+
+    # A collaborator's note also moves the subject owner's progress bars
+    invalidate_dashboard(instance.owner_id, topic_owner_id(instance.topic_id))
+
+
+@receiver(post_save, sender=Topic)
+def topic_invalidate_dashboard(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    owner_id = instance.subject.owner_id
+    remember_topic_owner(instance.pk, owner_id)
+    invalidate_dashboard(owner_id)
+
+
+@receiver(post_delete, sender=Topic)
+def topic_delete_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard(topic_owner_id(instance.pk))
+    forget_topic_owner(instance.pk)
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def subject_invalidate_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard(instance.owner_id)
+
+
+@receiver(post_save, sender=Bookmark)
+@receiver(post_delete, sender=Bookmark)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def user_item_invalidate_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard(instance.user_id)
+
+
+# ============================================================
+# READING POSITIONS
+# ============================================================
+@receiver(post_delete, sender=Bookmark)
+def bookmark_forget_position(sender, instance, **kwargs):
+    # Buffered reports for a deleted bookmark are dropped, not flushed
+    forget_bookmark(instance.user_id, instance.note_id)
+
+
+# ============================================================
+# PERMISSION MAPS
+# ============================================================
+@receiver(post_save, sender=Collaboration)
+@receiver(post_delete, sender=Collaboration)
+def collaboration_bump_permissions(sender, instance, **kwargs):
+    bump_version(instance.user_id)
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def subject_bump_permissions(sender, instance, **kwargs):
+    bump_version(instance.owner_id)
@@ -0,0 +1,232 @@
+"""
+Related notes and near-duplicate detection.
+
+Each note's plain text is reduced to a MinHash signature over word
+shingles; the share of equal signature positions estimates the Jaccard
+similarity of two notes' shingle sets. Signatures use one-permutation
+hashing (one hash per shingle, the minimum kept per bin, empty bins filled
+from their right neighbour), so signing costs one pass over the shingles.
+
+For lookups the signature is cut into BANDS bands of ROWS values; each band
+is hashed to a key and stored in ``NoteBucket``. Notes sharing any (band,
+key) row are candidates, found through the (band, key, note) index without
+comparing against the rest of the corpus, and are then ranked by their
+estimated similarity.
+
+Both are kept up to date from notes.signals on Note save.
+"""
+import hashlib
+from collections import defaultdict
+
+from django.db.models import Count, Q
+
+from .models import Note, NoteBucket, NoteSignature
+from .search import TOKEN_RE, strip_html
+
+SHINGLE_SIZE = 3
+BANDS = 20
+ROWS = 3
+SIGNATURE_SIZE = BANDS * ROWS
+
+RELATED_LIMIT = 5
+RELATED_THRESHOLD = 0.3
+DUPLICATE_THRESHOLD = 0.8
+MAX_CANDIDATES = 200
+# Buckets holding more notes than this are boilerplate, not evidence
+MAX_BUCKET_SIZE = 100
+
+_HASH_SPACE = 1 << 64
+_BIN_WIDTH = _HASH_SPACE // SIGNATURE_SIZE
+
+
+def _hash64(data):
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+# ============================================================
+# SIGNATURES
+# ============================================================
+def shingles(text):
+    """Distinct word SHINGLE_SIZE-grams of plain text (the words, if fewer)."""
+    words = TOKEN_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def signature(text):
+    """MinHash signature (SIGNATURE_SIZE ints) of plain text, or None when empty."""
+    found = shingles(text)
+    if not found:
+        return None
+
+    bins = [None] * SIGNATURE_SIZE
+    for shingle in found:
+        h = _hash64(shingle.encode())
+        index, value = divmod(h, _BIN_WIDTH)
+        if index < SIGNATURE_SIZE and (bins[index] is None or value < bins[index]):
+            bins[index] = value
+
+    # Densify: an empty bin takes the next non-empty bin to its right,
+    # offset by the distance so different bins never copy the same value
+    filled = [i for i, value in enumerate(bins) if value is not None]
+    for i in range(SIGNATURE_SIZE):
+        if bins[i] is None:
+            source = next((j for j in filled if j > i), filled[0] + SIGNATURE_SIZE)
+            bins[i] = bins[source % SIGNATURE_SIZE] + (source - i) * _BIN_WIDTH
+    return bins
+
+
+def band_keys(minhash):
+    """[(band, key)] LSH rows of a signature."""
+    keys = []
+    for band in range(BANDS):
+        values = minhash[band * ROWS:(band + 1) * ROWS]
+        digest = _hash64(",".join(map(str, values)).encode())
+        keys.append((band, digest >> 1))  # fits a signed BIGINT
+    return keys
+
+
+def estimate(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+# ============================================================
+# INDEXING
+# ============================================================
+def index_notes(notes):
+    """(Re)sign a batch of notes; only content/pk are read."""
+    notes = list(notes)
+    if not notes:
+        return
+
+    signatures, buckets = [], []
+    for note in notes:
+        minhash = signature(strip_html(note.content))
+        if minhash is None:
+            continue
+        signatures.append(NoteSignature(note_id=note.pk, minhash=minhash))
+        buckets += [NoteBucket(note_id=note.pk, band=b, key=k) for b, k in band_keys(minhash)]
+
+    pks = [note.pk for note in notes]
+    NoteBucket.objects.filter(note__in=pks).delete()
+    NoteSignature.objects.filter(note__in=pks).delete()
+    NoteSignature.objects.bulk_create(signatures, batch_size=500)
+    NoteBucket.objects.bulk_create(buckets, batch_size=1000)
+
+
+# ============================================================
+# QUERYING
+# ============================================================
+def _bucket_filter(keys):
+    condition = Q()
+    for band, key in keys:
+        condition |= Q(band=band, key=key)
+    return condition
+
+
+def visible_to(resolver, prefix=""):
+    """
+    Q for the notes ``resolver``'s user may view (see PermissionResolver);
+    ``prefix`` is the lookup path to the note from the queried model.
+    """
+    return (
+        Q(**{f"{prefix}owner_id": resolver.user.pk})
+        | Q(**{f"{prefix}is_public": True})
+        | Q(**{f"{prefix}topic__subject_id__in": list(resolver.access_map)})
+    )
+
+
+def related_notes(note, resolver, limit=RELATED_LIMIT, threshold=RELATED_THRESHOLD):
+    """
+    [(note, similarity)] of the most similar notes the user may view,
+    best first. Notes come with topic and subject loaded.
+    """
+    minhash = NoteSignature.objects.filter(note=note).values_list("minhash", flat=True).first()
+    if minhash is None:
+        return []
+
+    # Visibility before the cap, or notes the user cannot see (other users'
+    # private copies of a shared handout) can take every candidate slot. As
+    # a join it is checked per bucket row through the notes primary key.
+    candidates = list(
+        NoteBucket.objects.filter(_bucket_filter(band_keys(minhash)))
+        .filter(visible_to(resolver, prefix="note__"))
+        .exclude(note=note)
+        .values("note")
+        .annotate(shared=Count("pk"))
+        .order_by("-shared", "note")
+        .values_list("note", flat=True)[:MAX_CANDIDATES]
+    )
+    if not candidates:
+        return []
+
+    scores = {}
+    for note_id, other in NoteSignature.objects.filter(note__in=candidates).values_list(
+        "note_id", "minhash",
+    ):
+        similarity = estimate(minhash, other)
+        if similarity >= threshold:
+            scores[note_id] = similarity
+
+    notes = Note.objects.select_related("topic__subject").only(
+        "title", "topic__name", "topic__subject__name",
+    ).in_bulk(scores)
+    best = sorted(notes, key=lambda pk: (-scores[pk], pk))[:limit]
+    return [(notes[pk], scores[pk]) for pk in best]
+
+
+def duplicate_groups(notes=None, threshold=DUPLICATE_THRESHOLD):
+    """
+    Groups (lists of note ids, smallest first) of near-duplicate notes among
+    ``notes`` (a Note queryset; all notes by default).
+    """
+    rows = NoteBucket.objects.order_by("band", "key", "note")
+    if notes is not None:
+        rows = rows.filter(note__in=notes.values("pk"))
+
+    # Candidate pairs: notes sharing a bucket, read in index order
+    pairs = set()
+    current, members = None, []
+    for band, key, note_id in rows.values_list("band", "key", "note").iterator(chunk_size=5000):
+        if (band, key) != current:
+            _add_pairs(pairs, members)
+            current, members = (band, key), []
+        members.append(note_id)
+    _add_pairs(pairs, members)
+
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    ordered = sorted(pairs)
+    for start in range(0, len(ordered), 1000):
+        chunk = ordered[start:start + 1000]
+        ids = {pk for pair in chunk for pk in pair}
+        signatures = dict(
+            NoteSignature.objects.filter(note__in=ids).values_list("note_id", "minhash")
+        )
+        for a, b in chunk:
+            if estimate(signatures[a], signatures[b]) >= threshold:
+                parent[find(b)] = find(a)
+
+    groups = defaultdict(list)
+    for pk in parent:
+        groups[find(pk)].append(pk)
+    return sorted(
+        (sorted(members) for members in groups.values() if len(members) > 1),
+        key=lambda members: members[0],
+    )
+
+
+def _add_pairs(pairs, members):
+    if 1 < len(members) <= MAX_BUCKET_SIZE:
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                pairs.add((a, b))
@@ -0,0 +1,229 @@
+import tempfile
+from datetime import timedelta
+
+from celery import shared_task
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .ai_utils import CHUNK_DEADLINE, content_hash, normalize_text, summarize_document
+from .blobs import collect_blobs
+from .inference import InferenceError
+from .keywords import FALLBACK, refresh_keywords, summarize_offline
+from .models import CompileJob, Note, Summary, SummaryJob
+from .pdf_compile import BATCH_SIZE, compile_pdf, notes_for_compile, selection_fingerprint
+from .previews import derive_preview
+from .progress import rollup_events
+from .reading import flush_positions
+from .search import strip_html
+
+
+# ============================================================
+# SUMMARY JOBS
+# ============================================================
+# summarize_document stops at its deadline; the limits catch anything past it
+SUMMARY_SOFT_TIME_LIMIT = CHUNK_DEADLINE + 60
+SUMMARY_TIME_LIMIT = SUMMARY_SOFT_TIME_LIMIT + 30
+# Queued or running jobs untouched for longer lost their message or worker
+SUMMARY_STALE_AFTER = timedelta(seconds=SUMMARY_TIME_LIMIT + 60)
+
+
+def submit_summary_job(user, text=None, note=None):
+    """
+    Create (or reuse) a SummaryJob and enqueue it once the transaction commits.
+
+    For notes, a job that already covers the same content (queued, running or
+    done) is returned instead of enqueueing the note again. Queued or running
+    jobs older than SUMMARY_STALE_AFTER are failed and replaced instead.
+    """
+    if note is not None:
+        text = strip_html(note.content)
+
+    text = normalize_text(text or "")
+    digest = content_hash(text)
+
+    with transaction.atomic():
+        if note is not None:
+            # Serialise concurrent submits for the same note
+            Note.objects.select_for_update().filter(pk=note.pk).exists()
+
+            now = timezone.now()
+            SummaryJob.objects.filter(
+                note=note, content_hash=digest,
+                status__in=[SummaryJob.STATUS_QUEUED, SummaryJob.STATUS_RUNNING],
+                updated_at__lt=now - SUMMARY_STALE_AFTER,
+            ).update(
+                status=SummaryJob.STATUS_FAILED,
+                error="Abandoned: no progress (lost message or worker).",
+                updated_at=now,
+            )
+            existing = (
+                SummaryJob.objects.filter(note=note, content_hash=digest)
+                .exclude(status=SummaryJob.STATUS_FAILED)
+                .first()
+            )
+            if existing:
+                return existing
+
+        job = SummaryJob.objects.create(
+            user=user, note=note, input_text=text, content_hash=digest,
+        )
+        transaction.on_commit(lambda: summarize_job.delay(str(job.pk)))
+
+    return job
+
+
+@shared_task(
+    ignore_result=True, soft_time_limit=SUMMARY_SOFT_TIME_LIMIT, time_limit=SUMMARY_TIME_LIMIT,
+)
+def summarize_job(job_id):
+    # Claim the job; a redelivered message for a running/finished job is a no-op
+    claimed = SummaryJob.objects.filter(
+        pk=job_id, status=SummaryJob.STATUS_QUEUED
+    ).update(status=SummaryJob.STATUS_RUNNING, updated_at=timezone.now())
+    if not claimed:
+        return
+
+    job = SummaryJob.objects.get(pk=job_id)
+    try:
+        _run_summary_job(job)
+    except Exception as e:
+        # Anything unexpected must not leave the job "running": submits
+        # reuse running jobs, so the note could never be summarised again
+        error = f"{job.error}; {e}" if job.error else str(e)
+        SummaryJob.objects.filter(pk=job.pk).update(
+            status=SummaryJob.STATUS_FAILED, error=error, updated_at=timezone.now(),
+        )
+
+
+def _run_summary_job(job):
+    method = Summary.METHOD_MODEL
+    try:
+        result = summarize_document(job.input_text)
+    except InferenceError as e:
+        job.error = str(e)
+        if not FALLBACK:
+            job.status = SummaryJob.STATUS_FAILED
+            job.save(update_fields=["status", "error", "updated_at"])
+            return
+        # The upstream error is kept on the job; the summary is extractive
+        result = summarize_offline(job.user_id, job.input_text)
+        method = Summary.METHOD_EXTRACTIVE
+
+    with transaction.atomic():
+        job.status = SummaryJob.STATUS_DONE
+        job.result_text = result
+        job.save(update_fields=["status", "result_text", "error", "updated_at"])
+
+        if job.note_id:
+            Summary.objects.update_or_create(
+                note_id=job.note_id,
+                defaults={"summary_text": result, "content_hash": job.content_hash, "method": method},
+            )
+            owner_id = Note.objects.filter(pk=job.note_id).values_list("owner_id", flat=True).first()
+            if owner_id is not None:
+                # force: content_hash was just set, but terms/keywords may be of older text
+                refresh_keywords(owner_id, note_ids=[job.note_id], force=True)
+
+
+# ============================================================
+# PDF COMPILE JOBS
+# ============================================================
+def submit_compile_job(user, note_ids):
+    """
+    Return a CompileJob for the user's selected notes, or None if none of
+    them are theirs. A job with the same fingerprint that is still pending,
+    or finished with its artifact in place, is reused instead of rendering
+    the same PDF again.
+    """
+    notes = notes_for_compile(user, note_ids)
+    note_ids = list(notes.values_list("pk", flat=True))
+    if not note_ids:
+        return None
+
+    fingerprint = selection_fingerprint(notes)
+
+    for job in CompileJob.objects.filter(user=user, fingerprint=fingerprint).exclude(
+        status=CompileJob.STATUS_FAILED
+    ):
+        if job.status != CompileJob.STATUS_DONE or job.has_artifact():
+            return job
+
+    with transaction.atomic():
+        job = CompileJob.objects.create(user=user, note_ids=note_ids, fingerprint=fingerprint)
+        transaction.on_commit(lambda: compile_pdf_job.delay(str(job.pk)))
+
+    return job
+
+
+def _tracked(notes, job, total):
+    """Iterate ``notes``, writing the job's progress back once per batch."""
+    for done, note in enumerate(notes, 1):
+        yield note
+        if done % BATCH_SIZE == 0:
+            # 100 is reserved for "artifact stored"
+            progress = min(99, done * 100 // total)
+            CompileJob.objects.filter(pk=job.pk).update(progress=progress)
+
+
+@shared_task(ignore_result=True)
+def compile_pdf_job(job_id):
+    claimed = CompileJob.objects.filter(
+        pk=job_id, status=CompileJob.STATUS_QUEUED
+    ).update(status=CompileJob.STATUS_RUNNING)
+    if not claimed:
+        return
+
+    job = CompileJob.objects.get(pk=job_id)
+    notes = notes_for_compile(job.user, job.note_ids).iterator(chunk_size=BATCH_SIZE)
+
+    try:
+        with tempfile.TemporaryFile() as spool:
+            for chunk in compile_pdf(_tracked(notes, job, len(job.note_ids) or 1)):
+                spool.write(chunk)
+            size = spool.tell()
+            spool.seek(0)
+            job.artifact.save(f"{job.pk}.pdf", File(spool), save=False)
+    except Exception as e:
+        job.status = CompileJob.STATUS_FAILED
+        job.error = f"PDF error: {e}"
+        job.save(update_fields=["status", "error", "updated_at"])
+        return
+
+    job.status = CompileJob.STATUS_DONE
+    job.progress = 100
+    job.size = size
+    job.save(update_fields=["status", "progress", "size", "artifact", "updated_at"])
+
+
+# ============================================================
+# ATTACHMENT PREVIEWS
+# ============================================================
+@shared_task(ignore_result=True)
+def derive_attachment_preview(digest):
+    # Idempotent: a redelivered message finds the preview and returns it
+    derive_preview(digest)
+
+
+# ============================================================
+# PROGRESS ROLLUP (celery beat, see CELERY_BEAT_SCHEDULE)
+# ============================================================
+@shared_task(ignore_result=True)
+def rollup_progress():
+    rollup_events()
+
+
+# ============================================================
+# READING POSITIONS (celery beat, see CELERY_BEAT_SCHEDULE)
+# ============================================================
+@shared_task(ignore_result=True)
+def flush_reading_positions():
+    flush_positions()
+
+
+# ============================================================
+# BLOB COLLECTION (celery beat, see CELERY_BEAT_SCHEDULE)
+# ============================================================
+@shared_task(ignore_result=True)
+def collect_unreferenced_blobs():
+    collect_blobs()
@@ -1,3 +1,2478 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    CustomUser, Subject, Topic, Note, Collaboration, SearchIndexEntry, Task, Bookmark,
+    Summary, SummaryJob, CompileJob, ProgressEvent, ProgressSnapshot, KeywordFrequency,
+    NoteBucket, NoteSignature, Blob, BlobPreview,
+)
+from . import inference
+from .inference import CircuitBreaker, InferenceClient, InferenceError, InferenceUnavailable
+from . import blobs
+from .ai_utils import (
+    SummaryCache, chunk_text, content_hash, generate_summary, summarize_document,
+    summary_cache,
+)
+from .tasks import compile_pdf_job, submit_compile_job, summarize_job
+from .downloads import parse_range
+from .dashboard import dashboard_data
+from .progress import progress_series, rollup_events
+from .permissions import PermissionResolver
+from . import bulk
+from .corpus import CorpusError, export_corpus, import_corpus
+from . import keywords
+from .loadgen import Scale, generate
+from . import metrics
+from .pagination import KeysetPaginator, InvalidCursor, NOTE_ORDERING, TASK_ORDERING
+from .search import search_notes, strip_html
+from .similarity import related_notes
+from . import pdf_extract
+from .pdf_extract import PdfExtractionError, extract_file, extract_pdf_text
+from . import pdf_compile
+from .pdf_compile import compile_pdf, html_blocks
+from . import previews
+from . import reading
+from .tasks import derive_attachment_preview
+
+
+def make_subject(owner, name="Subject", topics=1, notes=2, completed=1):
+    subject = Subject.objects.create(name=name, owner=owner)
+    for t in range(topics):
+        topic = Topic.objects.create(name=f"{name} T{t}", subject=subject, order=t)
+        for n in range(notes):
+            Note.objects.create(
+                title=f"{topic.name} N{n}",
+                content="<p>content</p>",
+                topic=topic,
+                owner=owner,
+                is_completed=n < completed,
+            )
+    return subject
+
+
+def make_pdf(pages):
+    """PDF bytes with one line of text ("page N") per page."""
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for number in range(pages):
+        pdf.drawString(72, 720, f"page {number}")
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+class StubInferenceServer:
+    """
+    Local stand-in for the Hugging Face inference API. ``responses`` is a list
+    of (status, body) consumed in order; the last one repeats.
+    """
+
+    def __init__(self, responses=None, delay=0):
+        self.responses = list(responses or [(200, [{"summary_text": "stub summary"}])])
+        self.requests = []
+        self.connections = set()
+        self.delay = delay
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                stub.requests.append(json.loads(self.rfile.read(length) or b"null"))
+                stub.connections.add(self.client_address)
+                time.sleep(stub.delay)
+                status, body = (
+                    stub.responses.pop(0) if len(stub.responses) > 1 else stub.responses[0]
+                )
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.client = self.make_client()
+
+    def make_client(self, **kwargs):
+        client = InferenceClient(self.url, "test-token", **kwargs)
+        client.sleep = lambda seconds: None
+        return client
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self._patch = mock.patch.object(inference, "_client", self.client)
+        self._patch.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._patch.stop()
+        self.client.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ============================
+# Subject progress aggregation
+# ============================
+class SubjectProgressTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", password="pw")
+        self.other = CustomUser.objects.create_user("bob", password="pw")
+
+    def test_with_progress_counts(self):
+        make_subject(self.user, "Owned", topics=2, notes=2, completed=1)
+        shared = make_subject(self.other, "Shared", topics=1, notes=4, completed=3)
+        Collaboration.objects.create(subject=shared, user=self.user)
+        make_subject(self.other, "Hidden")
+
+        subjects = {
+            s.name: s
+            for s in Subject.objects.visible_to(self.user).with_progress(self.user)
+        }
+
+        self.assertEqual(set(subjects), {"Owned", "Shared"})
+        self.assertEqual(subjects["Owned"].total_notes, 4)
+        self.assertEqual(subjects["Owned"].completed_notes, 2)
+        self.assertEqual(subjects["Owned"].topic_count, 2)
+        self.assertEqual(subjects["Owned"].progress_percent, 50)
+        self.assertEqual(subjects["Shared"].total_notes, 4)
+        self.assertEqual(subjects["Shared"].progress_percent, 75)
+
+    def test_owned_subject_ignores_collaborator_notes(self):
+        subject = make_subject(self.user, "Owned", notes=1, completed=1)
+        Note.objects.create(
+            title="theirs", content="", owner=self.other,
+            topic=subject.topics.first(),
+        )
+
+        subject = Subject.objects.with_progress(self.user).get(pk=subject.pk)
+
+        self.assertEqual(subject.total_notes, 1)
+        self.assertEqual(subject.progress_percent, 100)
+
+    def test_subject_list_query_count_is_constant(self):
+        self.client.force_login(self.user)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(reverse("subject_list"))
+            self.assertEqual(response.status_code, 200)
+            return len(ctx)
+
+        make_subject(self.user, "First")
+        baseline = count_queries()
+
+        for i in range(25):
+            make_subject(self.user, f"Owned {i}")
+            shared = make_subject(self.other, f"Shared {i}")
+            Collaboration.objects.create(subject=shared, user=self.user)
+
+        self.assertEqual(count_queries(), baseline)
+        self.assertLessEqual(baseline, 3)
+
+
+# ============================
+# Denormalised counters
+# ============================
+class CounterTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", password="pw")
+        self.subject = Subject.objects.create(name="S", owner=self.user)
+        self.topic = Topic.objects.create(name="T1", subject=self.subject)
+        self.other_topic = Topic.objects.create(name="T2", subject=self.subject)
+
+    def counters(self, obj):
+        obj.refresh_from_db()
+        return obj.note_count, obj.completed_count, obj.read_count
+
+    def new_note(self, **kwargs):
+        kwargs.setdefault("topic", self.topic)
+        return Note.objects.create(title="n", content="", owner=self.user, **kwargs)
+
+    def test_create_and_delete(self):
+        note = self.new_note(is_completed=True)
+        self.new_note(is_read=True)
+
+        self.assertEqual(self.counters(self.topic), (2, 1, 1))
+        self.assertEqual(self.counters(self.subject), (2, 1, 1))
+        self.assertEqual(self.subject.progress, 50)
+
+        note.delete()
+        self.assertEqual(self.counters(self.subject), (1, 0, 1))
+
+    def test_toggle_uses_single_update_per_model(self):
+        note = Note.objects.get(pk=self.new_note().pk)
+        note.is_completed = True
+
+        # UPDATE note, UPDATE topic, UPDATE subject, INSERT progress event
+        with self.assertNumQueries(4):
+            note.save(update_fields=["is_completed"])
+
+        self.assertEqual(self.counters(self.subject), (1, 1, 0))
+        note.is_completed = False
+        note.save()
+        self.assertEqual(self.counters(self.topic), (1, 0, 0))
+
+    def test_move_between_topics(self):
+        note = self.new_note(is_completed=True, is_read=True)
+        note.topic = self.other_topic
+        note.save()
+
+        self.assertEqual(self.counters(self.topic), (0, 0, 0))
+        self.assertEqual(self.counters(self.other_topic), (1, 1, 1))
+        self.assertEqual(self.counters(self.subject), (1, 1, 1))
+
+    def test_note_complete_view(self):
+        note = self.new_note()
+        self.client.force_login(self.user)
+
+        self.client.get(reverse("note_complete", args=[note.pk]))
+
+        self.assertEqual(self.counters(self.subject), (1, 1, 0))
+
+    def test_topic_delete_adjusts_subject_once(self):
+        for n in range(10):
+            self.new_note(is_completed=n < 4)
+        self.new_note(topic=self.other_topic, is_read=True)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.topic.delete()
+
+        updates = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1, updates)
+        self.assertEqual(self.counters(self.subject), (1, 0, 1))
+
+    def test_subject_delete_skips_per_note_counters(self):
+        for n in range(10):
+            self.new_note(topic=self.topic if n % 2 else self.other_topic)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.subject.delete()
+
+        self.assertEqual([q["sql"] for q in queries if q["sql"].startswith("UPDATE")], [])
+        self.assertFalse(Note.objects.exists())
+
+    def test_rebuild_counters_command(self):
+        self.new_note(is_completed=True)
+        Subject.objects.update(note_count=99, completed_count=7)
+        Topic.objects.update(read_count=5)
+
+        call_command("rebuild_counters", stdout=StringIO())
+
+        self.assertEqual(self.counters(self.subject), (1, 1, 0))
+        self.assertEqual(self.counters(self.topic), (1, 1, 0))
+        self.assertEqual(self.counters(self.other_topic), (0, 0, 0))
+
+
+# ============================
+# Full-text search
+# ============================
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", password="pw")
+        self.other = CustomUser.objects.create_user("bob", password="pw")
+        subject = Subject.objects.create(name="S", owner=self.user)
+        self.topic = Topic.objects.create(name="T", subject=subject)
+
+    def new_note(self, title, content, owner=None, topic=None):
+        return Note.objects.create(
+            title=title, content=content,
+            owner=owner or self.user, topic=topic or self.topic,
+        )
+
+    def test_strip_html(self):
+        html = "<p>Binary <b>trees</b>&nbsp;rock</p><script>alert(1)</script>"
+        self.assertEqual(strip_html(html), "Binary trees rock")
+
+    def test_ranked_by_relevance(self):
+        body = self.new_note("Misc", "<p>a note about graphs and sorting</p>")
+        title = self.new_note("Sorting algorithms", "<p>quick merge heap</p>")
+        self.new_note("Networks", "<p>routing tables</p>")
+
+        results = list(search_notes(Note.objects.all(), "sorting"))
+
+        self.assertEqual(results, [title, body])
+
+    def test_all_terms_must_match_and_stemming(self):
+        both = self.new_note("Trees", "<p>balanced binary trees</p>")
+        self.new_note("Binary", "<p>numbers in base two</p>")
+
+        results = list(search_notes(Note.objects.all(), "binary tree"))
+
+        self.assertEqual(results, [both])
+
+    def test_index_follows_edits_and_deletes(self):
+        note = self.new_note("Old title", "<p>stale words</p>")
+        note.content = "<p>fresh words</p>"
+        note.save()
+
+        self.assertFalse(search_notes(Note.objects.all(), "stale").exists())
+        self.assertTrue(search_notes(Note.objects.all(), "fresh").exists())
+
+        note.delete()
+        self.assertFalse(SearchIndexEntry.objects.exists())
+
+    def test_search_view_respects_visibility(self):
+        mine = self.new_note("Kernel scheduling", "")
+        other_subject = Subject.objects.create(name="Other", owner=self.other)
+        other_topic = Topic.objects.create(name="OT", subject=other_subject)
+        self.new_note("Kernel modules", "", owner=self.other, topic=other_topic)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("note_search"), {"q": "kernel"})
+
+        self.assertEqual(list(response.context["page"]), [mine])
+
+
+# ============================
+# Keyset pagination
+# ============================
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("alice", password="pw")
+
+    def walk(self, queryset, ordering, per_page):
+        paginator = KeysetPaginator(queryset, ordering, per_page=per_page)
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen.extend(obj.pk for obj in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_notes_walk_matches_ordering_with_ties(self):
+        subject = Subject.objects.create(name="S", owner=self.user)
+        topic = Topic.objects.create(name="T", subject=subject)
+        for i in range(7):
+            Note.objects.create(title=f"n{i}", content="", topic=topic, owner=self.user)
+        # identical timestamps must still page deterministically
+        Note.objects.update(created_at=timezone.now())
+
+        notes = Note.objects.filter(owner=self.user)
+        expected = list(notes.order_by("-created_at", "-pk").values_list("pk", flat=True))
+
+        self.assertEqual(self.walk(notes, NOTE_ORDERING, per_page=3), expected)
+
+    def test_tasks_with_null_due_dates_sort_last(self):
+        now = timezone.now()
+        for i, due in enumerate([None, now, now + timedelta(days=1), None, now]):
+            Task.objects.create(title=f"t{i}", user=self.user, due_date=due)
+
+        tasks = Task.objects.filter(user=self.user)
+        pks = self.walk(tasks, TASK_ORDERING, per_page=2)
+
+        due_dates = [Task.objects.get(pk=pk).due_date for pk in pks]
+        self.assertEqual(len(pks), 5)
+        self.assertEqual(due_dates[-2:], [None, None])
+        self.assertEqual(due_dates[:3], sorted(due_dates[:3]))
+
+    def test_tampered_cursor_rejected(self):
+        paginator = KeysetPaginator(Task.objects.all(), TASK_ORDERING)
+        with self.assertRaises(InvalidCursor):
+            paginator.page("not-a-cursor")
+
+    def test_json_api(self):
+        for i in range(3):
+            Task.objects.create(title=f"t{i}", user=self.user)
+        self.client.force_login(self.user)
+
+        first = self.client.get(reverse("task_list_api"), {"limit": 2}).json()
+        second = self.client.get(
+            reverse("task_list_api"), {"limit": 2, "cursor": first["next_cursor"]}
+        ).json()
+
+        self.assertEqual(len(first["results"]), 2)
+        self.assertEqual(len(second["results"]), 1)
+        self.assertIsNone(second["next_cursor"])
+        self.assertEqual(
+            self.client.get(reverse("note_list_api"), {"cursor": "bad"}).status_code, 400
+        )
+
+    def test_html_lists_render(self):
+        self.client.force_login(self.user)
+        for name in ("note_list", "bookmark_list", "task_list"):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+
+
+# ============================
+# Asynchronous summaries
+# ============================
+class SummaryJobTests(TestCase):
+
+    def setUp(self):
+        # Run the Celery task inline instead of going through a broker
+        inline = mock.patch(
+            "notes.tasks.summarize_job.delay",
+            side_effect=lambda job_id: summarize_job.apply(args=[job_id]),
+        )
+        inline.start()
+        self.addCleanup(inline.stop)
+
+        summary_cache.clear()
+        cache.clear()
+
+        self.user = CustomUser.objects.create_user("alice", password="pw")
+        subject = Subject.objects.create(name="S", owner=self.user)
+        topic = Topic.objects.create(name="T", subject=subject)
+        self.note = Note.objects.create(
+            title="Paging", content="<p>Virtual memory uses pages.</p>",
+            topic=topic, owner=self.user,
+        )
+        self.client.force_login(self.user)
+
+    def submit(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse("summary_submit"), data)
+
+    def test_submit_poll_and_persist(self):
+        with StubInferenceServer() as stub:
+            response = self.submit(note_id=self.note.pk)
+
+        self.assertEqual(response.status_code, 202)
+        status = self.client.get(response.json()["status_url"]).json()
+        self.assertEqual(status["status"], SummaryJob.STATUS_DONE)
+        self.assertEqual(status["summary"], "stub summary")
+        self.assertEqual(stub.requests[0]["inputs"], "Virtual memory uses pages.")
+
+        summary = Summary.objects.get(note=self.note)
+        self.assertEqual(summary.summary_text, "stub summary")
+        self.assertIn("memory", summary.keywords)
+
+    def test_unchanged_note_is_not_reenqueued(self):
+        with StubInferenceServer() as stub:
+            first = self.submit(note_id=self.note.pk).json()
+            second = self.submit(note_id=self.note.pk).json()
+
+            self.note.content = "<p>Now about segmentation.</p>"
+            self.note.save()
+            third = self.submit(note_id=self.note.pk).json()
+
+        self.assertEqual(first["job_id"], second["job_id"])
+        self.assertNotEqual(first["job_id"], third["job_id"])
+        self.assertEqual(len(stub.requests), 2)
+
+    def test_upstream_error_marks_job_failed(self):
+        with mock.patch("notes.tasks.FALLBACK", False), \
+                StubInferenceServer([(500, {"error": "boom"})]):
+            job_id = self.submit(user_text="some text").json()["job_id"]
+
+        job = SummaryJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, SummaryJob.STATUS_FAILED)
+        self.assertTrue(job.error)
+
+    def test_upstream_error_falls_back_to_extractive_summary(self):
+        with StubInferenceServer([(500, {"error": "boom"})]):
+            job_id = self.submit(note_id=self.note.pk).json()["job_id"]
+
+        job = SummaryJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, SummaryJob.STATUS_DONE)
+        self.assertEqual(job.result_text, "Virtual memory uses pages.")
+        self.assertTrue(job.error)
+
+        summary = Summary.objects.get(note=self.note)
+        self.assertEqual(summary.method, Summary.METHOD_EXTRACTIVE)
+        self.assertIn("pages", summary.keywords)
+
+    def test_unexpected_error_fails_job_and_allows_resubmit(self):
+        with StubInferenceServer(), \
+                mock.patch("notes.tasks.refresh_keywords", side_effect=RuntimeError("db down")):
+            first = self.submit(note_id=self.note.pk).json()["job_id"]
+
+        job = SummaryJob.objects.get(pk=first)
+        self.assertEqual(job.status, SummaryJob.STATUS_FAILED)
+        self.assertEqual(job.error, "db down")
+        self.assertFalse(Summary.objects.filter(note=self.note).exists())
+
+        with StubInferenceServer():
+            second = self.submit(note_id=self.note.pk).json()["job_id"]
+        self.assertNotEqual(first, second)
+        self.assertEqual(SummaryJob.objects.get(pk=second).status, SummaryJob.STATUS_DONE)
+
+    def test_stale_pending_job_is_replaced(self):
+        from .tasks import SUMMARY_STALE_AFTER
+
+        digest = content_hash(strip_html(self.note.content))
+        running = SummaryJob.objects.create(
+            user=self.user, note=self.note, input_text="t", content_hash=digest,
+            status=SummaryJob.STATUS_RUNNING,
+        )
+        with mock.patch("notes.tasks.summarize_job.delay"):
+            self.assertEqual(self.submit(note_id=self.note.pk).json()["job_id"], str(running.pk))
+
+        # its worker was killed: nothing moves it on
+        SummaryJob.objects.filter(pk=running.pk).update(
+            updated_at=timezone.now() - SUMMARY_STALE_AFTER - timedelta(seconds=1),
+        )
+        with StubInferenceServer():
+            replacement = self.submit(note_id=self.note.pk).json()["job_id"]
+
+        self.assertNotEqual(replacement, str(running.pk))
+        self.assertEqual(SummaryJob.objects.get(pk=running.pk).status, SummaryJob.STATUS_FAILED)
+        self.assertEqual(SummaryJob.objects.get(pk=replacement).status, SummaryJob.STATUS_DONE)
+
+    def test_jobs_are_private(self):
+        with StubInferenceServer():
+            job_id = self.submit(user_text="private").json()["job_id"]
+
+        other = CustomUser.objects.create_user("bob", password="pw")
+        self.client.force_login(other)
+        response = self.client.get(reverse("summary_status", args=[job_id]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_pending_job_page_polls_once(self):
+        job = SummaryJob.objects.create(user=self.user, input_text="t", content_hash="h")
+        response = self.client.get(reverse("summarizer"), {"job": job.pk})
+
+        self.assertContains(response, "<title>NoteEve - AI Summarizer - NoteEve</title>")
+        self.assertContains(response, "(function poll()", count=1)
+
+
+# ============================
+# Summary cache
+# ============================
+class SummaryCacheTests(TestCase):
+
+    def setUp(self):
+        summary_cache.clear()
+        cache.clear()
+
+    def test_repeat_summary_served_from_cache(self):
+        with StubInferenceServer() as stub:
+            first = generate_summary("Some   lecture text")
+            second = generate_summary("Some lecture text")
+
+        self.assertEqual(first, second)
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(summary_cache.stats["misses"], 1)
+        self.assertEqual(summary_cache.stats["local_hits"], 1)
+
+    def test_parameters_are_part_of_the_key(self):
+        with StubInferenceServer() as stub:
+            generate_summary("text", max_length=100)
+            generate_summary("text", max_length=60)
+
+        self.assertEqual(len(stub.requests), 2)
+
+    def test_errors_are_not_cached(self):
+        with StubInferenceServer([(500, {"error": "boom"})]) as stub:
+            for _ in range(2):
+                with self.assertRaises(InferenceError):
+                    generate_summary("text")
+
+        self.assertEqual(len(stub.requests), 2)
+
+    def test_lru_eviction_and_shared_tier(self):
+        local = SummaryCache(max_entries=2)
+        for i in range(3):
+            local.set(f"k{i}", f"v{i}")
+
+        self.assertEqual(local.stats["evictions"], 1)
+        # evicted locally, still in the shared tier
+        self.assertEqual(local.get("k0"), "v0")
+        self.assertEqual(local.stats["shared_hits"], 1)
+
+    def test_ttl_expiry(self):
+        local = SummaryCache(ttl=60)
+        local.set("k", "v")
+
+        with mock.patch("notes.ai_utils.time.monotonic", return_value=10 ** 9):
+            cache.delete("k")
+            self.assertIsNone(local.get("k"))
+
+        self.assertEqual(local.stats["expirations"], 1)
+
+    def test_stats_are_exact_under_concurrency(self):
+        local = SummaryCache()
+        cache.set("shared", "v")
+
+        def lookups():
+            for i in range(200):
+                local.get(f"missing-{i}")
+                local._remember("shared", "v", stat="shared_hits")
+
+        threads = [threading.Thread(target=lookups) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        snapshot = local.snapshot()
+        self.assertEqual((snapshot["misses"], snapshot["shared_hits"]), (1600, 1600))
+
+    def test_note_content_change_invalidates(self):
+        user = CustomUser.objects.create_user("alice", password="pw")
+        subject = Subject.objects.create(name="S", owner=user)
+        topic = Topic.objects.create(name="T", subject=subject)
+        note = Note.objects.create(title="n", content="<p>old text</p>", topic=topic, owner=user)
+
+        old_hash = content_hash("old text")
+        key = SummaryCache.make_key(old_hash)
+        summary_cache.set(key, "old summary")
+        Summary.objects.create(note=note, summary_text="old summary", content_hash=old_hash)
+
+        note.content = "<p>new text</p>"
+        note.save()
+
+        self.assertIsNone(summary_cache.get(key))
+
+
+# ============================
+# Chunked summaries
+# ============================
+class ChunkedSummaryTests(TestCase):
+
+    def setUp(self):
+        summary_cache.clear()
+        cache.clear()
+
+    def document(self, sentences):
+        return " ".join(f"Sentence number {i} talks about topic {i}." for i in range(sentences))
+
+    def test_chunks_respect_budget_and_overlap(self):
+        chunks = chunk_text(self.document(100), max_words=60, overlap=12)
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(c.split()) <= 60 for c in chunks))
+        # consecutive chunks share the trailing sentence(s)
+        for previous, current in zip(chunks, chunks[1:]):
+            self.assertTrue(current.startswith(previous.split(". ")[-1].rstrip(".")))
+
+    def test_oversized_sentence_is_split(self):
+        chunks = chunk_text("word " * 250, max_words=100, overlap=0)
+        self.assertEqual([len(c.split()) for c in chunks], [100, 100, 50])
+
+    def test_chunks_run_concurrently(self):
+        text = self.document(40)
+
+        with StubInferenceServer(delay=0.3) as stub:
+            started = time.monotonic()
+            summary = summarize_document(text, concurrency=8, max_words=60)
+            elapsed = time.monotonic() - started
+
+        map_requests = len(stub.requests) - 1
+        self.assertEqual(summary, "stub summary")
+        self.assertGreaterEqual(map_requests, 4)
+        # one map round + one reduce round, not one round per chunk
+        self.assertLess(elapsed, 0.3 * map_requests)
+
+    def test_deadline_with_partial_results(self):
+        def fake_summary(text):
+            if "slow" in text:
+                time.sleep(1)
+            return "partial"
+
+        text = "fast text. " * 40 + "slow text. " * 40
+
+        with mock.patch("notes.ai_utils.generate_summary", side_effect=fake_summary):
+            partial = summarize_document(text, deadline=0.3, max_words=40)
+            with self.assertRaises(InferenceError):
+                summarize_document(text, deadline=0.3, max_words=40, allow_partial=False)
+
+        self.assertEqual(partial, "partial")
+
+    def test_final_summary_is_bounded(self):
+        calls = []
+
+        def fake_summary(text):
+            calls.append(text)
+            if len(calls) > 2:  # the reduce call
+                time.sleep(1)
+            return "piece"
+
+        with mock.patch("notes.ai_utils.generate_summary", side_effect=fake_summary):
+            started = time.monotonic()
+            with self.assertRaisesMessage(InferenceError, "deadline"):
+                summarize_document("text. " * 60, deadline=0.3, max_words=40)
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_short_text_is_bounded(self):
+        def slow_summary(text):
+            time.sleep(1)
+            return "late"
+
+        with mock.patch("notes.ai_utils.generate_summary", side_effect=slow_summary):
+            started = time.monotonic()
+            with self.assertRaisesMessage(InferenceError, "deadline"):
+                summarize_document("Short text.", deadline=0.2)
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    def test_reduce_rounds_exhausted_truncate_the_final_input(self):
+        final = []
+
+        def fake_summary(text):
+            final[:] = [text]
+            return "summary that never gets shorter " * 10  # 50 words
+
+        with mock.patch("notes.ai_utils.generate_summary", side_effect=fake_summary):
+            summarize_document(self.document(40), max_words=60)
+
+        self.assertEqual(len(final[0].split()), 60)
+
+
+# ============================
+# Inference client
+# ============================
+class InferenceClientTests(TestCase):
+    OK = (200, [{"summary_text": "ok"}])
+
+    def test_connections_are_reused(self):
+        with StubInferenceServer() as stub:
+            for _ in range(5):
+                stub.client.post({"inputs": "x"})
+
+        self.assertEqual(len(stub.requests), 5)
+        self.assertEqual(len(stub.connections), 1)
+
+    def test_retries_model_loading_with_backoff(self):
+        loading = (503, {"error": "loading", "estimated_time": 7.5})
+        sleeps = []
+
+        with StubInferenceServer([loading, (429, {}), self.OK]) as stub:
+            stub.client.sleep = sleeps.append
+            result = stub.client.post({"inputs": "x"})
+
+        self.assertEqual(result, [{"summary_text": "ok"}])
+        self.assertEqual(len(stub.requests), 3)
+        self.assertGreaterEqual(sleeps[0], 7.5)
+        latency = stub.client.metrics()["latency"]
+        self.assertEqual(latency["retryable_status"]["count"], 2)
+        self.assertEqual(latency["success"]["count"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        with StubInferenceServer([(503, {})]) as stub:
+            client = stub.make_client(max_retries=2)
+            with self.assertRaises(InferenceError):
+                client.post({"inputs": "x"})
+
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_backoff_is_bounded_jitter(self):
+        client = InferenceClient("http://unused", "t", backoff_base=1, backoff_max=5)
+        for attempt in range(10):
+            self.assertLessEqual(client.backoff(attempt), 5)
+        self.assertEqual(client.backoff(0, hint=100), 5)
+
+    def test_circuit_breaker_fails_fast_then_recovers(self):
+        with StubInferenceServer([(500, {}), (500, {}), self.OK]) as stub:
+            client = stub.make_client(breaker_threshold=2, breaker_cooldown=60)
+            for _ in range(2):
+                with self.assertRaises(InferenceError):
+                    client.post({"inputs": "x"})
+
+            with self.assertRaises(InferenceUnavailable):
+                client.post({"inputs": "x"})
+            self.assertEqual(len(stub.requests), 2)
+
+            # after the cooldown a single probe goes through and closes it
+            client.breaker.opened_at -= 61
+            self.assertEqual(client.post({"inputs": "x"}), [{"summary_text": "ok"}])
+
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_allows_one_probe(self):
+        now = [0.0]
+        breaker = CircuitBreaker(threshold=1, cooldown=10, clock=lambda: now[0])
+        breaker.record_failure()
+
+        now[0] = 11
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+
+# ============================
+# PDF text extraction
+# ============================
+class PdfExtractionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def upload(self, data, name="doc.pdf"):
+        return SimpleUploadedFile(name, data, content_type="application/pdf")
+
+    def write(self, data):
+        handle = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        handle.write(data)
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        return handle.name
+
+    def test_parallel_extraction_keeps_page_order(self):
+        path = self.write(make_pdf(7))
+        text = extract_file(path, pages_per_task=2, parallel=True)
+        pages = [line for line in text.splitlines() if line.startswith("page")]
+        self.assertEqual(pages, [f"page {n}" for n in range(7)])
+
+    def test_page_and_char_caps(self):
+        path = self.write(make_pdf(6))
+        self.assertNotIn("page 3", extract_file(path, max_pages=3, parallel=False))
+        self.assertEqual(len(extract_file(path, max_chars=10, parallel=False)), 10)
+
+    def test_pdfminer_backend(self):
+        path = self.write(make_pdf(2))
+        text = extract_file(path, backend="pdfminer", parallel=False)
+        self.assertIn("page 0", text)
+        self.assertIn("page 1", text)
+
+    def test_invalid_pdf_raises(self):
+        with self.assertRaises(PdfExtractionError):
+            extract_pdf_text(self.upload(b"not a pdf"))
+
+    def test_reupload_is_served_from_cache(self):
+        data = make_pdf(2)
+        with mock.patch.object(pdf_extract, "extract_file", wraps=extract_file) as spy:
+            first = extract_pdf_text(self.upload(data))
+            second = extract_pdf_text(self.upload(data, name="copy.pdf"))
+
+        self.assertEqual(first, second)
+        self.assertEqual(spy.call_count, 1)
+
+    def test_broken_pool_is_replaced(self):
+        from concurrent.futures.process import BrokenProcessPool
+
+        broken = mock.Mock(submit=mock.Mock(side_effect=BrokenProcessPool("worker died")))
+        with mock.patch.object(pdf_extract, "_pool", broken):
+            text = extract_file(self.write(make_pdf(3)), pages_per_task=1, parallel=True)
+            self.assertIsNot(pdf_extract._pool, broken)
+            self.addCleanup(pdf_extract._pool.shutdown)
+        self.assertIn("page 2", text)
+        broken.shutdown.assert_called_once()
+
+    def test_spooled_upload_is_used_in_place(self):
+        from django.core.files.uploadedfile import TemporaryUploadedFile
+
+        uploaded = TemporaryUploadedFile("doc.pdf", "application/pdf", 0, None)
+        uploaded.write(make_pdf(1))
+        uploaded.flush()
+        uploaded.sha256 = "f" * 64
+        self.addCleanup(uploaded.close)
+
+        with pdf_extract.spool_upload(uploaded) as (path, digest):
+            self.assertEqual((path, digest), (uploaded.temporary_file_path(), "f" * 64))
+        self.assertTrue(os.path.exists(path))  # the upload's own file is left alone
+
+        with pdf_extract.spool_upload(self.upload(b"%PDF")) as (path, digest):
+            self.assertEqual(digest, hashlib.sha256(b"%PDF").hexdigest())
+        self.assertFalse(os.path.exists(path))
+
+    def test_summary_submit_rejects_unreadable_pdf(self):
+        user = CustomUser.objects.create_user(username="pdf", password="pw")
+        self.client.force_login(user)
+
+        response = self.client.post(
+            reverse("summary_submit"), {"pdf_file": self.upload(b"garbage")}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.json())
+        self.assertFalse(SummaryJob.objects.exists())
+
+
+# ============================
+# PDF compilation
+# ============================
+class PdfCompileTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="compiler", password="pw")
+        self.client.force_login(self.user)
+        self.subject = make_subject(self.user, topics=2, notes=3)
+
+    def compile(self, notes):
+        from PyPDF2 import PdfReader
+
+        data = b"".join(compile_pdf(notes))
+        return PdfReader(BytesIO(data))
+
+    def test_html_blocks(self):
+        blocks = html_blocks("<h2>Intro</h2><p>one &amp; two</p><ul><li>a</li></ul><script>x</script>")
+        self.assertEqual(blocks, [("heading", "Intro"), ("body", "one & two"), ("body", "• a")])
+
+    def test_renders_content_and_breaks_pages(self):
+        note = Note.objects.first()
+        note.content = "<p>Distinctive opening.</p>" + "<p>%s</p>" % ("word " * 3000)
+        note.save()
+
+        reader = self.compile(Note.objects.select_related("topic__subject"))
+        self.assertGreater(len(reader.pages), 1)
+        text = "".join(page.extract_text() for page in reader.pages)
+        self.assertIn("Distinctive opening.", text)
+        self.assertIn(note.topic.subject.name, text)
+
+    def test_view_streams_in_constant_queries(self):
+        ids = list(Note.objects.values_list("pk", flat=True))
+
+        with self.assertNumQueries(3):  # session, user, exists()
+            response = self.client.post(reverse("pdf_compile"), {"note_ids": ids})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/pdf")
+
+        # notes, topics and subjects come from a single query while streaming
+        with CaptureQueriesContext(connection) as ctx:
+            data = b"".join(response.streaming_content)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertTrue(data.startswith(b"%PDF-") and data.rstrip().endswith(b"%%EOF"))
+
+    def test_fragments_cached_until_note_changes(self):
+        notes = lambda: Note.objects.select_related("topic__subject")
+        b"".join(compile_pdf(notes()))
+
+        with mock.patch.object(pdf_compile, "_render_fragment", wraps=pdf_compile._render_fragment) as spy:
+            b"".join(compile_pdf(notes()))
+            self.assertEqual(spy.call_count, 0)
+
+            note = Note.objects.first()
+            note.content = "<p>changed</p>"
+            note.save()
+            b"".join(compile_pdf(notes()))
+            self.assertEqual(spy.call_count, 1)
+
+    def test_empty_note_compiles_from_cache(self):
+        Note.objects.filter(pk=Note.objects.first().pk).update(content="<p>  </p>")
+        notes = lambda: Note.objects.select_related("topic__subject")
+
+        first = b"".join(compile_pdf(notes()))
+        second = b"".join(compile_pdf(notes()))
+        self.assertEqual(len(first), len(second))
+        self.assertTrue(second.rstrip().endswith(b"%%EOF"))
+
+    def test_other_users_notes_are_ignored(self):
+        other = CustomUser.objects.create_user(username="other", password="pw")
+        foreign = make_subject(other, notes=1).topics.first().notes.first()
+
+        response = self.client.post(reverse("pdf_compile"), {"note_ids": [foreign.pk]})
+        self.assertRedirects(response, reverse("subject_list"))
+
+
+# ============================
+# Background PDF compile jobs
+# ============================
+@override_settings(PDF_COMPILE={"SYNC_LIMIT": 2})
+class CompileJobTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+        self.delay = mock.patch(
+            "notes.tasks.compile_pdf_job.delay",
+            side_effect=lambda job_id: compile_pdf_job.apply(args=[job_id]),
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="big", password="pw")
+        self.client.force_login(self.user)
+        make_subject(self.user, topics=2, notes=3)
+        self.ids = list(Note.objects.values_list("pk", flat=True))
+
+    def submit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse("pdf_compile"), {"note_ids": self.ids})
+
+    def test_large_selection_runs_as_job(self):
+        response = self.submit()
+        job = CompileJob.objects.get()
+        self.assertRedirects(response, f"{reverse('pdf_compile')}?job={job.pk}")
+
+        self.assertEqual(job.status, CompileJob.STATUS_DONE)
+        self.assertEqual(job.progress, 100)
+        self.assertTrue(job.has_artifact())
+
+        status = self.client.get(reverse("pdf_compile_status", args=[job.pk])).json()
+        self.assertEqual(status["download_url"], reverse("pdf_compile_download", args=[job.pk]))
+
+        response = self.client.get(status["download_url"])
+        data = b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(int(response["Content-Length"]), job.size)
+        self.assertTrue(data.startswith(b"%PDF-"))
+
+    def test_range_download(self):
+        self.submit()
+        job = CompileJob.objects.get()
+        url = reverse("pdf_compile_download", args=[job.pk])
+        with job.artifact.open("rb") as f:
+            full = f.read()
+
+        response = self.client.get(url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{len(full)}")
+        self.assertEqual(b"".join(response.streaming_content), full[10:20])
+
+        response = self.client.get(url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(response.streaming_content), full[-5:])
+
+        response = self.client.get(url, HTTP_RANGE=f"bytes={len(full)}-")
+        self.assertEqual(response.status_code, 416)
+
+        # stale validator: the partial copy is of another file
+        response = self.client.get(url, HTTP_RANGE="bytes=10-19", HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_same_selection_reuses_artifact(self):
+        self.submit()
+        self.submit()
+        self.assertEqual(CompileJob.objects.count(), 1)
+        self.assertEqual(self.delay.call_count, 1)
+
+        note = Note.objects.get(pk=self.ids[0])
+        note.title = "Changed"
+        note.save()
+        self.submit()
+        self.assertEqual(CompileJob.objects.count(), 2)
+
+    def test_missing_artifact_is_rebuilt(self):
+        self.submit()
+        job = CompileJob.objects.get()
+        job.artifact.delete(save=False)
+
+        self.assertNotEqual(submit_compile_job(self.user, self.ids).pk, job.pk)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 9))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=50-500", 100), (50, 99))
+        self.assertIsNone(parse_range("bytes=0-1,5-6", 100))
+        with self.assertRaises(ValueError):
+            parse_range("bytes=100-", 100)
+
+
+# ============================
+# Dashboard
+# ============================
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="dash", password="pw")
+        self.subject = make_subject(self.user, topics=2, notes=2, completed=1)
+        Subject.objects.create(name="Empty", owner=self.user)
+
+        now = timezone.now()
+        Task.objects.create(title="later", user=self.user, due_date=now + timedelta(days=2))
+        Task.objects.create(title="undated", user=self.user)
+        Task.objects.create(title="soon", user=self.user, due_date=now + timedelta(days=1))
+        Task.objects.create(title="done", user=self.user, completed=True)
+        Bookmark.objects.create(user=self.user, note=Note.objects.first())
+
+    def test_aggregates(self):
+        data = dashboard_data(self.user)
+
+        self.assertEqual(data["subjects_count"], 2)
+        self.assertEqual(data["notes_count"], 4)
+        self.assertEqual(data["bookmarks_count"], 1)
+        self.assertEqual(data["pending_tasks"], 3)
+        self.assertEqual([t["title"] for t in data["upcoming_tasks"]], ["soon", "later", "undated"])
+        self.assertEqual(len(data["recent_activity"]), 3)
+        self.assertEqual(
+            data["recent_activity"][0], f"Added note: {Note.objects.order_by('-created_at', '-pk')[0].title}"
+        )
+
+        subject = next(s for s in data["subjects"] if s["id"] == self.subject.pk)
+        self.assertEqual(subject["progress"], 50)
+        self.assertEqual(len(subject["topics"]), 2)
+
+    def test_query_budget(self):
+        with self.assertNumQueries(2):
+            dashboard_data(self.user)
+        with self.assertNumQueries(0):
+            dashboard_data(self.user)
+
+        self.client.force_login(self.user)
+        with self.assertNumQueries(2):  # session + user only
+            response = self.client.get(reverse("dashboard"))
+        self.assertContains(response, "Empty")
+
+    def test_writes_invalidate(self):
+        dashboard_data(self.user)
+
+        Bookmark.objects.create(user=self.user, note=Note.objects.last())
+        self.assertEqual(dashboard_data(self.user)["bookmarks_count"], 2)
+
+        Task.objects.filter(title="soon").get().delete()
+        self.assertEqual(dashboard_data(self.user)["pending_tasks"], 2)
+
+        note = Note.objects.filter(is_completed=False).first()
+        note.is_completed = True
+        note.save(update_fields=["is_completed", "updated_at"])
+        subject = next(s for s in dashboard_data(self.user)["subjects"] if s["id"] == self.subject.pk)
+        self.assertEqual(subject["progress"], 75)
+
+    def test_collaborator_note_invalidates_owner(self):
+        dashboard_data(self.user)
+
+        helper = CustomUser.objects.create_user(username="helper", password="pw")
+        Collaboration.objects.create(subject=self.subject, user=helper, permission_level="edit")
+        Note.objects.create(
+            title="From helper", content="", topic=self.subject.topics.first(),
+            owner=helper, is_completed=True,
+        )
+
+        subject = next(s for s in dashboard_data(self.user)["subjects"] if s["id"] == self.subject.pk)
+        self.assertEqual(subject["progress"], 60)
+
+
+# ============================
+# Progress history
+# ============================
+class ProgressHistoryTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="prog", password="pw")
+        self.subject = make_subject(self.user, topics=1, notes=4, completed=0)
+        self.notes = list(Note.objects.order_by("pk"))
+        self.today = timezone.localdate()
+
+    def complete(self, note, days_ago=0, done=True):
+        note.is_completed = done
+        note.save(update_fields=["is_completed", "updated_at"])
+        if days_ago:
+            ProgressEvent.objects.filter(pk=ProgressEvent.objects.latest("pk").pk).update(
+                created_at=timezone.now() - timedelta(days=days_ago)
+            )
+
+    def test_events_only_on_state_changes(self):
+        note = self.notes[0]
+        note.title = "renamed"
+        note.save()
+        self.assertFalse(ProgressEvent.objects.exists())
+
+        self.complete(note)
+        self.complete(note, done=False)
+        self.assertEqual(
+            list(ProgressEvent.objects.values_list("completed_delta", flat=True)), [1, -1]
+        )
+
+    def test_rollup_builds_running_totals(self):
+        self.complete(self.notes[0], days_ago=3)
+        self.complete(self.notes[1], days_ago=1)
+        self.complete(self.notes[2], days_ago=1)
+        self.assertEqual(rollup_events(), 3)
+        self.assertFalse(ProgressEvent.objects.exists())
+
+        # a later rollup of the same day adds to that day's row
+        self.complete(self.notes[3], days_ago=1)
+        rollup_events()
+
+        snapshots = ProgressSnapshot.objects.filter(subject=self.subject).order_by("date")
+        self.assertEqual(
+            [(s.completed_delta, s.completed_total) for s in snapshots], [(1, 1), (3, 4)]
+        )
+
+    def test_series_granularities_and_baseline(self):
+        self.complete(self.notes[0], days_ago=20)
+        self.complete(self.notes[1], days_ago=2)
+        self.complete(self.notes[2], days_ago=2)
+        rollup_events()
+
+        start = self.today - timedelta(days=6)
+        series = progress_series(self.user, start, self.today)
+        self.assertEqual(len(series["labels"]), 7)
+        self.assertEqual(series["completed_total"][0], 1)  # carried from before the range
+        self.assertEqual(series["completed_total"][-1], 3)
+        self.assertEqual(sum(series["completed"]), 2)
+
+        monthly = progress_series(self.user, self.today - timedelta(days=60), self.today, "month")
+        self.assertTrue(all(label.endswith("-01") for label in monthly["labels"]))
+        self.assertEqual(monthly["completed_total"][-1], 3)
+
+        with self.assertRaises(ValueError):
+            progress_series(self.user, date(1900, 1, 1), self.today, "day")
+
+    def test_api_conditional_requests(self):
+        self.complete(self.notes[0], days_ago=1)
+        rollup_events()
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("progress_api"), {"granularity": "week"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"][-1], 1)
+        self.assertIn("Last-Modified", response)
+
+        again = self.client.get(
+            reverse("progress_api"), {"granularity": "week"},
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(again.status_code, 304)
+
+        self.complete(self.notes[1])
+        rollup_events()
+        changed = self.client.get(
+            reverse("progress_api"), {"granularity": "week"},
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(changed.status_code, 200)
+
+        bad = self.client.get(reverse("progress_api"), {"granularity": "hour"})
+        self.assertEqual(bad.status_code, 400)
+
+    def totals(self):
+        rollup_events()
+        return ProgressSnapshot.objects.filter(subject=self.subject).latest("date").completed_total
+
+    def test_deletes_leave_the_totals(self):
+        for note in self.notes:
+            self.complete(note, days_ago=1)
+        self.assertEqual(self.totals(), 4)
+
+        self.notes[0].delete()
+        self.assertEqual(self.totals(), 3)
+
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse("note_bulk_api"),
+            data=json.dumps({"operations": [{"op": "delete", "id": self.notes[1].pk}]}),
+            content_type="application/json",
+        )
+        self.assertEqual(self.totals(), 2)
+
+        # pending events of the topic's notes are deleted with it, not counted twice
+        self.complete(self.notes[2], done=False)
+        self.subject.topics.get().delete()
+        self.assertEqual(self.totals(), 0)
+
+    def test_deleting_a_user_with_completed_notes(self):
+        other = CustomUser.objects.create_user(username="host", password="pw")
+        hosted = make_subject(other, notes=1, completed=0)
+        Note.objects.create(
+            title="guest", content="", topic=hosted.topics.get(), owner=self.user,
+            is_completed=True,
+        )
+        self.complete(self.notes[0])
+
+        self.user.delete()
+
+        self.assertFalse(Note.objects.filter(owner_id=self.user.pk).exists())
+        self.assertFalse(ProgressEvent.objects.filter(user_id=self.user.pk).exists())
+        hosted.refresh_from_db()
+        self.assertEqual((hosted.note_count, hosted.completed_count), (1, 0))
+
+    def test_baseline_seeds_state_from_before_history(self):
+        import importlib
+        from django.apps import apps
+
+        seed = importlib.import_module("notes.migrations.0015_progress_baseline")
+        # completed before events were recorded, then one tracked completion
+        Note.objects.filter(pk__in=[n.pk for n in self.notes[:2]]).update(is_completed=True)
+        self.complete(self.notes[2], days_ago=3)
+        rollup_events()
+        ProgressSnapshot.objects.update(date=self.today - timedelta(days=3))
+
+        seed.seed_progress_baseline(apps, None)
+        seed.seed_progress_baseline(apps, None)  # nothing left to seed
+
+        snapshots = ProgressSnapshot.objects.filter(subject=self.subject).order_by("date")
+        self.assertEqual(
+            [(s.date, s.completed_delta, s.completed_total) for s in snapshots],
+            [(self.today - timedelta(days=4), 2, 2), (self.today - timedelta(days=3), 1, 3)],
+        )
+
+
+# ============================
+# Permission resolution
+# ============================
+class PermissionResolverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(username="owner", password="pw")
+        self.reader = CustomUser.objects.create_user(username="reader", password="pw")
+        self.shared = make_subject(self.owner, name="Shared", notes=50)
+        self.private = make_subject(self.owner, name="Private", notes=50)
+        self.collab = Collaboration.objects.create(subject=self.shared, user=self.reader)
+
+    def test_page_of_notes_costs_one_query(self):
+        notes = list(Note.objects.select_related("topic")[:100])
+
+        with self.assertNumQueries(1):
+            visible = PermissionResolver(self.reader).visible_notes(notes)
+        self.assertEqual(len(visible), 50)
+        self.assertTrue(all(n.topic.subject_id == self.shared.pk for n in visible))
+
+        # cached across requests
+        with self.assertNumQueries(0):
+            PermissionResolver(self.reader).visible_notes(notes)
+
+    def test_levels(self):
+        owner = PermissionResolver(self.owner)
+        self.assertEqual(owner.level(self.private.pk), "owner")
+        self.assertTrue(owner.can_edit_subject(self.shared.pk))
+
+        reader = PermissionResolver(self.reader)
+        self.assertTrue(reader.can_view_subject(self.shared.pk))
+        self.assertFalse(reader.can_edit_subject(self.shared.pk))
+        self.assertFalse(reader.can_view_subject(self.private.pk))
+
+    def test_collaboration_changes_invalidate(self):
+        PermissionResolver(self.reader).access_map
+
+        self.collab.permission_level = "edit"
+        self.collab.save()
+        self.assertTrue(PermissionResolver(self.reader).can_edit_subject(self.shared.pk))
+
+        Collaboration.objects.create(subject=self.private, user=self.reader)
+        self.assertTrue(PermissionResolver(self.reader).can_view_subject(self.private.pk))
+
+        self.collab.delete()
+        self.assertFalse(PermissionResolver(self.reader).can_view_subject(self.shared.pk))
+
+        subject = Subject.objects.create(name="New", owner=self.reader)
+        self.assertEqual(PermissionResolver(self.reader).level(subject.pk), "owner")
+
+    def test_views_use_resolver(self):
+        self.client.force_login(self.reader)
+        shared_note = Note.objects.filter(topic__subject=self.shared).first()
+        private_note = Note.objects.filter(topic__subject=self.private).first()
+
+        self.assertEqual(self.client.get(reverse("note_view", args=[shared_note.pk])).status_code, 200)
+        self.assertRedirects(
+            self.client.get(reverse("note_view", args=[private_note.pk])),
+            reverse("subject_list"),
+        )
+        self.assertEqual(self.client.get(reverse("subject_detail", args=[self.shared.pk])).status_code, 200)
+
+        private_note.is_public = True
+        private_note.save()
+        self.assertEqual(self.client.get(reverse("note_view", args=[private_note.pk])).status_code, 200)
+
+
+# ============================
+# Bulk note operations
+# ============================
+class BulkOperationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="bulk", password="pw")
+        self.subject = Subject.objects.create(name="S", owner=self.user)
+        self.topic = Topic.objects.create(name="T1", subject=self.subject)
+        self.other_topic = Topic.objects.create(name="T2", subject=self.subject)
+        self.client.force_login(self.user)
+
+    def post(self, operations):
+        return self.client.post(
+            reverse("note_bulk_api"),
+            data=json.dumps({"operations": operations}),
+            content_type="application/json",
+        )
+
+    def counters(self, obj):
+        obj.refresh_from_db()
+        return obj.note_count, obj.completed_count
+
+    def test_mixed_batch_with_per_item_results(self):
+        keep = Note.objects.create(title="keep", content="", topic=self.topic, owner=self.user)
+        gone = Note.objects.create(title="gone", content="", topic=self.topic, owner=self.user)
+        foreign = make_subject(CustomUser.objects.create_user(username="x"), notes=1)
+
+        response = self.post([
+            {"op": "create", "topic": self.topic.pk, "title": "new", "content": "<p>quantum</p>"},
+            {"op": "create", "topic": foreign.topics.first().pk, "title": "nope"},
+            {"op": "move", "id": keep.pk, "topic": self.other_topic.pk},
+            {"op": "complete", "id": keep.pk},
+            {"op": "delete", "id": gone.pk},
+            {"op": "complete", "id": gone.pk},
+            {"op": "explode"},
+        ])
+        body = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["ok"] for r in body["results"]], [True, False, True, True, True, False, False])
+        self.assertEqual((body["applied"], body["failed"]), (4, 3))
+
+        created = Note.objects.get(pk=body["results"][0]["id"])
+        self.assertEqual(created.owner, self.user)
+        self.assertFalse(Note.objects.filter(pk=gone.pk).exists())
+
+        keep.refresh_from_db()
+        self.assertEqual((keep.topic, keep.is_completed), (self.other_topic, True))
+
+        self.assertEqual(self.counters(self.topic), (1, 0))
+        self.assertEqual(self.counters(self.other_topic), (1, 1))
+        self.assertEqual(self.counters(self.subject), (2, 1))
+
+        # side effects the per-note signals would have produced
+        self.assertIn(created, search_notes(Note.objects.all(), "quantum"))
+        events = ProgressEvent.objects.filter(user=self.user, completed_delta=1)
+        self.assertEqual(events.count(), 1)
+
+    def test_queries_do_not_grow_with_batch_size(self):
+        def run(n):
+            ops = [{"op": "create", "topic": self.topic.pk, "title": f"n{i}"} for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.post(ops)
+            return len(ctx.captured_queries)
+
+        # both fit one INSERT on SQLite (999 parameters), so nothing may differ
+        self.assertEqual(run(10), run(90))
+
+        ids = list(Note.objects.values_list("pk", flat=True))
+        with CaptureQueriesContext(connection) as ctx:
+            self.post([{"op": "complete", "id": pk} for pk in ids])
+        self.assertLess(len(ctx.captured_queries), 20)
+        self.assertEqual(self.counters(self.subject), (100, 100))
+
+    def test_rejects_oversized_or_malformed_batches(self):
+        with mock.patch.object(bulk, "MAX_OPERATIONS", 2):
+            response = self.post([{"op": "delete", "id": 1}] * 3)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            reverse("note_bulk_api"), data="[", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+# ============================
+# Corpus import / export
+# ============================
+class CorpusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.source = CustomUser.objects.create_user(username="source", password="pw")
+        self.target = CustomUser.objects.create_user(username="target", password="pw")
+        for name in ("Algebra", "Biology"):
+            make_subject(self.source, name=name, topics=2, notes=3, completed=2)
+        for note in Note.objects.filter(owner=self.source)[:4]:
+            Bookmark.objects.create(user=self.source, note=note, page_position=note.pk)
+
+    def snapshot(self, user):
+        return sorted(
+            Note.objects.filter(owner=user).values_list(
+                "topic__subject__name", "topic__name", "title", "content", "is_completed",
+                "bookmarks__page_position",
+            )
+        )
+
+    def test_round_trip_remaps_ids_and_rebuilds_counters(self):
+        lines = list(export_corpus(self.source, chunk_size=4))
+        # batch size 2 forces flushes between a note and the next ones
+        counts = import_corpus(self.target, lines, batch_size=2)
+
+        self.assertEqual(counts, {"subjects": 2, "topics": 4, "notes": 12, "bookmarks": 4})
+        self.assertEqual(self.snapshot(self.target), self.snapshot(self.source))
+        subject = Subject.objects.get(owner=self.target, name="Algebra")
+        self.assertEqual((subject.note_count, subject.completed_count), (6, 4))
+        self.assertTrue(search_notes(Note.objects.filter(owner=self.target), "Algebra").exists())
+
+    def test_malformed_line_rolls_back(self):
+        lines = list(export_corpus(self.source))
+        lines.insert(5, '{"type": "note", "id": 999, "topic": 12345, "title": "x"}\n')
+
+        with self.assertRaises(CorpusError) as ctx:
+            import_corpus(self.target, lines)
+        self.assertEqual(ctx.exception.line, 6)
+        self.assertFalse(Subject.objects.filter(owner=self.target).exists())
+
+    def test_export_queries_are_per_chunk(self):
+        with CaptureQueriesContext(connection) as ctx:
+            list(export_corpus(self.source, chunk_size=100))
+        # subjects, topics, notes and one bookmark lookup
+        self.assertEqual(len(ctx.captured_queries), 4)
+
+    def test_http_endpoints(self):
+        self.client.force_login(self.source)
+        response = self.client.get(reverse("corpus_export"))
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        body = b"".join(response.streaming_content)
+
+        self.client.force_login(self.target)
+        response = self.client.post(
+            reverse("corpus_import"), data=body, content_type="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["notes"], 12)
+
+        response = self.client.post(
+            reverse("corpus_import"), data=b"{nope\n", content_type="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["line"], 1)
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "corpus.ndjson")
+            call_command("export_notes", "source", output=path, stdout=StringIO())
+            out = StringIO()
+            call_command("import_notes", "target", path, stdout=out)
+
+        self.assertIn("12 notes", out.getvalue())
+        self.assertEqual(Note.objects.filter(owner=self.target).count(), 12)
+
+
+# ============================
+# Load data and view benchmarks
+# ============================
+class LoadGeneratorTests(TestCase):
+    SCALE = Scale(users=3, subjects=2, topics=2, notes=5, collaborators=1, content_size=300, tasks=2)
+
+    def test_generates_the_requested_shape_with_counters(self):
+        users = generate(self.SCALE, prefix="gen")
+
+        self.assertEqual(len(users), 3)
+        self.assertEqual(Subject.objects.count(), 6)
+        self.assertEqual(Topic.objects.count(), 12)
+        self.assertEqual(Note.objects.count(), 60)
+        self.assertEqual(Collaboration.objects.count(), 6)
+        self.assertFalse(Collaboration.objects.filter(subject__owner=F("user")).exists())
+        self.assertTrue(self.client.login(username="gen_0", password="loadtest"))
+
+        for subject in Subject.objects.all():
+            notes = Note.objects.filter(topic__subject=subject)
+            self.assertEqual(
+                (subject.note_count, subject.completed_count),
+                (notes.count(), notes.filter(is_completed=True).count()),
+            )
+
+    def test_same_seed_same_content(self):
+        generate(self.SCALE, prefix="a", seed=7)
+        generate(self.SCALE, prefix="b", seed=7)
+        contents = lambda prefix: list(
+            Note.objects.filter(owner__username__startswith=prefix).order_by("pk")
+            .values_list("content", flat=True)
+        )
+        self.assertEqual(contents("a_"), contents("b_"))
+
+    def test_bench_views_writes_and_checks_a_baseline(self):
+        options = {
+            "users": 2, "subjects": 1, "topics": 1, "notes": 3, "collaborators": 1,
+            "content_size": 200, "tasks": 1, "runs": 1, "stdout": StringIO(),
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "views.json")
+            call_command("bench_views", baseline=path, update=True, **options)
+            with open(path) as f:
+                report = json.load(f)
+            self.assertIn("note_view", report["results"])
+            self.assertEqual(report["scale"]["notes"], 3)
+
+            # Time and memory are noted, never failed on
+            report["results"]["dashboard"]["time_ms"] = 0
+            report["results"]["dashboard"]["peak_kb"] = 0
+            with open(path, "w") as f:
+                json.dump(report, f)
+            cache.set("kept", 1)
+            call_command("bench_views", baseline=path, **options)
+            self.assertIn("slower: peak_kb", options["stdout"].getvalue())
+            self.assertEqual(cache.get("kept"), 1)  # benched on its own cache
+
+            report["results"]["dashboard"]["queries_cold"] = 0
+            with open(path, "w") as f:
+                json.dump(report, f)
+            with self.assertRaisesMessage(CommandError, "dashboard: queries_cold 0"):
+                call_command("bench_views", baseline=path, **options)
+
+        # Everything generated was rolled back
+        self.assertFalse(CustomUser.objects.filter(username__startswith="bench_").exists())
+
+
+# ============================
+# Request metrics
+# ============================
+@mock.patch.object(metrics, "SAMPLE_RATE", 1.0)
+@mock.patch.object(metrics, "FLUSH_SECONDS", 0)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="m", password="pw")
+        self.staff = CustomUser.objects.create_user(username="ops", password="pw", is_staff=True)
+        make_subject(self.user)
+        self.client.force_login(self.user)
+
+    def test_server_timing_header(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("subject_list"))
+
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+')
+        self.assertNotIn("dup;", timing)
+
+    def test_server_timing_is_for_staff_unless_enabled(self):
+        with mock.patch.object(metrics, "SERVER_TIMING", False):
+            self.assertNotIn("Server-Timing", self.client.get(reverse("subject_list")))
+            self.client.logout()
+            self.assertNotIn("Server-Timing", self.client.get(reverse("login")))
+
+        with mock.patch.object(metrics, "SERVER_TIMING", True):
+            self.assertIn("Server-Timing", self.client.get(reverse("login")))
+
+    def test_unsampled_requests_are_untouched(self):
+        with mock.patch.object(metrics, "SAMPLE_RATE", 0):
+            response = self.client.get(reverse("subject_list"))
+        self.assertNotIn("Server-Timing", response)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse("internal_metrics")).json()["views"], {})
+
+    def test_repeated_statement_is_flagged(self):
+        recorder = metrics.RequestMetrics()
+        with connection.execute_wrapper(recorder):
+            for note in Note.objects.all():
+                Note.objects.filter(pk=note.pk).exists()
+            for _ in range(metrics.DUPLICATE_THRESHOLD):
+                Note.objects.filter(pk=1).exists()
+
+        summary = recorder.summary(200)
+        self.assertEqual(summary["queries"], 1 + 2 + metrics.DUPLICATE_THRESHOLD)
+        self.assertEqual(summary["repeats"], 2 + metrics.DUPLICATE_THRESHOLD)
+        self.assertIn('FROM "notes"', summary["repeated_sql"])
+        self.assertIn("dup;desc=", metrics.server_timing(summary))
+
+    def test_metrics_endpoint_aggregates_per_view(self):
+        for _ in range(3):
+            self.client.get(reverse("subject_list"))
+        self.client.get(reverse("dashboard"))
+
+        self.assertEqual(self.client.get(reverse("internal_metrics")).status_code, 403)
+
+        self.client.force_login(self.staff)
+        data = self.client.get(reverse("internal_metrics")).json()
+        row = data["views"]["subject_list"]
+        self.assertEqual(row["count"], 3)
+        self.assertEqual(sum(row["time_ms"]["buckets"].values()), 3)
+        self.assertGreater(row["queries"]["p50"], 0)
+        self.assertIsNotNone(row["template_ms"]["p99"])
+        self.assertEqual(data["views"]["dashboard"]["count"], 1)
+        self.assertNotIn("internal_metrics", data["views"])
+
+        data = self.client.get(reverse("internal_metrics"), {"reset": "1"}).json()
+        self.assertEqual(data["views"], {})
+
+    def test_metrics_endpoint_accepts_the_bearer_token(self):
+        self.client.logout()
+        with override_settings(REQUEST_METRICS={**settings.REQUEST_METRICS, "TOKEN": "s3cret"}):
+            ok = self.client.get(reverse("internal_metrics"), HTTP_AUTHORIZATION="Bearer s3cret")
+            bad = self.client.get(reverse("internal_metrics"), HTTP_AUTHORIZATION="Bearer nope")
+        self.assertEqual((ok.status_code, bad.status_code), (200, 403))
+
+
+# ============================
+# Query plans
+# ============================
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every SELECT the main views run and fail on full table scans.
+
+    SQLite plans without ANALYZE statistics, i.e. as if tables were large;
+    PostgreSQL runs with enable_seqscan off, so a "Seq Scan" left in the
+    plan means no index can serve the query at all.
+    """
+
+    # The SQLite search fallback's idf denominator counts every note
+    ALLOWED = [re.compile(r'^SELECT COUNT\(\*\) AS "__count" FROM "notes"$')]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = generate(Scale(users=3, subjects=3, topics=3, notes=6, tasks=5), prefix="plan")
+
+    def setUp(self):
+        cache.clear()
+        self.user = self.users[0]
+        self.client.force_login(self.user)
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("EXPLAIN " + sql)
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def full_scans(self, sql):
+        if connection.vendor == "postgresql":
+            return [step.strip() for step in self.plan(sql) if "Seq Scan" in step]
+        return [
+            step for step in self.plan(sql)
+            if step.startswith("SCAN ") and not step.startswith(("SCAN CONSTANT ROW", "SCAN (subquery"))
+        ]
+
+    def assertIndexed(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 400, url)
+
+        for sql in dict.fromkeys(q["sql"] for q in ctx.captured_queries):
+            if not sql.startswith("SELECT") or any(p.match(sql) for p in self.ALLOWED):
+                continue
+            scans = self.full_scans(sql)
+            self.assertEqual(scans, [], f"{url}: {sql}")
+
+    def test_views_use_indexes(self):
+        subject = Subject.objects.filter(owner=self.user).first()
+        note = Note.objects.filter(owner=self.user).first()
+        urls = [
+            reverse("dashboard"),
+            reverse("subject_list"),
+            reverse("subject_detail", args=[subject.pk]),
+            reverse("note_list"),
+            f"{reverse('note_list')}?subject={subject.pk}",
+            reverse("note_list_api"),
+            reverse("note_view", args=[note.pk]),
+            f"{reverse('note_search')}?q=matrix",
+            reverse("bookmark_list"),
+            reverse("bookmark_list_api"),
+            reverse("task_list"),
+            reverse("task_list_api"),
+            reverse("pdf_compile"),
+            reverse("progress_api"),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIndexed(url)
+
+    def test_detects_a_full_scan(self):
+        with CaptureQueriesContext(connection) as ctx:
+            list(Note.objects.filter(title="unindexed"))
+        self.assertNotEqual(self.full_scans(ctx.captured_queries[0]["sql"]), [])
+
+
+# ============================
+# List view query plans
+# ============================
+class ListQueryCountTests(TestCase):
+    """Every list view costs the same number of queries for 1 or 1000 rows."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="lister", password="pw")
+        self.subject = Subject.objects.create(name="S", owner=self.user)
+        self.topics = Topic.objects.bulk_create(
+            [Topic(name=f"T{i}", subject=self.subject, order=i) for i in range(10)]
+        )
+        self.client.force_login(self.user)
+
+    def add_notes(self, n):
+        return Note.objects.bulk_create([
+            Note(title=f"N{i}", content="<p>body</p>" * 50, topic=self.topics[i % 10], owner=self.user)
+            for i in range(n)
+        ])
+
+    def assertQueries(self, expected, url, rows):
+        for n in (1, 1000):
+            rows(n)
+            self.client.get(url)  # warm the per-user caches (permissions)
+            with self.subTest(rows=n), self.assertNumQueries(expected):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+            # clean slate for the next size
+            for model in (Bookmark, Note, Task, Collaboration):
+                model.objects.all().delete()
+            CustomUser.objects.exclude(pk=self.user.pk).delete()
+
+    def test_note_list(self):
+        def rows(n):
+            notes = self.add_notes(n)
+            Bookmark.objects.create(user=self.user, note=notes[0])
+
+        # session, user, subjects, first topic, notes page
+        self.assertQueries(5, reverse("note_list"), rows)
+
+    def test_note_list_renders_listing_fields(self):
+        note = self.add_notes(1)[0]
+        Bookmark.objects.create(user=self.user, note=note)
+        response = self.client.get(reverse("note_list"))
+        self.assertContains(response, "★")
+        self.assertContains(response, "T0")
+        self.assertContains(response, "&lt;p&gt;body&lt;/p&gt;")
+
+    def test_bookmark_list(self):
+        def rows(n):
+            Bookmark.objects.bulk_create(
+                [Bookmark(user=self.user, note=note) for note in self.add_notes(n)]
+            )
+
+        self.assertQueries(3, reverse("bookmark_list"), rows)
+
+    def test_subject_detail(self):
+        # session, user, subject, topics, their notes
+        self.assertQueries(5, reverse("subject_detail", args=[self.subject.pk]), self.add_notes)
+
+    def test_task_list(self):
+        def rows(n):
+            Task.objects.bulk_create([Task(title=f"T{i}", user=self.user) for i in range(n)])
+
+        self.assertQueries(3, reverse("task_list"), rows)
+
+    def test_collaboration_manage(self):
+        def rows(n):
+            users = CustomUser.objects.bulk_create(
+                [CustomUser(username=f"c{i}", email=f"c{i}@example.com") for i in range(n)]
+            )
+            Collaboration.objects.bulk_create(
+                [Collaboration(subject=self.subject, user=u) for u in users]
+            )
+
+        self.assertQueries(4, reverse("collaboration_manage", args=[self.subject.pk]), rows)
+
+
+# ============================
+# Offline keywords
+# ============================
+class KeywordTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user("kw", password="pw")
+        subject = Subject.objects.create(name="S", owner=self.user)
+        self.topic = Topic.objects.create(name="T", subject=subject)
+
+    def note(self, title, content):
+        return Note.objects.create(title=title, content=content, topic=self.topic, owner=self.user)
+
+    def frequency(self, term):
+        row = KeywordFrequency.objects.filter(user=self.user, term=term).first()
+        return row.count if row else 0
+
+    def test_terms_common_to_every_note_rank_low(self):
+        for topic in ("paging", "scheduling", "deadlock"):
+            self.note(topic, f"<p>Operating systems. {topic.title()} {topic} {topic}.</p>")
+        keywords.refresh_keywords(self.user.pk)
+
+        found = Summary.objects.get(note__title="paging").keywords
+        self.assertEqual(found[0], "paging")
+        self.assertLess(found.index("paging"), found.index("operating"))
+
+    def test_textrank_picks_central_sentences_in_order(self):
+        text = (
+            "Caches keep recent memory close to the processor. "
+            "My cat likes boxes. "
+            "A cache miss sends the processor to main memory. "
+            "Memory latency makes cache misses expensive for the processor."
+        )
+        document = keywords.analyze(text)
+        summary = keywords.extractive_summary(document, {}, 0, sentences=2)
+
+        self.assertNotIn("cat", summary)
+        self.assertTrue(summary.startswith("Caches") or summary.startswith("A cache"))
+
+    def test_frequencies_follow_edits_and_deletes(self):
+        first = self.note("Paging", "<p>Pages and frames.</p>")
+        self.note("Segments", "<p>Segments and frames.</p>")
+
+        self.assertEqual(keywords.refresh_keywords(self.user.pk), 2)
+        self.assertEqual(self.frequency(keywords.DOCUMENTS), 2)
+        self.assertEqual(self.frequency("frame"), 2)
+        self.assertEqual(self.frequency("page"), 1)
+
+        # Unchanged notes are skipped
+        self.assertEqual(keywords.refresh_keywords(self.user.pk), 0)
+
+        first.content = "<p>Frames only.</p>"
+        first.save()
+        self.assertEqual(keywords.refresh_keywords(self.user.pk), 1)
+        self.assertEqual(self.frequency("page"), 1)  # still in the title
+        self.assertEqual(self.frequency("frame"), 2)
+
+        first.delete()
+        self.assertEqual(self.frequency(keywords.DOCUMENTS), 1)
+        self.assertEqual(self.frequency("frame"), 1)
+        self.assertEqual(self.frequency("page"), 0)
+
+        before = dict(KeywordFrequency.objects.filter(count__gt=0).values_list("term", "count"))
+        keywords.rebuild_frequencies(self.user.pk)
+        self.assertEqual(dict(KeywordFrequency.objects.values_list("term", "count")), before)
+
+    def test_model_summary_of_current_text_is_kept(self):
+        note = self.note("Paging", "<p>Pages map to frames. Frames hold pages.</p>")
+        Summary.objects.create(
+            note=note, summary_text="model text",
+            content_hash=content_hash(strip_html(note.content)),
+        )
+        stale = self.note("Old", "<p>New text.</p>")
+        Summary.objects.create(note=stale, summary_text="about old text", content_hash="x")
+
+        keywords.refresh_keywords(self.user.pk)
+
+        kept = Summary.objects.get(note=note)
+        self.assertEqual(kept.summary_text, "model text")
+        self.assertEqual(kept.method, Summary.METHOD_MODEL)
+        self.assertIn("pages", kept.keywords)
+
+        replaced = Summary.objects.get(note=stale)
+        self.assertEqual(replaced.summary_text, "New text.")
+        self.assertEqual(replaced.method, Summary.METHOD_EXTRACTIVE)
+
+    def test_command(self):
+        self.note("Paging", "<p>Pages.</p>")
+        out = StringIO()
+        call_command("extract_keywords", "--user", "kw", "--rebuild", stdout=out)
+
+        self.assertIn("Processed 1 notes", out.getvalue())
+        # "Paging" and "pages" are one term
+        self.assertEqual(len(Summary.objects.get().keywords), 1)
+
+
+# ============================
+# Related notes / duplicates
+# ============================
+LECTURE = " ".join(
+    f"Lecture {n} covers virtual memory paging segmentation and translation lookaside buffers."
+    for n in range(20)
+)
+
+
+class SimilarityTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user("sim", password="pw")
+        self.other = CustomUser.objects.create_user("other", password="pw")
+        self.note = self.add(self.user, "OS", LECTURE)
+        self.client.force_login(self.user)
+
+    def add(self, owner, subject_name, content, **fields):
+        subject, _ = Subject.objects.get_or_create(name=subject_name, owner=owner)
+        topic, _ = Topic.objects.get_or_create(name="T", subject=subject)
+        return Note.objects.create(
+            title=subject_name, content=f"<p>{content}</p>", topic=topic, owner=owner, **fields,
+        )
+
+    def related(self):
+        return [note.pk for note, _ in related_notes(self.note, PermissionResolver(self.user))]
+
+    def test_copies_are_related_unrelated_notes_are_not(self):
+        copy = self.add(self.user, "Systems", LECTURE)
+        edited = self.add(self.user, "Revision", LECTURE.replace("Lecture 3", "Week three"))
+        self.add(self.user, "Biology", "Enzymes lower the activation energy of reactions. " * 20)
+
+        self.assertEqual(self.related(), [copy.pk, edited.pk])
+
+    def test_visibility_rules_apply(self):
+        private = self.add(self.other, "Private", LECTURE)
+        public = self.add(self.other, "Public", LECTURE, is_public=True)
+        shared = self.add(self.other, "Shared", LECTURE)
+        Collaboration.objects.create(subject=shared.topic.subject, user=self.user)
+
+        related = self.related()
+        self.assertNotIn(private.pk, related)
+        self.assertCountEqual(related, [public.pk, shared.pk])
+
+    def test_invisible_notes_do_not_take_candidate_slots(self):
+        for n in range(3):
+            self.add(self.other, f"Private {n}", LECTURE)
+        # shares fewer buckets than the private exact copies, so ranks after them
+        edited = self.add(self.user, "Revision", LECTURE.replace("Lecture 3", "Week three"))
+
+        with mock.patch("notes.similarity.MAX_CANDIDATES", 2):
+            self.assertEqual(self.related(), [edited.pk])
+
+    def test_index_follows_edits_and_deletes(self):
+        copy = self.add(self.user, "Systems", LECTURE)
+        copy.content = "<p>Something else entirely, about gardening and soil.</p>"
+        copy.save()
+        self.assertEqual(self.related(), [])
+
+        self.note.delete()
+        self.assertFalse(NoteBucket.objects.exclude(note=copy).exists())
+
+    def test_note_view_shows_related_panel(self):
+        copy = self.add(self.user, "Systems", LECTURE)
+        response = self.client.get(reverse("note_view", args=[self.note.pk]))
+
+        self.assertContains(response, "Related Notes")
+        self.assertContains(response, reverse("note_view", args=[copy.pk]))
+        self.assertContains(response, "100%")
+
+    def test_lookup_reads_buckets_not_the_corpus(self):
+        self.add(self.user, "Biology", "Enzymes lower the activation energy of reactions. " * 20)
+        resolver = PermissionResolver(self.user)
+        resolver.access_map
+        # signature, candidate buckets (nothing shares one)
+        with self.assertNumQueries(2):
+            related_notes(self.note, resolver)
+
+    def test_find_duplicates_command(self):
+        copy = self.add(self.user, "Systems", LECTURE)
+        self.add(self.other, "Unrelated", "Markets clear where supply meets demand. " * 20)
+        NoteSignature.objects.all().delete()  # as before the index existed
+
+        out = StringIO()
+        call_command("find_duplicates", "--reindex", stdout=out)
+
+        self.assertIn("Signed 3 notes.", out.getvalue())
+        self.assertIn(f"#{self.note.pk} 'OS'", out.getvalue())
+        self.assertIn(f"#{copy.pk} 'Systems'", out.getvalue())
+        self.assertIn("1 groups, 1 redundant notes.", out.getvalue())
+
+
+# ============================
+# Blob Storage
+# ============================
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="owner", password="pw")
+        self.other = CustomUser.objects.create_user(username="other", password="pw")
+        self.client.force_login(self.user)
+        self.topic = make_subject(self.user, notes=0).topics.get()
+
+    def upload(self, data=b"lecture slides", name="slides.pdf"):
+        response = self.client.post(reverse("note_create", args=[self.topic.pk]), {
+            "title": "With file", "content": "<p>Body</p>",
+            "file_upload": SimpleUploadedFile(name, data),
+        })
+        self.assertEqual(response.status_code, 302)
+        return Note.objects.latest("pk")
+
+    def stored_files(self):
+        return [
+            name for _, _, names in os.walk(os.path.join(self.media, "blobs")) for name in names
+        ]
+
+    def test_identical_uploads_share_one_blob(self):
+        first = self.upload(name="a.pdf")
+        second = self.upload(name="b.pdf")
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.sha256, hashlib.sha256(b"lecture slides").hexdigest())
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(blob.size, len(b"lecture slides"))
+        self.assertEqual(blob.content_type, "application/pdf")
+        self.assertEqual([first.attachment_id, second.attachment_id], [blob.pk, blob.pk])
+        self.assertEqual((first.attachment_name, second.attachment_name), ("a.pdf", "b.pdf"))
+        self.assertEqual(self.stored_files(), [blob.pk])
+
+    def test_replaced_and_deleted_attachments_are_collected(self):
+        note = self.upload(b"old")
+        old = note.attachment_id
+        self.client.post(reverse("note_edit", args=[note.pk]), {
+            "title": "With file", "content": "<p>Body</p>",
+            "file_upload": SimpleUploadedFile("new.txt", b"new"),
+        })
+        note.refresh_from_db()
+        self.assertNotEqual(note.attachment_id, old)
+        self.assertEqual(Blob.objects.get(pk=old).ref_count, 0)
+
+        # Within the grace period nothing is removed
+        self.assertEqual(blobs.collect_blobs(), 0)
+
+        self.client.post(reverse("note_delete", args=[note.pk]))
+        self.assertEqual(Blob.objects.get(pk=note.attachment_id).ref_count, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(blobs.collect_blobs(grace=0), 2)
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_collection_lock_is_valid_on_postgres(self):
+        from django.db.backends.postgresql.base import DatabaseWrapper
+
+        # PostgreSQL rejects FOR UPDATE on the nullable side of an outer join
+        postgres = DatabaseWrapper({**connection.settings_dict, "NAME": "noteeve"}, "postgres")
+        query = blobs.unreferenced_blobs().select_for_update().filter(pk="0" * 64).query
+        with mock.patch.object(postgres, "get_autocommit", return_value=False):
+            sql, _ = query.get_compiler(connection=postgres).as_sql()
+
+        self.assertTrue(sql.endswith("FOR UPDATE"), sql)
+        self.assertNotIn("OUTER JOIN", sql)
+
+    def test_reattached_blob_survives_collection(self):
+        note = self.upload()
+        Note.objects.filter(pk=note.pk).delete()
+        self.upload()
+
+        self.assertEqual(blobs.collect_blobs(grace=0), 0)
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+    def test_blob_collected_between_store_and_attach_is_stored_again(self):
+        old = self.upload()
+        Note.objects.filter(pk=old.pk).delete()
+        real_store = blobs.store
+
+        def store_then_collect(uploaded):
+            blob = real_store(uploaded)
+            self.assertEqual(blobs.collect_blobs(grace=0), 1)
+            return blob
+
+        with mock.patch.object(blobs, "store", side_effect=store_then_collect):
+            note = self.upload()
+
+        blob = Blob.objects.get()
+        self.assertEqual((note.attachment_id, blob.ref_count), (blob.pk, 1))
+        self.assertTrue(blob.file.storage.exists(blob.file.name))
+
+    def test_reattached_blob_with_missing_file_is_rewritten(self):
+        note = self.upload()
+        Note.objects.filter(pk=note.pk).delete()
+        blob = Blob.objects.get()
+        blob.file.storage.delete(blob.file.name)  # a collection that did not commit
+
+        self.upload()
+        self.assertTrue(blob.file.storage.exists(blob.file.name))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+    def test_deleting_a_user_releases_each_attachment_once(self):
+        self.upload()
+        self.client.force_login(self.other)
+        self.topic = make_subject(self.other, name="Other", notes=0).topics.get()
+        kept = self.upload()
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+        self.user.delete()
+
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertEqual(blobs.collect_blobs(grace=0), 0)
+        self.assertEqual(self.client.get(reverse("note_attachment", args=[kept.pk])).status_code, 200)
+
+    def test_topic_and_subject_deletes_release_attachments_once(self):
+        for _ in range(3):
+            self.upload()
+        self.topic.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+
+        self.topic = make_subject(self.user, name="Again", notes=0).topics.get()
+        self.upload()
+        Subject.objects.filter(name="Again").delete()
+        self.assertEqual(Blob.objects.get().ref_count, 0)
+
+    def test_download_with_strong_etag_and_ranges(self):
+        note = self.upload(b"0123456789")
+        url = reverse("note_attachment", args=[note.pk])
+        etag = f'"{note.attachment_id}"'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertEqual(response["ETag"], etag)
+        self.assertIn('filename="slides.pdf"', response["Content-Disposition"])
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+        response = self.client.get(url, HTTP_RANGE="bytes=2-4")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"234")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_download_requires_access(self):
+        note = self.upload()
+        self.client.force_login(self.other)
+        response = self.client.get(reverse("note_attachment", args=[note.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_download_offloaded_to_web_server(self):
+        note = self.upload()
+        with mock.patch("notes.blobs.OFFLOAD", "x-accel-redirect"):
+            response = self.client.get(reverse("note_attachment", args=[note.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/" + blobs.blob_name(note.attachment_id),
+        )
+        self.assertEqual(response["ETag"], f'"{note.attachment_id}"')
+
+
+# ============================
+# Attachment Previews
+# ============================
+def make_illustrated_pdf(lines, image_color=None):
+    """PDF bytes with one page per line of text, and an image on page one."""
+    from PIL import Image
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for number, line in enumerate(lines):
+        pdf.drawString(72, 720, line)
+        if number == 0 and image_color:
+            image = Image.new("RGB", (400, 300), image_color)
+            pdf.drawImage(ImageReader(image), 72, 300, width=400, height=300)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+class PreviewTests(TestCase):
+    LINES = ["Photosynthesis overview", "Chlorophyll absorbs light", "The Calvin cycle"]
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+        self.delay = mock.patch(
+            "notes.tasks.derive_attachment_preview.delay",
+            side_effect=lambda digest: derive_attachment_preview.apply(args=[digest]),
+        ).start()
+        self.addCleanup(mock.patch.stopall)
+
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="owner", password="pw")
+        self.client.force_login(self.user)
+        self.topic = make_subject(self.user, notes=0).topics.get()
+
+    def upload(self, data, name="biology.pdf"):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("note_create", args=[self.topic.pk]), {
+                "title": "Lecture", "content": "<p>See slides</p>",
+                "file_upload": SimpleUploadedFile(name, data),
+            })
+        return Note.objects.latest("pk")
+
+    def test_upload_derives_pages_and_thumbnail(self):
+        note = self.upload(make_illustrated_pdf(self.LINES))
+
+        preview = BlobPreview.objects.get(blob=note.attachment_id)
+        self.assertEqual(preview.page_count, 3)
+        self.assertEqual(preview.error, "")
+        self.assertEqual(preview.page_text(1).strip(), "Chlorophyll absorbs light")
+        self.assertEqual(preview.page_text(3), "")
+        self.assertIn("The Calvin cycle", preview.full_text())
+        self.assertTrue(bytes(preview.thumbnail).startswith(b"\xff\xd8"))
+        self.assertLess(len(preview.text), sum(map(len, self.LINES)) + 64)
+
+    def test_derivation_is_once_per_file(self):
+        data = make_illustrated_pdf(self.LINES)
+        first = self.upload(data)
+        with mock.patch.object(previews, "extract_pages") as extract:
+            second = self.upload(data, name="copy.pdf")
+            previews.derive_preview(second.attachment_id)
+
+        extract.assert_not_called()
+        self.assertEqual(self.delay.call_count, 1)
+        self.assertEqual(first.attachment_id, second.attachment_id)
+        self.assertEqual(BlobPreview.objects.count(), 1)
+
+    def test_search_finds_attachment_text(self):
+        note = self.upload(make_illustrated_pdf(self.LINES))
+        other = self.upload(make_illustrated_pdf(["Unrelated"]), name="other.pdf")
+
+        self.assertEqual(list(search_notes(Note.objects.all(), "chlorophyll")), [note])
+        self.assertEqual(list(search_notes(Note.objects.all(), "unrelated")), [other])
+
+    def test_thumbnail_uses_embedded_image(self):
+        from PIL import Image
+
+        note = self.upload(make_illustrated_pdf(self.LINES, image_color=(200, 30, 30)))
+        url = reverse("note_attachment_thumbnail", args=[note.pk])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        image = Image.open(BytesIO(response.content))
+        self.assertEqual(image.width, 240)
+        red, green, _ = image.getpixel((image.width // 2, image.height // 2))
+        self.assertGreater(red, 150)
+        self.assertLess(green, 80)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_note_page_shows_preview(self):
+        note = self.upload(make_illustrated_pdf(self.LINES))
+        response = self.client.get(reverse("note_view", args=[note.pk]))
+
+        self.assertContains(response, reverse("note_attachment_thumbnail", args=[note.pk]))
+        self.assertContains(response, "PDF, 3 pages")
+
+    def test_unreadable_pdf_is_recorded_not_retried(self):
+        note = self.upload(b"not a pdf")
+
+        preview = BlobPreview.objects.get(blob=note.attachment_id)
+        self.assertTrue(preview.error)
+        self.assertEqual(preview.page_count, 0)
+        self.assertFalse(previews.needs_preview(note.attachment_id))
+        response = self.client.get(reverse("note_attachment_thumbnail", args=[note.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_other_files_are_not_derived(self):
+        self.upload(b"plain text", name="notes.txt")
+        self.delay.assert_not_called()
+
+    def test_parallel_derivation(self):
+        handle = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+        handle.write(make_illustrated_pdf([f"page {n}" for n in range(5)]))
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+
+        count, pages, thumbnail = previews.derive_file(handle.name, parallel=True)
+
+        self.assertEqual(count, 5)
+        self.assertEqual([page.strip() for page in pages], [f"page {n}" for n in range(5)])
+        self.assertTrue(thumbnail.startswith(b"\xff\xd8"))
+
+    def test_derive_previews_command_backfills(self):
+        note = self.upload(make_illustrated_pdf(self.LINES))
+        BlobPreview.objects.all().delete()
+
+        out = StringIO()
+        call_command("derive_previews", stdout=out)
+
+        self.assertIn("Derived 1 previews, 0 unreadable.", out.getvalue())
+        self.assertEqual(BlobPreview.objects.get(blob=note.attachment_id).page_count, 3)
+
+
+# ============================
+# Reading Positions
+# ============================
+class ReadingPositionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username="reader", password="pw")
+        self.client.force_login(self.user)
+        make_subject(self.user, notes=3)
+        self.notes = list(Note.objects.order_by("pk"))
+        self.note = self.notes[0]
+        self.bookmark = Bookmark.objects.create(user=self.user, note=self.note)
+
+    def report(self, position, note=None, **extra):
+        note = note or self.note
+        return self.client.post(
+            reverse("bookmark_position", args=[note.pk]),
+            json.dumps({"page_position": position, **extra}),
+            content_type="application/json",
+        )
+
+    def updates(self, queries):
+        return [q["sql"] for q in queries if q["sql"].startswith('UPDATE "bookmarks"')]
+
+    def test_scrolling_is_buffered_and_flushed_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            for page in range(1, 301):
+                self.assertEqual(self.report(page).status_code, 202)
+        self.assertEqual(self.updates(queries), [])
+        self.assertEqual(Bookmark.objects.get().page_position, 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reading.flush_positions(), 1)
+        self.assertEqual(len(self.updates(queries)), 1)
+        self.assertEqual(Bookmark.objects.get().page_position, 300)
+
+        # Nothing pending until the next report
+        self.assertEqual(reading.flush_positions(), 0)
+        self.report(42)
+        self.assertEqual(reading.flush_positions(), 1)
+        self.assertEqual(Bookmark.objects.get().page_position, 42)
+
+    def test_reads_see_buffered_position(self):
+        url = reverse("bookmark_position", args=[self.note.pk])
+        self.report(17)
+
+        self.assertEqual(self.client.get(url).json(), {"note_id": self.note.pk, "page_position": 17})
+        reading.flush_positions()
+        cache.delete(reading._entry_key(self.user.pk, self.note.pk))
+        self.assertEqual(self.client.get(url).json()["page_position"], 17)
+
+    def test_last_writer_wins_by_report_time(self):
+        self.report(30, at=2000)
+        response = self.report(10, at=1000)  # arrived late
+
+        self.assertEqual(response.json()["page_position"], 30)
+        reading.flush_positions()
+        self.assertEqual(Bookmark.objects.get().page_position, 30)
+
+    def test_report_times_ahead_of_the_clock_are_bounded(self):
+        future = int(time.time() * 1000) + reading.MAX_CLOCK_SKEW_MS + 60_000
+        self.assertEqual(self.report(30, at=future).status_code, 400)
+
+        # Direct callers are clamped: a later report still wins
+        reading.record_position(self.user.pk, self.note.pk, self.bookmark.pk, 30, at=future * 10)
+        time.sleep(0.002)
+        later = int(time.time() * 1000) + reading.MAX_CLOCK_SKEW_MS
+        self.assertEqual(self.report(12, at=later).json()["page_position"], 12)
+
+    def test_racing_reports_keep_the_latest(self):
+        key = reading._entry_key(self.user.pk, self.note.pk)
+        real_get = cache.get
+        racing = []
+
+        def get(k, *args):
+            value = real_get(k, *args)
+            if k == key and not racing:
+                # another report lands between this one's read and write
+                racing.append(1)
+                thread = threading.Thread(
+                    target=reading.record_position,
+                    args=(self.user.pk, self.note.pk, self.bookmark.pk, 50, 3000),
+                )
+                thread.start()
+                thread.join(0.05)
+                racing.append(thread)
+            return value
+
+        with mock.patch.object(cache, "get", side_effect=get):
+            reading.record_position(self.user.pk, self.note.pk, self.bookmark.pk, 40, 2000)
+        racing[1].join()
+
+        self.assertEqual(reading.current_position(self.user.pk, self.note.pk), 50)
+
+    def test_flush_batches_many_bookmarks(self):
+        for note in self.notes[1:]:
+            Bookmark.objects.create(user=self.user, note=note)
+        for position, note in enumerate(self.notes, start=5):
+            self.report(position, note=note)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reading.flush_positions(batch_size=2), 3)
+        self.assertEqual(len(self.updates(queries)), 2)
+        self.assertEqual(
+            list(Bookmark.objects.order_by("note_id").values_list("page_position", flat=True)),
+            [5, 6, 7],
+        )
+
+    def test_deleted_bookmark_is_not_written(self):
+        self.report(9)
+        self.bookmark.delete()
+
+        self.assertEqual(reading.flush_positions(), 0)
+        self.assertEqual(self.report(3).status_code, 404)
+
+    def test_unwritten_slot_is_waited_for_once(self):
+        cache.add(reading._SEQUENCE_KEY, 0, None)
+        cache.incr(reading._SEQUENCE_KEY)  # a writer that never wrote its slot
+        self.report(8)
+
+        self.assertEqual(reading.flush_positions(), 0)
+        self.assertEqual(reading.flush_positions(), 1)
+        self.assertEqual(Bookmark.objects.get().page_position, 8)
+
+    def test_rejects_invalid_reports(self):
+        self.assertEqual(self.report(-1).status_code, 400)
+        self.assertEqual(self.report("3").status_code, 400)
+        self.assertEqual(self.report(3, at="now").status_code, 400)
+        self.assertEqual(self.report(3, note=self.notes[1]).status_code, 404)
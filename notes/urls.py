@@ -47,6 +47,8 @@ urlpatterns = [
     
     path("notes/", views.note_list, name="note_list"),
 
+    path("notes/search/", views.note_search, name="note_search"),
+
     path("notes/create/<int:topic_id>/",
          views.note_create,
          name="note_create"),
@@ -62,6 +64,26 @@ urlpatterns = [
     path("notes/<int:pk>/delete/",
          views.note_delete,
          name="note_delete"),
+
+    path("notes/<int:pk>/complete/",
+         views.note_complete,
+         name="note_complete"),
+
+    path("notes/<int:pk>/read/",
+         views.note_mark_read,
+         name="note_mark_read"),
+
+    path("notes/<int:pk>/summary/",
+         views.note_summary,
+         name="note_summary"),
+
+    path("notes/<int:pk>/attachment/",
+         views.note_attachment,
+         name="note_attachment"),
+
+    path("notes/<int:pk>/attachment/thumbnail/",
+         views.note_attachment_thumbnail,
+         name="note_attachment_thumbnail"),
     
     # ------------------------
     # BOOKMARKS
@@ -80,14 +102,38 @@ urlpatterns = [
     # PDF COMPILER
     # ------------------------
     path('pdf/compile/', views.pdf_compile, name='pdf_compile'),
+    path('pdf/compile/jobs/<uuid:job_id>/', views.pdf_compile_status, name='pdf_compile_status'),
+    path('pdf/compile/jobs/<uuid:job_id>/download/', views.pdf_compile_download, name='pdf_compile_download'),
 
     # ------------------------
     # AI SUMMARIZER
     # ------------------------
     path('summarizer/', views.summarizer, name='summarizer'),
+    path('summarizer/jobs/', views.summary_submit, name='summary_submit'),
+    path('summarizer/jobs/<uuid:job_id>/', views.summary_status, name='summary_status'),
 
     # ------------------------
     # PROGRESS API (Chart.js)
     # ------------------------
     path('api/progress/', views.progress_api, name='progress_api'),
+
+    # ------------------------
+    # LIST APIs (infinite scroll)
+    # ------------------------
+    path('api/notes/', views.note_list_api, name='note_list_api'),
+    path('api/notes/bulk/', views.note_bulk_api, name='note_bulk_api'),
+    path('api/bookmarks/', views.bookmark_list_api, name='bookmark_list_api'),
+    path('api/bookmarks/<int:note_id>/position/', views.bookmark_position, name='bookmark_position'),
+    path('api/tasks/', views.task_list_api, name='task_list_api'),
+
+    # ------------------------
+    # CORPUS IMPORT / EXPORT (NDJSON)
+    # ------------------------
+    path('api/corpus/export/', views.corpus_export, name='corpus_export'),
+    path('api/corpus/import/', views.corpus_import, name='corpus_import'),
+
+    # ------------------------
+    # INTERNAL
+    # ------------------------
+    path('internal/metrics', views.internal_metrics, name='internal_metrics'),
 ]
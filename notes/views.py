@@ -1,16 +1,47 @@
+import hashlib
+import hmac
+import json
 import os
+import time
+from datetime import date, timedelta
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.http import require_POST
-from .ai_utils import generate_summary
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.views.decorators.http import require_POST, require_GET, require_http_methods
+from django.core.paginator import Paginator
+from django.core.exceptions import ValidationError
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.db.models import Prefetch
+from .search import search_notes
+from .bulk import apply_operations, BulkError
+from .corpus import export_corpus, import_corpus, CorpusError
+from .dashboard import dashboard_data
+from . import metrics
+from .permissions import get_resolver
+from .similarity import related_notes
+from .progress import GRANULARITIES, progress_series, last_modified as progress_last_modified
+from .tasks import submit_summary_job, submit_compile_job
+from .pdf_extract import extract_pdf_text, PdfExtractionError
+from .pdf_compile import compile_pdf, notes_for_compile, BATCH_SIZE as PDF_BATCH_SIZE
+from .downloads import ranged_file_response
+from .blobs import serve as serve_blob
+from .previews import serve_thumbnail
+from . import reading
+from .pagination import (
+    KeysetPaginator, InvalidCursor,
+    NOTE_ORDERING, BOOKMARK_ORDERING, TASK_ORDERING,
+)
 import requests
 
 from .models import (
     CustomUser, Subject, Topic, Note, Bookmark, Task,
-    Collaboration, Summary
+    Collaboration, Summary, SummaryJob, CompileJob, BlobPreview
 )
 
 from .forms import (
@@ -21,6 +52,79 @@ from .forms import (
 # ============================================================
 # AI SUMMARY HELPER
 # ============================================================
+def _summary_input(request):
+    """
+    (text, note) to summarise from a POST: note_id, user_text or pdf_file.
+    Raises PdfExtractionError for unreadable uploads.
+    """
+    note_id = request.POST.get("note_id")
+    if note_id:
+        note = get_object_or_404(Note.objects.select_related("topic"), pk=note_id)
+        if not get_resolver(request).can_view_note(note):
+            raise Http404("No Note matches the given query.")
+        return None, note
+
+    user_text = request.POST.get("user_text", "").strip()
+    if user_text:
+        return user_text, None
+
+    uploaded_file = request.FILES.get("pdf_file")
+    if uploaded_file:
+        return extract_pdf_text(uploaded_file).strip(), None
+
+    return "", None
+
+
+def _job_payload(job):
+    return {
+        "job_id": str(job.pk),
+        "status": job.status,
+        "summary": job.result_text or None,
+        "error": job.error or None,
+        "status_url": reverse("summary_status", args=[job.pk]),
+    }
+
+
+def _get_job(request, job_id):
+    try:
+        return SummaryJob.objects.filter(pk=job_id, user=request.user).first()
+    except ValidationError:
+        return None
+
+
+# ============================================================
+# PAGINATION HELPERS
+# ============================================================
+PAGE_SIZE = 25
+MAX_API_PAGE_SIZE = 100
+
+
+def _keyset_page(request, queryset, ordering, per_page=PAGE_SIZE):
+    """Keyset page for ``?cursor=``; a stale/forged cursor restarts at page one."""
+    paginator = KeysetPaginator(queryset, ordering, per_page=per_page)
+    try:
+        return paginator.page(request.GET.get("cursor"))
+    except InvalidCursor:
+        return paginator.page()
+
+
+def _api_page(request, queryset, ordering, serialize):
+    try:
+        limit = min(int(request.GET.get("limit", PAGE_SIZE)), MAX_API_PAGE_SIZE)
+    except ValueError:
+        limit = PAGE_SIZE
+
+    paginator = KeysetPaginator(queryset, ordering, per_page=max(limit, 1))
+    try:
+        page = paginator.page(request.GET.get("cursor"))
+    except InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    return JsonResponse({
+        "results": [serialize(obj) for obj in page],
+        "next_cursor": page.next_cursor,
+    })
+
 
 # ============================================================
 # HOME / AUTH
@@ -77,31 +181,7 @@ def logout_view(request):
 # ============================================================
 @login_required
 def dashboard(request):
-    user = request.user
-
-    subjects = Subject.objects.filter(owner=user)
-    subjects_count = subjects.count()
-
-    notes = Note.objects.filter(owner=user)
-    notes_count = notes.count()
-
-    bookmarks_count = Bookmark.objects.filter(user=user).count()
-
-    pending_tasks = Task.objects.filter(user=user, completed=False).count()
-
-    recent_activity = [f"Added note: {n.title}" for n in notes[:3]]
-
-    upcoming_tasks = Task.objects.filter(user=user, completed=False).order_by("due_date")[:3]
-
-    return render(request, "notes/dashboard.html", {
-        "subjects": subjects,
-        "subjects_count": subjects_count,
-        "notes_count": notes_count,
-        "bookmarks_count": bookmarks_count,
-        "pending_tasks": pending_tasks,
-        "recent_activity": recent_activity,
-        "upcoming_tasks": upcoming_tasks,
-    })
+    return render(request, "notes/dashboard.html", dashboard_data(request.user))
 
 
 # ============================================================
@@ -112,44 +192,19 @@ def dashboard(request):
 def subject_list(request):
     user = request.user
 
-    subjects = Subject.objects.filter(owner=user)
-    shared_subjects = user.shared_subjects.all()
-
-    # ---- Add computed fields ----
-    for subject in subjects:
-        notes = Note.objects.filter(topic__subject=subject, owner=user)
-
-        subject.total_notes = notes.count()
-        subject.completed_notes = notes.filter(is_completed=True).count()
-
-        if subject.total_notes > 0:
-            subject.progress = int((subject.completed_notes / subject.total_notes) * 100)
-        else:
-            subject.progress = 0
-
-    for subject in shared_subjects:
-        notes = Note.objects.filter(topic__subject=subject)
-
-        subject.total_notes = notes.count()
-        subject.completed_notes = notes.filter(is_completed=True).count()
-
-        if subject.total_notes > 0:
-            subject.progress = int((subject.completed_notes / subject.total_notes) * 100)
-        else:
-            subject.progress = 0
+    # One grouped query for owned + shared subjects, split in Python
+    subjects = list(
+        Subject.objects.visible_to(user)
+        .with_progress(user)
+        .select_related("owner")
+    )
 
     return render(request, "notes/subject_list.html", {
-        "subjects": subjects,
-        "shared_subjects": shared_subjects,
+        "subjects": [s for s in subjects if s.owner_id == user.pk],
+        "shared_subjects": [s for s in subjects if s.owner_id != user.pk],
     })
 
-@property
-def total_notes(self):
-    return Note.objects.filter(topic__subject=self).count()
 
-@property
-def completed_notes(self):
-    return Note.objects.filter(topic__subject=self, is_completed=True).count()
 @login_required
 def subject_create(request):
     if request.method == "POST":
@@ -170,12 +225,11 @@ def subject_create(request):
 def subject_detail(request, pk):
     subject = get_object_or_404(Subject, pk=pk)
 
-    if subject.owner != request.user:
-        if not Collaboration.objects.filter(subject=subject, user=request.user).exists():
-            messages.error(request, "Access denied")
-            return redirect("subject_list")
+    if not get_resolver(request).can_view_subject(subject.pk):
+        messages.error(request, "Access denied")
+        return redirect("subject_list")
 
-    topics = subject.topics.all()
+    topics = subject.topics.with_notes()
 
     return render(request, "notes/subject_detail.html", {
         "subject": subject,
@@ -261,22 +315,106 @@ def topic_edit(request, pk):
 # ============================================================
 # NOTES
 # ============================================================
-@login_required
-def note_list(request):
-    subjects = Subject.objects.filter(owner=request.user)
+def _notes_for_list(request):
+    notes = Note.objects.filter(owner=request.user)
     selected_subject = request.GET.get("subject")
 
     if selected_subject:
-        notes = Note.objects.filter(owner=request.user, topic__subject_id=selected_subject)
-    else:
-        notes = Note.objects.filter(owner=request.user)
+        notes = notes.filter(topic__subject_id=selected_subject)
+
+    return notes, selected_subject
+
+
+@login_required
+def note_list(request):
+    subjects = list(Subject.objects.filter(owner=request.user).only("name"))
+    # "Create Note" goes to the first topic of the newest subject
+    first_topic_id = (
+        Topic.objects.filter(subject=subjects[0]).values_list("pk", flat=True).first()
+        if subjects else None
+    )
+    notes, selected_subject = _notes_for_list(request)
+
+    page = _keyset_page(request, notes.for_listing(), NOTE_ORDERING)
 
     return render(request, "notes/note_list.html", {
-        "notes": notes,
+        "notes": page,
+        "page": page,
         "subjects": subjects,
+        "first_topic_id": first_topic_id,
         "selected_subject": int(selected_subject) if selected_subject else None,
     })
 
+
+@login_required
+def note_list_api(request):
+    notes, _ = _notes_for_list(request)
+
+    return _api_page(
+        request,
+        notes.select_related("topic__subject"),
+        NOTE_ORDERING,
+        lambda note: {
+            "id": note.pk,
+            "title": note.title,
+            "subject": note.topic.subject.name,
+            "topic": note.topic.name,
+            "is_completed": note.is_completed,
+            "created_at": note.created_at.isoformat(),
+        },
+    )
+
+@login_required
+@require_POST
+def note_bulk_api(request):
+    """
+    Apply a batch of note operations in one transaction:
+
+        {"operations": [
+            {"op": "create", "topic": 1, "title": "...", "content": "..."},
+            {"op": "move", "id": 7, "topic": 2},
+            {"op": "complete", "id": 8, "completed": true},
+            {"op": "delete", "id": 9}
+        ]}
+
+    Returns one result per operation; invalid ones are skipped, not fatal.
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return JsonResponse({"error": "Invalid JSON body."}, status=400)
+
+    try:
+        results = apply_operations(request.user, payload.get("operations"))
+    except BulkError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    applied = sum(1 for r in results if r["ok"])
+    return JsonResponse({
+        "results": results,
+        "applied": applied,
+        "failed": len(results) - applied,
+    })
+
+
+@login_required
+def note_search(request):
+    query = request.GET.get("q", "").strip()
+
+    notes = search_notes(
+        Note.objects.visible_to(request.user).select_related("topic__subject"),
+        query,
+    )
+    page = Paginator(notes, 20).get_page(request.GET.get("page"))
+
+    return render(request, "notes/search_results.html", {
+        "query": query,
+        "page": page,
+    })
+
+
 @login_required
 def note_create(request, topic_id):
     topic = get_object_or_404(Topic, pk=topic_id, subject__owner=request.user)
@@ -288,6 +426,7 @@ def note_create(request, topic_id):
             note.topic = topic
             note.owner = request.user
             note.save()
+            form.save_attachment()
             messages.success(request, "Note created!")
             return redirect("note_view", pk=note.pk)
     else:
@@ -298,19 +437,49 @@ def note_create(request, topic_id):
 
 @login_required
 def note_view(request, pk):
-    note = get_object_or_404(Note, pk=pk)
-
-    if note.owner != request.user and not note.is_public:
-        if not Collaboration.objects.filter(
-            subject=note.topic.subject,
-            user=request.user
-        ).exists():
-            messages.error(request, "Access denied")
-            return redirect("subject_list")
+    note = get_object_or_404(
+        Note.objects.select_related("topic__subject", "owner", "attachment"), pk=pk,
+    )
+
+    if not get_resolver(request).can_view_note(note):
+        messages.error(request, "Access denied")
+        return redirect("subject_list")
 
     bookmarked = Bookmark.objects.filter(user=request.user, note=note).exists()
+    related = related_notes(note, get_resolver(request))
+    preview = None
+    if note.attachment_id:
+        preview = BlobPreview.objects.filter(blob=note.attachment_id).only(
+            "page_count", "error",
+        ).first()
+
+    return render(request, "notes/note_view.html", {
+        "note": note,
+        "bookmarked": bookmarked,
+        "related": related,
+        "preview": preview,
+    })
+
+
+@login_required
+def note_attachment(request, pk):
+    note = get_object_or_404(Note.objects.select_related("topic", "attachment"), pk=pk)
+    if not get_resolver(request).can_view_note(note) or note.attachment is None:
+        raise Http404("No attachment.")
+
+    return serve_blob(request, note.attachment, note.attachment_name)
+
+
+@login_required
+def note_attachment_thumbnail(request, pk):
+    note = get_object_or_404(Note.objects.select_related("topic"), pk=pk)
+    if not get_resolver(request).can_view_note(note) or not note.attachment_id:
+        raise Http404("No attachment.")
 
-    return render(request, "notes/note_view.html", {"note": note, "bookmarked": bookmarked})
+    preview = BlobPreview.objects.filter(blob=note.attachment_id).exclude(thumbnail=b"").first()
+    if preview is None:
+        raise Http404("No thumbnail.")
+    return serve_thumbnail(request, preview)
 
 
 @login_required
@@ -347,8 +516,62 @@ def note_delete(request, pk):
 # ============================================================
 @login_required
 def bookmark_list(request):
-    bookmarks = Bookmark.objects.filter(user=request.user)
-    return render(request, "notes/bookmark_list.html", {"bookmarks": bookmarks})
+    bookmarks = Bookmark.objects.filter(user=request.user).with_notes()
+    page = _keyset_page(request, bookmarks, BOOKMARK_ORDERING)
+    return render(request, "notes/bookmark_list.html", {"bookmarks": page, "page": page})
+
+
+@login_required
+def bookmark_list_api(request):
+    return _api_page(
+        request,
+        Bookmark.objects.filter(user=request.user).with_notes(),
+        BOOKMARK_ORDERING,
+        lambda bookmark: {
+            "id": bookmark.pk,
+            "note_id": bookmark.note_id,
+            "note_title": bookmark.note.title,
+            "page_position": bookmark.page_position,
+            "created_at": bookmark.created_at.isoformat(),
+        },
+    )
+
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def bookmark_position(request, note_id):
+    """
+    Reading position on a bookmarked note. POST {"page_position": 12,
+    "at": <report time, ms>} as often as the viewer likes: reports are
+    buffered and written in batches (notes.reading); "at" is optional.
+    """
+    bookmark_pk = reading.bookmark_id(request.user.pk, note_id)
+    if bookmark_pk is None:
+        return JsonResponse({"error": "Note is not bookmarked."}, status=404)
+
+    if request.method == "GET":
+        return JsonResponse({
+            "note_id": note_id,
+            "page_position": reading.current_position(request.user.pk, note_id),
+        })
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return JsonResponse({"error": "Invalid JSON body."}, status=400)
+
+    position, at = payload.get("page_position"), payload.get("at")
+    if type(position) is not int or not 0 <= position <= reading.MAX_POSITION:
+        return JsonResponse({"error": "page_position must be a non-negative integer."}, status=400)
+    if at is not None and type(at) is not int:
+        return JsonResponse({"error": "at must be an integer (milliseconds)."}, status=400)
+    if at is not None and at > time.time() * 1000 + reading.MAX_CLOCK_SKEW_MS:
+        return JsonResponse({"error": "at is in the future."}, status=400)
+
+    current = reading.record_position(request.user.pk, note_id, bookmark_pk, position, at)
+    return JsonResponse({"note_id": note_id, "page_position": current}, status=202)
 
 
 @login_required
@@ -369,8 +592,24 @@ def bookmark_toggle(request, note_id):
 # ============================================================
 @login_required
 def task_list(request):
-    tasks = Task.objects.filter(user=request.user).order_by("due_date")
-    return render(request, "notes/task_list.html", {"tasks": tasks})
+    tasks = Task.objects.filter(user=request.user).for_listing()
+    page = _keyset_page(request, tasks, TASK_ORDERING)
+    return render(request, "notes/task_list.html", {"tasks": page, "page": page})
+
+
+@login_required
+def task_list_api(request):
+    return _api_page(
+        request,
+        Task.objects.filter(user=request.user).for_listing(),
+        TASK_ORDERING,
+        lambda task: {
+            "id": task.pk,
+            "title": task.title,
+            "due_date": task.due_date.isoformat() if task.due_date else None,
+            "completed": task.completed,
+        },
+    )
 
 
 @login_required
@@ -404,7 +643,7 @@ def task_complete(request, pk):
 @login_required
 def collaboration_manage(request, subject_id):
     subject = get_object_or_404(Subject, pk=subject_id, owner=request.user)
-    collaborations = Collaboration.objects.filter(subject=subject)
+    collaborations = Collaboration.objects.filter(subject=subject).with_users()
 
     if request.method == "POST":
         email = request.POST.get("collaborator_email")
@@ -438,59 +677,95 @@ def collaboration_manage(request, subject_id):
 # ============================================================
 # PDF COMPILER
 # ============================================================
+def _compile_job_payload(job):
+    return {
+        "job_id": str(job.pk),
+        "status": job.status,
+        "progress": job.progress,
+        "error": job.error or None,
+        "status_url": reverse("pdf_compile_status", args=[job.pk]),
+        "download_url": (
+            reverse("pdf_compile_download", args=[job.pk])
+            if job.status == CompileJob.STATUS_DONE else None
+        ),
+    }
+
+
+def _get_compile_job(request, job_id):
+    try:
+        return CompileJob.objects.filter(pk=job_id, user=request.user).first()
+    except ValidationError:
+        return None
+
+
 @login_required
 def pdf_compile(request):
+    job = None
+
     if request.method == "POST":
         note_ids = request.POST.getlist("note_ids")
-        notes = Note.objects.filter(pk__in=note_ids, owner=request.user)
 
-        if not notes:
-            messages.error(request, "No notes selected")
-            return redirect("subject_list")
+        if len(note_ids) > settings.PDF_COMPILE["SYNC_LIMIT"]:
+            # Too big to render inside the request: hand it to a worker
+            job = submit_compile_job(request.user, note_ids)
+            if job is None:
+                messages.error(request, "No notes selected")
+                return redirect("subject_list")
+            return redirect(f"{reverse('pdf_compile')}?job={job.pk}")
 
-        try:
-            from reportlab.lib.pagesizes import letter
-            from reportlab.pdfgen import canvas
-            from io import BytesIO
+        notes = notes_for_compile(request.user, note_ids)
 
-            buffer = BytesIO()
-            pdf = canvas.Canvas(buffer, pagesize=letter)
+        if not notes.exists():
+            messages.error(request, "No notes selected")
+            return redirect("subject_list")
 
-            y = 750
-            for note in notes:
-                pdf.setFont("Helvetica-Bold", 16)
-                pdf.drawString(50, y, note.title)
-                y -= 30
+        response = StreamingHttpResponse(
+            compile_pdf(notes.iterator(chunk_size=PDF_BATCH_SIZE)),
+            content_type="application/pdf",
+        )
+        response["Content-Disposition"] = 'attachment; filename="compiled_notes.pdf"'
+        return response
 
-                pdf.setFont("Helvetica", 10)
-                pdf.drawString(50, y, f"Subject: {note.topic.subject.name}")
-                y -= 20
+    elif request.GET.get("job"):
+        job = _get_compile_job(request, request.GET["job"])
 
-                pdf.drawString(50, y, f"Topic: {note.topic.name}")
-                y -= 40
+    subjects = Subject.objects.filter(owner=request.user).prefetch_related(
+        "topics",
+        Prefetch("topics__notes", queryset=Note.objects.only("pk", "title", "created_at", "topic_id")),
+    )
+    return render(request, "notes/pdf_compile.html", {
+        "subjects": subjects,
+        "job": job,
+        "job_payload": _compile_job_payload(job) if job else None,
+    })
 
-                if y < 100:
-                    pdf.showPage()
-                    y = 750
 
-            pdf.save()
-            buffer.seek(0)
+@login_required
+@require_GET
+def pdf_compile_status(request, job_id):
+    job = _get_compile_job(request, job_id)
+    if job is None:
+        return JsonResponse({"error": "Job not found."}, status=404)
 
-            response = HttpResponse(buffer, content_type="application/pdf")
-            response["Content-Disposition"] = 'attachment; filename=\"compiled_notes.pdf\"'
-            return response
+    return JsonResponse(_compile_job_payload(job))
 
-        except Exception as e:
-            messages.error(request, f"PDF error: {str(e)}")
 
-    subjects = Subject.objects.filter(owner=request.user)
-    return render(request, "notes/pdf_compile.html", {"subjects": subjects})
+@login_required
+@require_GET
+def pdf_compile_download(request, job_id):
+    job = _get_compile_job(request, job_id)
+    if job is None or job.status != CompileJob.STATUS_DONE or not job.artifact:
+        raise Http404("Compiled PDF not found")
+
+    return ranged_file_response(
+        request, job.artifact, "compiled_notes.pdf", "application/pdf", etag=job.fingerprint,
+    )
 
 @login_required
 def note_mark_read(request, pk):
     note = get_object_or_404(Note, pk=pk, owner=request.user)
     note.is_read = True
-    note.save()
+    note.save(update_fields=["is_read", "updated_at"])
     return redirect("note_list")
 # ============================================================
 # AI SUMMARIZER PAGE
@@ -498,33 +773,75 @@ def note_mark_read(request, pk):
 @login_required
 def summarizer(request):
     summary_output = None
+    job = None
 
     if request.method == "POST":
-        user_text = request.POST.get("user_text", "")
-        uploaded_file = request.FILES.get("pdf_file")
-
-        extracted_text = ""
-
-        if uploaded_file:
-            try:
-                reader = PyPDF2.PdfReader(uploaded_file)
-                for page in reader.pages:
-                    extracted_text += (page.extract_text() or "") + "\n"
-            except Exception:
-                extracted_text = ""
-
-        final_text = user_text.strip() if user_text.strip() else extracted_text.strip()
+        try:
+            text, note = _summary_input(request)
+        except PdfExtractionError as e:
+            text, note = "", None
+            messages.error(request, str(e))
 
-        if not final_text:
+        if note is None and not text:
             summary_output = "No text found to summarize."
         else:
-            summary_output = generate_summary(final_text)
+            job = submit_summary_job(request.user, text=text, note=note)
+            return redirect(f"{reverse('summarizer')}?job={job.pk}")
+
+    elif request.GET.get("job"):
+        job = _get_job(request, request.GET["job"])
+
+    if job and job.status == SummaryJob.STATUS_DONE:
+        summary_output = job.result_text
+    elif job and job.status == SummaryJob.STATUS_FAILED:
+        summary_output = job.error
 
     return render(request, "notes/summarizer.html", {
-        "summary_output": summary_output
+        "summary_output": summary_output,
+        "job": job,
     })
 
 
+@login_required
+@require_POST
+def summary_submit(request):
+    try:
+        text, note = _summary_input(request)
+    except PdfExtractionError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    if note is None and not text:
+        return JsonResponse({"error": "No text found to summarize."}, status=400)
+
+    job = submit_summary_job(request.user, text=text, note=note)
+    return JsonResponse(_job_payload(job), status=202)
+
+
+@login_required
+@require_GET
+def summary_status(request, job_id):
+    job = _get_job(request, job_id)
+    if job is None:
+        return JsonResponse({"error": "Job not found."}, status=404)
+
+    return JsonResponse(_job_payload(job))
+
+
+@login_required
+def note_summary(request, pk):
+    note = get_object_or_404(Note.objects.select_related("topic__subject", "owner"), pk=pk)
+    if not get_resolver(request).can_view_note(note):
+        raise Http404("No Note matches the given query.")
+
+    summary = Summary.objects.filter(note=note).first()
+
+    if summary is None:
+        messages.info(request, "No summary yet. Use Summarize to create one.")
+        return redirect("note_view", pk=pk)
+
+    return render(request, "notes/summary_view.html", {"note": note, "summary": summary})
+
+
 @login_required
 def note_edit(request, pk):
     note = get_object_or_404(Note, pk=pk, owner=request.user)
@@ -547,16 +864,9 @@ def note_edit(request, pk):
 def note_complete(request, pk):
     note = get_object_or_404(Note, pk=pk, topic__subject__owner=request.user)
     note.is_completed = True
-    note.save()
 
-    # Update subject progress automatically
-    subject = note.topic.subject
-    total_notes = Note.objects.filter(topic__subject=subject).count()
-    completed = Note.objects.filter(topic__subject=subject, is_completed=True).count()
-
-    if total_notes > 0:
-        subject.progress = int((completed / total_notes) * 100)
-        subject.save()
+    # Subject/topic progress counters are bumped by notes.signals
+    note.save(update_fields=["is_completed", "updated_at"])
 
     messages.success(request, "Note marked as completed!")
     return redirect("note_view", pk=note.pk)
@@ -564,11 +874,104 @@ def note_complete(request, pk):
 # PROGRESS API (for charts)
 # ============================================================
 @login_required
+@require_GET
 def progress_api(request):
+    """
+    Progress time series for Chart.js from the daily rollups.
+
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD (default: the last 30 days),
+    ?granularity=day|week|month, ?subject=<id>. Supports If-None-Match and
+    If-Modified-Since, so polling an unchanged series costs one query.
+    """
     user = request.user
-    subjects = Subject.objects.filter(owner=user)
+    today = timezone.localdate()
+
+    try:
+        end = date.fromisoformat(request.GET["end"]) if request.GET.get("end") else today
+        start = (
+            date.fromisoformat(request.GET["start"]) if request.GET.get("start")
+            else end - timedelta(days=29)
+        )
+        subject_id = int(request.GET["subject"]) if request.GET.get("subject") else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid start, end or subject."}, status=400)
+
+    granularity = request.GET.get("granularity", "day")
+    if start > end or granularity not in GRANULARITIES:
+        return JsonResponse({"error": "Invalid range or granularity."}, status=400)
+
+    modified = progress_last_modified(user)
+    etag = hashlib.md5(
+        f"{user.pk}:{start}:{end}:{granularity}:{subject_id}:{modified}".encode()
+    ).hexdigest()
+    last_modified = int(modified.timestamp()) if modified else None
+
+    response = get_conditional_response(request, etag=f'"{etag}"', last_modified=last_modified)
+    if response is None:
+        try:
+            series = progress_series(user, start, end, granularity, subject_id)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        response = JsonResponse({
+            "granularity": granularity,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            **series,
+            # Chart.js default dataset
+            "data": series["completed_total"],
+        })
+
+    response["ETag"] = f'"{etag}"'
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified)
+    response["Cache-Control"] = "private, no-cache"
+    return response
 
-    return JsonResponse({
-        "labels": [s.name for s in subjects[:5]],
-        "data": [50 + i * 10 for i in range(len(subjects[:5]))],
-    })
+
+# ============================================================
+# CORPUS IMPORT / EXPORT (NDJSON)
+# ============================================================
+@login_required
+@require_GET
+def corpus_export(request):
+    """Stream every subject the user owns, with topics, notes and bookmarks."""
+    response = StreamingHttpResponse(
+        (line.encode() for line in export_corpus(request.user)),
+        content_type="application/x-ndjson",
+    )
+    response["Content-Disposition"] = 'attachment; filename="noteeve-corpus.ndjson"'
+    return response
+
+
+@login_required
+@require_POST
+def corpus_import(request):
+    """
+    Import an NDJSON corpus sent as the raw request body. The body is read
+    line by line, never loaded whole; a malformed line rolls everything back.
+    """
+    try:
+        counts = import_corpus(request.user, request)
+    except CorpusError as e:
+        return JsonResponse({"error": str(e), "line": e.line}, status=400)
+    return JsonResponse(counts, status=201)
+
+
+# ============================================================
+# INTERNAL METRICS
+# ============================================================
+@require_GET
+def internal_metrics(request):
+    """Per-view request metrics, for staff users or the configured bearer token."""
+    token = settings.REQUEST_METRICS["TOKEN"]
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if not authorized and token:
+        authorized = hmac.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {token}",
+        )
+    if not authorized:
+        return JsonResponse({"error": "Forbidden"}, status=403)
+
+    if request.GET.get("reset") == "1":
+        metrics.reset()
+    return JsonResponse(metrics.snapshot())
@@ -1,3 +1,4 @@
+import argparse
 import os
 import django
 import random
@@ -129,5 +130,42 @@ def run():
     print("\n✨ Seeding complete! Your dashboard will look great now!")
 
 
+def run_scaled(args):
+    from notes.loadgen import PASSWORD, Scale, generate
+
+    scale = Scale(
+        users=args.users,
+        subjects=args.subjects,
+        topics=args.topics,
+        notes=args.notes,
+        collaborators=args.collaborators,
+        content_size=args.content_size,
+    )
+    print(f"🚀 Generating load data: {scale}")
+    users = generate(scale, prefix=args.prefix, seed=args.seed, stdout=_Printer())
+    print(f"\n✨ Done! Log in as {users[0].username} / {PASSWORD}")
+
+
+class _Printer:
+    def write(self, message):
+        print("  " + message)
+
+
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(
+        description="Seed the demo user, or with --users, generate load-test data in bulk."
+    )
+    parser.add_argument("--users", type=int, help="Number of users to generate.")
+    parser.add_argument("--subjects", type=int, default=5, help="Subjects per user.")
+    parser.add_argument("--topics", type=int, default=4, help="Topics per subject.")
+    parser.add_argument("--notes", type=int, default=20, help="Notes per topic.")
+    parser.add_argument("--collaborators", type=int, default=2, help="Shares per subject.")
+    parser.add_argument("--content-size", type=int, default=2000, help="Median note size (chars).")
+    parser.add_argument("--prefix", default="load", help="Username prefix.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.users:
+        run_scaled(args)
+    else:
+        run()